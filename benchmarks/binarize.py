@@ -0,0 +1,99 @@
+"""
+Compare the vectorized hysteresis of `Binarize` with the frame by frame loop it replaced,
+on synthetic VAD scores at pyannote's frame rate.
+
+    python benchmarks/binarize.py --hours 1 4
+"""
+import argparse
+import time
+
+import numpy as np
+from pyannote.core import Annotation, Segment, SlidingWindow, SlidingWindowFeature
+
+from whisperx.vads.pyannote import Binarize
+
+
+def legacy_binarize(scores: SlidingWindowFeature, onset: float, offset: float, max_duration: float) -> Annotation:
+    # the loop `Binarize.__call__` used before, without padding and min durations
+    num_frames, num_classes = scores.data.shape
+    frames = scores.sliding_window
+    timestamps = [frames[i].middle for i in range(num_frames)]
+
+    active = Annotation()
+    for k, k_scores in enumerate(scores.data.T):
+        label = k if scores.labels is None else scores.labels[k]
+        start = timestamps[0]
+        is_active = k_scores[0] > onset
+        curr_scores = [k_scores[0]]
+        curr_timestamps = [start]
+        t = start
+        for t, y in zip(timestamps[1:], k_scores[1:]):
+            if is_active:
+                curr_duration = t - start
+                if curr_duration > max_duration:
+                    search_after = len(curr_scores) // 2
+                    min_score_div_idx = search_after + np.argmin(curr_scores[search_after:])
+                    min_score_t = curr_timestamps[min_score_div_idx]
+                    active[Segment(start, min_score_t), k] = label
+                    start = curr_timestamps[min_score_div_idx]
+                    curr_scores = curr_scores[min_score_div_idx + 1:]
+                    curr_timestamps = curr_timestamps[min_score_div_idx + 1:]
+                elif y < offset:
+                    active[Segment(start, t), k] = label
+                    start = t
+                    is_active = False
+                    curr_scores = []
+                    curr_timestamps = []
+                curr_scores.append(y)
+                curr_timestamps.append(t)
+            else:
+                if y > onset:
+                    start = t
+                    is_active = True
+        if is_active:
+            active[Segment(start, t), k] = label
+    return active
+
+
+def synthetic_scores(hours: float, seed: int = 0) -> SlidingWindowFeature:
+    # speech/non-speech runs of random lengths with noisy scores, ~17ms frames as pyannote/segmentation
+    rng = np.random.default_rng(seed)
+    frames = SlidingWindow(start=0.0, duration=0.0619375, step=0.016875)
+    num_frames = int(hours * 3600 / frames.step)
+    runs = rng.exponential(300, size=num_frames // 50 + 1).astype(int) + 1
+    levels = np.resize([0.9, 0.1], len(runs))
+    scores = np.repeat(levels, runs)[:num_frames]
+    scores = np.clip(scores + rng.normal(0, 0.25, size=num_frames), 0, 1)
+    return SlidingWindowFeature(scores[:, None].astype(np.float32), frames)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, nargs="+", default=[0.5, 2.0])
+    parser.add_argument("--onset", type=float, default=0.5)
+    parser.add_argument("--offset", type=float, default=0.363)
+    parser.add_argument("--max_duration", type=float, default=30.0)
+    args = parser.parse_args()
+
+    binarize = Binarize(onset=args.onset, offset=args.offset, max_duration=args.max_duration)
+    for hours in args.hours:
+        scores = synthetic_scores(hours)
+
+        tic = time.perf_counter()
+        reference = legacy_binarize(scores, args.onset, args.offset, args.max_duration).get_timeline()
+        legacy_time = time.perf_counter() - tic
+
+        tic = time.perf_counter()
+        starts, ends = binarize.segments(scores)
+        vectorized_time = time.perf_counter() - tic
+
+        assert [(s.start, s.end) for s in reference] == list(zip(starts.tolist(), ends.tolist()))
+        assert binarize(scores).get_timeline() == reference
+        print(
+            f"{hours:g}h ({len(scores)} frames, {len(starts)} segments): "
+            f"legacy {legacy_time:.3f}s, vectorized {vectorized_time:.3f}s, x{legacy_time / vectorized_time:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
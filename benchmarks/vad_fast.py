@@ -0,0 +1,69 @@
+"""
+Compare the fast mode of the Pyannote VAD (coarse chunks refined around boundaries) with the
+default mode, on the time spent and on the boundaries of the resulting segments.
+
+    python benchmarks/vad_fast.py audio.wav --coarse_step 5 10 --refine_radius 0.5
+"""
+import argparse
+import time
+
+import numpy as np
+
+from whisperx.audio import SAMPLE_RATE, load_audio
+from whisperx.vads.pyannote import Binarize, Pyannote
+
+
+def boundaries(vad: Pyannote, waveform, args) -> np.ndarray:
+    scores = vad({"waveform": Pyannote.preprocess_audio(waveform), "sample_rate": SAMPLE_RATE})
+    binarize = Binarize(onset=args.onset, offset=args.offset, max_duration=args.chunk_size)
+    starts, ends = binarize.segments(scores)
+    return np.sort(np.concatenate([starts, ends]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio", type=str)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--onset", type=float, default=0.5)
+    parser.add_argument("--offset", type=float, default=0.363)
+    parser.add_argument("--chunk_size", type=float, default=30.0)
+    parser.add_argument("--coarse_step", type=float, nargs="+", default=[5.0, 10.0])
+    parser.add_argument("--refine_radius", type=float, default=0.5)
+    args = parser.parse_args()
+
+    waveform = load_audio(args.audio)
+    vad = Pyannote(args.device, vad_onset=args.onset, vad_offset=args.offset,
+                   vad_refine_radius=args.refine_radius)
+
+    tic = time.perf_counter()
+    reference = boundaries(vad, waveform, args)
+    default_time = time.perf_counter() - tic
+    print(f"default: {default_time:.2f}s, {len(reference) // 2} segments")
+
+    vad.vad_fast = True
+    for coarse_step in args.coarse_step:
+        vad.vad_coarse_step = coarse_step
+        tic = time.perf_counter()
+        fast = boundaries(vad, waveform, args)
+        fast_time = time.perf_counter() - tic
+
+        # distance of each boundary of the default mode to the closest one of the fast mode
+        if len(fast) and len(reference):
+            if len(fast) < 2:
+                # a single boundary is the closest one to all of them
+                deviation = np.abs(reference - fast[0])
+            else:
+                idx = np.clip(np.searchsorted(fast, reference), 1, len(fast) - 1)
+                deviation = np.minimum(np.abs(reference - fast[idx - 1]), np.abs(reference - fast[idx]))
+            deviation = np.percentile(deviation, [50, 95, 100])
+        else:
+            deviation = [np.nan] * 3
+        print(
+            f"fast (coarse step {coarse_step:g}s): {fast_time:.2f}s, x{default_time / fast_time:.1f}, "
+            f"{len(fast) // 2} segments, boundary deviation median {deviation[0]:.3f}s, "
+            f"p95 {deviation[1]:.3f}s, max {deviation[2]:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
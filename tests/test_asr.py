@@ -0,0 +1,199 @@
+import types
+
+import numpy as np
+import pytest
+import torch
+
+import whisperx.asr as asr
+from whisperx.asr import NUMERAL_SYMBOL_CLASSES, TokenClassIndex
+from whisperx.cache import TokenClassCache, VadScoreCache
+from whisperx.vads import SegmentationVad
+
+# text tokens of a small vocabulary, followed by end-of-text
+VOCABULARY = ["a", " 1", "%", " the", "$5", "!", "b", "<|endoftext|>", "<|en|>"]
+EOT = VOCABULARY.index("<|endoftext|>")
+NUMERAL_SYMBOL_TOKENS = [1, 2, 4]
+
+
+class FasterWhisperTokenizer:
+    """The API of faster_whisper.tokenizer.Tokenizer used by `TokenClassIndex`."""
+
+    eot = EOT
+
+    def __init__(self):
+        self.tokenizer = types.SimpleNamespace(
+            decode_batch=lambda batch: ["".join(VOCABULARY[i] for i in ids) for ids in batch],
+            to_str=lambda: "|".join(VOCABULARY),
+        )
+
+
+class OpenAIWhisperTokenizer:
+    """The API of whisper.tokenizer.Tokenizer used by `TokenClassIndex`."""
+
+    eot = EOT
+
+    def __init__(self):
+        self.encoding = types.SimpleNamespace(
+            name="multilingual",
+            decode_batch=lambda batch: ["".join(VOCABULARY[i] for i in ids) for ids in batch],
+        )
+
+
+class HuggingFaceTokenizer:
+    """The API of transformers' PreTrainedTokenizer used by `TokenClassIndex`."""
+
+    def convert_tokens_to_ids(self, token):
+        return VOCABULARY.index(token)
+
+    def batch_decode(self, batch):
+        return ["".join(VOCABULARY[i] for i in ids) for ids in batch]
+
+    def get_vocab(self):
+        return {token: i for i, token in enumerate(VOCABULARY)}
+
+
+@pytest.mark.parametrize("tokenizer", [FasterWhisperTokenizer(), OpenAIWhisperTokenizer(), HuggingFaceTokenizer()])
+def test_token_class_index_reads_every_tokenizer(tokenizer, tmp_path):
+    cache = TokenClassCache(str(tmp_path))
+    for _ in range(2):
+        index = TokenClassIndex.load(tokenizer, cache)
+        assert index.tokens(*NUMERAL_SYMBOL_CLASSES) == NUMERAL_SYMBOL_TOKENS
+        assert index.tokens("punctuation") == [2, 5]
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+@pytest.mark.parametrize("tokenizer", [FasterWhisperTokenizer(), HuggingFaceTokenizer()])
+def test_decode_whisper_suppresses_numerals(tokenizer, tmp_path, monkeypatch):
+    fake_whisper = types.SimpleNamespace(dims=types.SimpleNamespace(n_mels=80), device=torch.device("cpu"))
+    monkeypatch.setattr(asr.whisper, "load_model", lambda *args, **kwargs: fake_whisper)
+    monkeypatch.setattr(asr, "AutoTokenizer", types.SimpleNamespace(from_pretrained=lambda name: tokenizer))
+    decodings = []
+    monkeypatch.setattr(asr.whisper, "decode", lambda model, features, options: decodings.append(options) or [])
+    model = asr.load_model(f"numerals-{type(tokenizer).__name__}", device="cpu", compute_type="float32",
+                           vad_method="energy", asr_options={"suppress_numerals": True})
+    model.token_class_cache = TokenClassCache(str(tmp_path))
+
+    model.options = model.numeral_options(model.options)
+    model.decode_whisper(torch.zeros(1, 80, 3000), torch.zeros(1, 1500, 384), [3000], "en")
+
+    assert decodings[0].suppress_tokens == [-1, *NUMERAL_SYMBOL_TOKENS]
+
+
+class EchoModel(asr.HuggingfaceWhisperModel):
+    """An ASR backend transcribing every chunk as "hello", without loading a model."""
+
+    def __init__(self):
+        self.device = "cpu"
+
+    def transcribe(self, inputs):
+        return ["hello"] * len(inputs)
+
+
+def load_echo_model(monkeypatch, name, **kwargs):
+    monkeypatch.setattr(asr.whisper, "load_model", lambda *args, **kwargs: EchoModel())
+    monkeypatch.setattr(asr, "AutoTokenizer", types.SimpleNamespace(from_pretrained=lambda name: None))
+    return asr.load_model(name, device="cpu", compute_type="float32", **kwargs)
+
+
+def test_streamed_blocks_keep_speech_across_boundaries(monkeypatch):
+    model = load_echo_model(monkeypatch, "echo-stream", vad_method="energy")
+    # tones in silence, the second one crossing the boundary of the 10s blocks
+    t = np.arange(30 * 16000) / 16000
+    speech = ((t > 2) & (t < 5)) | ((t > 8.5) & (t < 12)) | ((t > 22) & (t < 25))
+    audio = np.where(speech, 0.25 * np.sin(2 * np.pi * 220 * t), 0).astype(np.float32)
+    blocks = [(offset, audio[offset:offset + 10 * 16000]) for offset in range(0, len(audio), 10 * 16000)]
+
+    whole = model.transcribe_result(audio, language="en", chunk_size=5, print_progress=False)
+    streamed = model.transcribe_result(iter(blocks), language="en", chunk_size=5, print_progress=False)
+
+    assert len(streamed["segments"]) == len(whole["segments"]) == 3
+    for segment, expected in zip(streamed["segments"], whole["segments"]):
+        assert segment["start"] == pytest.approx(expected["start"], abs=0.05)
+        assert segment["end"] == pytest.approx(expected["end"], abs=0.05)
+
+
+def test_segmentation_vad_runs_in_a_single_pass(monkeypatch):
+    # its kept segmentations are keyed by the whole audio, pieces scored by a cascade or shards would never match
+    segmentation_vad = SegmentationVad.__new__(SegmentationVad)
+    model = load_echo_model(monkeypatch, "echo-segmentation", vad_model=segmentation_vad,
+                            vad_options={"vad_cascade": True, "vad_workers": 2})
+    assert model.vad_model is segmentation_vad
+
+
+def tiny_whisper():
+    # a randomly initialized openai-whisper model, small enough to run on the CPU
+    torch.manual_seed(0)
+    dims = asr.whisper.model.ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2,
+                                             n_audio_layer=1, n_vocab=51865, n_text_ctx=16, n_text_state=64,
+                                             n_text_head=2, n_text_layer=1)
+    return asr.whisper.model.Whisper(dims).eval()
+
+
+def tones(*spans, seconds=20):
+    t = np.arange(seconds * 16000) / 16000
+    speech = np.any([(t > start) & (t < end) for start, end in spans], axis=0)
+    return np.where(speech, 0.25 * np.sin(2 * np.pi * 220 * t), 0).astype(np.float32)
+
+
+def test_encode_batch_stacks_kept_outputs_with_new_ones(monkeypatch):
+    whisper_model = tiny_whisper()
+    model = load_echo_model(monkeypatch, "encode-batch", vad_method="energy")
+    model.model = whisper_model
+    features = torch.randn(3, 80, 3000)
+    full = model.encode_batch({'inputs': features})
+
+    # outputs kept in another precision, as from a half precision encoder
+    kept = [full[0].double(), None, full[2].double()]
+    mixed = model.encode_batch({'inputs': features, 'encoded': kept})
+
+    assert mixed.dtype == full.dtype and mixed.device == full.device
+    torch.testing.assert_close(mixed, full)
+
+
+def test_detected_file_languages_reuse_their_encoder_output(monkeypatch):
+    whisper_model = tiny_whisper()
+    monkeypatch.setattr(asr.whisper, "load_model", lambda *args, **kwargs: whisper_model)
+    monkeypatch.setattr(asr, "AutoTokenizer", types.SimpleNamespace(from_pretrained=lambda name: None))
+    model = asr.load_model("tiny-detect", device="cpu", compute_type="float32", vad_method="energy",
+                           asr_options={"beam_size": 1})
+    reference = asr.load_model("tiny-reference", device="cpu", compute_type="float32", vad_method="energy",
+                               asr_options={"beam_size": 1})
+    decode = asr.whisper.decode
+    decoded = []
+    monkeypatch.setattr(asr.whisper, "decode", lambda model, features, options: decoded.append(features) or decode(model, features, options))
+    # two chunks each, the first one's encoder output is kept and batched with the second one
+    audios = [tones((2, 4), (12, 14)), tones((1, 3), (8, 10))]
+
+    languages = model.detect_file_languages(audios, batch_size=2, chunk_size=5)
+    assert len(model.encoder_cache) == 2
+    for audio, language in zip(audios, languages):
+        result = model.transcribe_result(audio, language=language, chunk_size=5, batch_size=2, print_progress=False)
+        expected = reference.transcribe_result(audio, language=language, chunk_size=5, batch_size=2, print_progress=False)
+        assert result["language"] == language
+        assert result["segments"] == expected["segments"]
+        # the batch is decoded from the same encoder output
+        torch.testing.assert_close(decoded[-2], decoded[-1])
+    assert model.encoder_cache == {}
+
+
+def test_cached_vad_scores_give_the_same_chunks(tmp_path, monkeypatch):
+    model = load_echo_model(monkeypatch, "echo-vad-cache", vad_method="energy", vad_score_cache=VadScoreCache(str(tmp_path)))
+    audio = tones((2, 4), (8, 12))
+    first = model.transcribe_result(audio, language="en", chunk_size=5, print_progress=False)
+    second = model.transcribe_result(audio, language="en", chunk_size=5, print_progress=False)
+    assert second == first and len(first["segments"]) == 2
+    assert [path.suffix for path in tmp_path.iterdir()] == [".npz"]
+
+
+def test_whisper_models_are_shared_per_device_and_download_root(monkeypatch):
+    loads = []
+    monkeypatch.setattr(asr.whisper, "load_model", lambda name, device, download_root: loads.append((device, download_root)) or EchoModel())
+    monkeypatch.setattr(asr, "AutoTokenizer", types.SimpleNamespace(from_pretrained=lambda name: None))
+
+    def load(**kwargs):
+        return asr.load_model("echo-registry", device="cuda", compute_type="float16", vad_method="energy", **kwargs)
+
+    models = [load(), load(), load(device_index=1), load(download_root="/models")]
+    assert models[0].model is models[1].model
+    assert len({id(model.model) for model in models}) == 3
+    assert loads == [("cuda:0", None), ("cuda:1", None), ("cuda:0", "/models")]
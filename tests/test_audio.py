@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+import torch
+
+from whisperx.audio import N_SAMPLES, MelFrontend, log_mel_spectrogram, pad_or_trim
+
+
+@pytest.mark.parametrize("n_mels", [80, 128])
+def test_mel_frontend_matches_padded_log_mel_spectrogram(n_mels):
+    rng = np.random.default_rng(0)
+    # shorter than, as long as and longer than the 30s window
+    audios = [(0.1 * rng.standard_normal(length)).astype(np.float32) for length in (16000 * 7 + 123, N_SAMPLES, N_SAMPLES + 5000)]
+    batch = MelFrontend(n_mels)(audios)
+    assert batch.shape == (len(audios), n_mels, 3000)
+    for audio, mel in zip(audios, batch):
+        reference = log_mel_spectrogram(pad_or_trim(audio), n_mels)
+        torch.testing.assert_close(mel, reference, atol=1e-4, rtol=1e-4)
+
+
+def test_mel_frontend_accepts_tensors():
+    audio = 0.1 * torch.randn(16000 * 3)
+    np.testing.assert_allclose(MelFrontend()([audio]).numpy(), MelFrontend()([audio.numpy()]).numpy())
@@ -0,0 +1,56 @@
+import pickle
+import wave
+
+import numpy as np
+import torch
+
+from whisperx.audio import PCMAudio, decode_pcm_memmap
+from whisperx.batching import ChunkDataset, MelCollate, in_order, length_sorted_batches, trim_chunk
+
+
+def test_length_sorted_batches_group_similar_lengths():
+    durations = [5, 30, 6, 29, 4, 28]
+    batches = length_sorted_batches(durations, batch_size=2)
+    assert batches == [[1, 3], [5, 2], [0, 4]]
+    assert length_sorted_batches(durations, batch_size=4, sort=False) == [[0, 1, 2, 3], [4, 5]]
+
+
+def test_length_sorted_batches_cap_seconds_and_window():
+    durations = [10, 20, 30, 10, 20, 30]
+    assert length_sorted_batches(durations, max_batch_seconds=40) == [[2], [5], [1, 4], [0, 3]]
+    # chunks are only sorted within windows of 3
+    assert length_sorted_batches(durations, batch_size=2, window=3) == [[2, 1], [0], [5, 4], [3]]
+
+
+def test_in_order_yields_each_result_once_its_predecessors_are():
+    results = [(2, "c"), (0, "a"), (3, "d"), (1, "b"), (5, "f")]
+    assert list(in_order(results)) == [(0, "a"), (1, "b"), (2, "c"), (3, "d"), (5, "f")]
+
+
+def test_chunk_dataset_pickles_memory_maps_by_reference(tmp_path):
+    samples = (np.random.default_rng(0).standard_normal((40000, 2)) * 1000).astype(np.int16)
+    with wave.open(str(tmp_path / "in.wav"), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(samples.tobytes())
+    channels = [PCMAudio(channel) for channel in decode_pcm_memmap(str(tmp_path / "in.wav"), 16000, mono=False)]
+    dataset = ChunkDataset(channels, [(0, 100, 20000), (1, 5000, 40000)], trim_chunk, shared=True)
+
+    blob = pickle.dumps(dataset)
+    # the samples are mapped again, not pickled
+    assert len(blob) < 1000
+    copy = pickle.loads(blob)
+    for i in range(len(dataset)):
+        torch.testing.assert_close(copy[i]['inputs'], dataset[i]['inputs'])
+    torch.testing.assert_close(dataset[1]['inputs'], torch.from_numpy(samples[5000:, 1] / 32768.0).float())
+
+
+def test_mel_collate_pickles_its_configuration():
+    collate = MelCollate(128)
+    items = [{'inputs': torch.zeros(16000)}, {'inputs': torch.zeros(32000)}]
+    batch = collate(items)
+    assert batch['inputs'].shape == (2, 128, 3000) and batch['num_frames'] == [100, 200]
+    copy = pickle.loads(pickle.dumps(collate))
+    assert copy.n_mels == 128
+    torch.testing.assert_close(copy(items)['inputs'], batch['inputs'])
@@ -0,0 +1,148 @@
+import os
+import shutil
+import threading
+import wave
+
+import numpy as np
+import pytest
+
+from whisperx.audio import av
+from whisperx.cache import DecodedAudioCache, LRUDirectory, TokenClassCache, VadScoreCache, array_digest
+
+
+def write_wav(path, samples, sample_rate=16000):
+    samples = np.asarray(samples, dtype=np.int16)
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+def test_lru_directory_evicts_least_recently_used(tmp_path):
+    entries = LRUDirectory(str(tmp_path), max_bytes=250)
+    for i, name in enumerate(["a", "b"]):
+        with entries.create(name) as f:
+            f.write(b"x" * 100)
+        os.utime(entries.path(name), (i, i))
+    # "a" becomes the most recently used, "b" is evicted for "c"
+    assert entries.lookup("a") is not None
+    with entries.create("c") as f:
+        f.write(b"x" * 100)
+    assert entries.lookup("b") is None
+    assert entries.lookup("a") is not None and entries.lookup("c") is not None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_lru_directory_concurrent_writers_of_one_entry(tmp_path):
+    entries = LRUDirectory(str(tmp_path))
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def write(i):
+        try:
+            with entries.create("entry") as f:
+                # every writer has its temporary file open at the same time
+                barrier.wait()
+                f.write(bytes([i]) * 1000)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(entries.path("entry"), "rb") as f:
+        content = f.read()
+    # one complete write won
+    assert len(content) == 1000 and len(set(content)) == 1
+    assert os.listdir(tmp_path) == ["entry"]
+
+
+def test_array_digest_depends_on_content_and_layout():
+    samples = np.arange(1000, dtype=np.int16)
+    assert array_digest(samples) == array_digest(samples.copy())
+    assert array_digest(samples) != array_digest(samples[::-1])
+    assert array_digest(samples) != array_digest(samples.reshape(10, 100))
+
+
+def test_vad_score_cache_computes_once_per_audio_and_key(tmp_path):
+    cache = VadScoreCache(str(tmp_path))
+    samples = np.random.default_rng(0).standard_normal(16000).astype(np.float32)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"scores": np.ones(10)}
+
+    first = cache.load("model-a", samples, compute)
+    second = cache.load("model-a", samples, compute)
+    np.testing.assert_array_equal(first["scores"], second["scores"])
+    assert len(calls) == 1
+    cache.load("model-b", samples, compute)
+    cache.load("model-a", samples[1:], compute)
+    assert len(calls) == 3
+
+    # entries are never unpickled, one holding pickled objects is computed again
+    for name in os.listdir(tmp_path):
+        with open(tmp_path / name, "wb") as f:
+            np.savez(f, scores=np.array([object()], dtype=object))
+    np.testing.assert_array_equal(cache.load("model-a", samples, compute)["scores"], np.ones(10))
+    assert len(calls) == 4
+
+
+def test_token_class_cache_round_trip(tmp_path):
+    cache = TokenClassCache(str(tmp_path))
+    classes = {"numeral": np.array([1, 5, 9]), "currency": np.array([], dtype=np.int64)}
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return classes
+
+    cache.load("vocabulary", compute)
+    loaded = cache.load("vocabulary", compute)
+    assert len(calls) == 1
+    assert set(loaded) == set(classes)
+    for name, tokens in classes.items():
+        np.testing.assert_array_equal(loaded[name], tokens)
+
+    # an unreadable entry is computed again
+    for name in os.listdir(tmp_path):
+        with open(tmp_path / name, "wb") as f:
+            f.write(b"corrupt")
+    cache.load("vocabulary", compute)
+    assert len(calls) == 2
+
+
+def test_decoded_audio_cache_maps_target_wav_in_place(tmp_path):
+    samples = (np.random.default_rng(0).standard_normal(16000) * 1000).astype(np.int16)
+    write_wav(tmp_path / "in.wav", samples)
+    cache = DecodedAudioCache(str(tmp_path / "cache"))
+    audio = cache.load(str(tmp_path / "in.wav"))
+    assert isinstance(audio.samples, np.memmap)
+    np.testing.assert_array_equal(audio.samples, samples)
+    assert os.listdir(tmp_path / "cache") == []
+
+    stereo = np.stack([samples, -samples], axis=1)
+    write_wav(tmp_path / "stereo.wav", stereo)
+    channels = cache.load_channels(str(tmp_path / "stereo.wav"))
+    assert len(channels) == 2
+    np.testing.assert_array_equal(channels[1].samples, -samples)
+
+
+def test_decoded_audio_cache_decodes_other_inputs_once(tmp_path):
+    if av is None and shutil.which("ffmpeg") is None:
+        pytest.skip("needs PyAV or ffmpeg to resample")
+    t = np.arange(8000) / 8000
+    write_wav(tmp_path / "in.wav", 8000 * np.sin(2 * np.pi * 440 * t), sample_rate=8000)
+    cache = DecodedAudioCache(str(tmp_path / "cache"))
+    audio = cache.load(str(tmp_path / "in.wav"))
+    assert audio.sample_rate == 16000 and abs(len(audio) - 16000) <= 32
+    assert len(os.listdir(tmp_path / "cache")) == 1
+    again = cache.load(str(tmp_path / "in.wav"))
+    np.testing.assert_array_equal(again.samples, audio.samples)
+    assert len(os.listdir(tmp_path / "cache")) == 1
@@ -0,0 +1,64 @@
+import sys
+import wave
+
+import numpy as np
+
+import whisperx.asr as asr
+from whisperx.transcribe import cli
+
+
+class EchoModel(asr.HuggingfaceWhisperModel):
+    """An ASR backend transcribing every chunk as "hello", without loading a model."""
+
+    def __init__(self):
+        self.device = "cpu"
+
+    def transcribe(self, inputs):
+        return ["hello"] * len(inputs)
+
+
+class FakeAutoTokenizer:
+    @staticmethod
+    def from_pretrained(name):
+        return None
+
+
+def write_speech_wav(path, seconds=6, sample_rate=16000):
+    # a tone in the middle of silence, which the energy VAD takes as speech
+    t = np.arange(seconds * sample_rate) / sample_rate
+    samples = np.where((t > 2) & (t < 4), 8000 * np.sin(2 * np.pi * 220 * t), 0).astype(np.int16)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+def test_transcribe_result_returns_the_segments(monkeypatch):
+    monkeypatch.setattr(asr.whisper, "load_model", lambda *args, **kwargs: EchoModel())
+    monkeypatch.setattr(asr, "AutoTokenizer", FakeAutoTokenizer)
+    model = asr.load_model("echo-result", device="cpu", compute_type="float32", vad_method="energy")
+    audio = np.zeros(6 * 16000, dtype=np.float32)
+    audio[2 * 16000:4 * 16000] = 0.25 * np.sin(2 * np.pi * 220 * np.arange(2 * 16000) / 16000)
+
+    result = model.transcribe_result(audio, language="en", batch_size=2, print_progress=False)
+
+    assert [segment["text"] for segment in result["segments"]] == ["hello"]
+    assert result["language"] == "en"
+
+
+def test_cli_writes_transcripts(tmp_path, monkeypatch):
+    monkeypatch.setattr(asr.whisper, "load_model", lambda *args, **kwargs: EchoModel())
+    monkeypatch.setattr(asr, "AutoTokenizer", FakeAutoTokenizer)
+    audio_path = tmp_path / "call.wav"
+    write_speech_wav(audio_path)
+    output_dir = tmp_path / "out"
+    monkeypatch.setattr(sys, "argv", [
+        "whisperx", str(audio_path), "--model", "echo-cli", "--device", "cpu", "--compute_type", "float32",
+        "--vad_method", "energy", "--no_align", "--language", "en", "--output_dir", str(output_dir),
+        "--output_format", "txt", "--print_progress", "True",
+    ])
+
+    cli()
+
+    assert (output_dir / "call.txt").read_text().strip() == "hello"
@@ -0,0 +1,57 @@
+import gc
+
+import pytest
+
+from whisperx.registry import ModelLease, ModelRegistry
+
+
+def test_models_are_shared_and_released():
+    registry = ModelRegistry()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return object()
+
+    first = registry.acquire(("whisper", "small", "cpu", "int8"), loader)
+    second = registry.acquire(("whisper", "small", "cpu", "int8"), loader)
+    assert first is second and len(loads) == 1
+    assert registry.loaded() == [(("whisper", "small", "cpu", "int8"), 2)]
+
+    # another device or compute type is another model
+    other = registry.acquire(("whisper", "small", "cuda", "float16"), loader)
+    assert other is not first and len(loads) == 2
+
+    registry.release(("whisper", "small", "cpu", "int8"))
+    registry.release(("whisper", "small", "cpu", "int8"))
+    registry.release(("whisper", "small", "cuda", "float16"))
+    assert registry.loaded() == []
+    registry.acquire(("whisper", "small", "cpu", "int8"), loader)
+    assert len(loads) == 3
+
+
+def test_failed_load_is_not_kept():
+    registry = ModelRegistry()
+
+    def failing():
+        raise RuntimeError("no model")
+
+    with pytest.raises(RuntimeError):
+        registry.acquire("vad", failing)
+    assert registry.loaded() == []
+    assert registry.acquire("vad", lambda: "model") == "model"
+
+
+def test_lease_releases_on_close_and_collection():
+    registry = ModelRegistry()
+    lease = ModelLease(registry)
+    lease.acquire("a", lambda: "A")
+    lease.acquire("b", lambda: "B")
+    other = ModelLease(registry)
+    other.acquire("a", lambda: "A")
+
+    lease.close()
+    assert registry.loaded() == [("a", 1)]
+    del other
+    gc.collect()
+    assert registry.loaded() == []
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from pyannote.core import SlidingWindow, SlidingWindowFeature
+
+from whisperx.vads.energy import EnergyScores
+from whisperx.vads.scores import scores_from_arrays, scores_to_arrays
+from whisperx.vads.silero_onnx import SileroScores
+
+
+def round_trip(scores, tmp_path):
+    np.savez(tmp_path / "scores.npz", **scores_to_arrays(scores))
+    with np.load(tmp_path / "scores.npz") as entry:
+        return scores_from_arrays({key: entry[key] for key in entry.files})
+
+
+@pytest.mark.parametrize("labels", [None, ["speech"]])
+def test_sliding_window_feature_round_trip(labels, tmp_path):
+    frames = SlidingWindow(start=0.0084, duration=0.0169, step=0.0169)
+    scores = SlidingWindowFeature(np.random.default_rng(0).random((100, 1)), frames, labels=labels)
+    loaded = round_trip(scores, tmp_path)
+    np.testing.assert_array_equal(loaded.data, scores.data)
+    window = loaded.sliding_window
+    assert (window.start, window.duration, window.step) == (frames.start, frames.duration, frames.step)
+    assert loaded.labels == labels
+
+
+def test_silero_and_energy_scores_round_trip(tmp_path):
+    silero = SileroScores(np.random.default_rng(0).random(30).astype(np.float32), 30 * 512 - 100)
+    loaded = round_trip(silero, tmp_path)
+    np.testing.assert_array_equal(loaded.probs, silero.probs)
+    assert loaded.num_samples == silero.num_samples
+
+    energy = EnergyScores(np.random.default_rng(1).random(50), 0.0125, 0.01)
+    loaded = round_trip(energy, tmp_path)
+    np.testing.assert_array_equal(loaded.scores, energy.scores)
+    assert (loaded.start, loaded.step) == (energy.start, energy.step)
+
+
+def test_segments_are_not_stored():
+    with pytest.raises(TypeError):
+        scores_to_arrays([])
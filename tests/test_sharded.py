@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyannote.core")
+from pyannote.core import SlidingWindow, SlidingWindowFeature
+
+from whisperx.vads import sharded
+from whisperx.vads.sharded import ShardedVad, shard_bounds
+from whisperx.vads.vad import Vad
+
+SAMPLE_RATE = 16000
+# the chunks and frames of the Pyannote segmentation model
+CHUNK_SAMPLES, STEP_SAMPLES = 10 * SAMPLE_RATE, SAMPLE_RATE
+FRAME_STEP, FRAME_DURATION = 0.016875, 0.0619375
+
+
+class WindowedVad(Vad):
+    """Aggregates frame scores of overlapping chunks like `pyannote.audio.Inference`, each chunk
+    placed at `rint(chunk start / frame step)`, scores depending on the whole chunk."""
+
+    align_samples = int(np.lcm(STEP_SAMPLES, round(FRAME_STEP * SAMPLE_RATE)))
+    context = CHUNK_SAMPLES / SAMPLE_RATE
+
+    def __init__(self):
+        super().__init__(0.5)
+
+    def __call__(self, audio, **kwargs):
+        waveform = np.asarray(audio["waveform"], dtype=np.float64)
+        frame_step, frame_duration = round(FRAME_STEP * SAMPLE_RATE), round(FRAME_DURATION * SAMPLE_RATE)
+        num_frames = (CHUNK_SAMPLES - frame_duration) // frame_step + 1
+        num_chunks = max(len(waveform) - CHUNK_SAMPLES, 0) // STEP_SAMPLES + 1
+        first = [int(np.rint(c * STEP_SAMPLES / SAMPLE_RATE / FRAME_STEP)) for c in range(num_chunks)]
+        total = np.zeros(first[-1] + num_frames)
+        count = np.zeros(first[-1] + num_frames)
+        for c in range(num_chunks):
+            chunk = np.zeros(CHUNK_SAMPLES)
+            samples = waveform[c * STEP_SAMPLES:c * STEP_SAMPLES + CHUNK_SAMPLES]
+            chunk[:len(samples)] = samples
+            cumsum = np.concatenate(([0.0], np.cumsum(np.abs(chunk))))
+            lo = np.arange(num_frames) * frame_step
+            scores = (cumsum[lo + frame_duration] - cumsum[lo]) / frame_duration + 0.1 * np.abs(chunk).mean()
+            total[first[c]:first[c] + num_frames] += scores
+            count[first[c]:first[c] + num_frames] += 1
+        return SlidingWindowFeature((total / count)[:, None].astype(np.float32),
+                                    SlidingWindow(start=0.0, duration=FRAME_DURATION, step=FRAME_STEP))
+
+    @staticmethod
+    def preprocess_audio(audio):
+        return audio
+
+
+class InProcessPool:
+    def map(self, fn, *iterables):
+        return list(map(fn, *iterables))
+
+
+def test_shard_bounds_cover_audio():
+    shards = shard_bounds(10, 4, 1)
+    assert shards == [(0, 5, 0, 4), (3, 9, 4, 8), (7, 10, 8, 10)]
+
+
+def test_sharded_scores_match_single_pass(monkeypatch):
+    rng = np.random.default_rng(0)
+    # bursts of noise of random levels, so that every chunk scores differently
+    waveform = (rng.standard_normal(200 * SAMPLE_RATE) * np.repeat(rng.random(200 * 4), SAMPLE_RATE // 4)).astype(np.float32)
+    vad = WindowedVad()
+    monkeypatch.setattr(sharded, "_worker_vad", vad)
+    sharded_vad = ShardedVad(vad, WindowedVad, num_workers=2, shard_duration=60.0, overlap=5.0, vad_onset=0.5)
+    monkeypatch.setattr(sharded_vad, "_pool", InProcessPool)
+
+    single = vad({"waveform": waveform, "sample_rate": SAMPLE_RATE})
+    stitched = sharded_vad({"waveform": waveform, "sample_rate": SAMPLE_RATE})
+
+    # `stitch` pads the frames up to the end of the audio with silence
+    np.testing.assert_allclose(stitched.data[:len(single.data)], single.data, rtol=1e-6)
+    assert not stitched.data[len(single.data):].any()
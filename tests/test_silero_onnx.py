@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import torch
+
+from whisperx.vads.silero_onnx import CONTEXT_SIZE_SAMPLES, WINDOW_SIZE_SAMPLES, load_silero_onnx, speech_probs, speech_timestamps
+
+
+class FixedProbs:
+    """Stands for the Silero model in silero-vad's `get_speech_timestamps`, returning fixed window probabilities."""
+
+    def __init__(self, probs):
+        self.probs = probs
+        self.index = 0
+
+    def reset_states(self):
+        self.index = 0
+
+    def __call__(self, chunk, sampling_rate):
+        prob = self.probs[self.index]
+        self.index += 1
+        return torch.tensor(prob)
+
+
+def fixed_probs(seed, num_windows=3000):
+    # runs of speech and silence of random lengths and levels
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 120, num_windows)
+    levels = np.repeat(rng.random(len(lengths)), lengths)[:num_windows]
+    return np.clip(levels + rng.normal(0, 0.1, num_windows), 0, 1).astype(np.float32)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("options", [
+    {},
+    {"max_speech_duration_s": 5.0},
+    {"threshold": 0.6, "min_silence_duration_ms": 300, "speech_pad_ms": 100},
+])
+def test_speech_timestamps_match_silero_vad(seed, options):
+    silero_vad = pytest.importorskip("silero_vad")
+    probs = fixed_probs(seed)
+    num_samples = len(probs) * WINDOW_SIZE_SAMPLES - 100
+    reference = silero_vad.get_speech_timestamps(torch.zeros(num_samples), FixedProbs(probs.tolist()), **options)
+    timestamps = speech_timestamps(probs, num_samples, **options)
+    assert timestamps.tolist() == [[speech["start"], speech["end"]] for speech in reference]
+
+
+def test_speech_timestamps_no_speech():
+    assert speech_timestamps(np.zeros(100, dtype=np.float32), 100 * WINDOW_SIZE_SAMPLES).shape == (0, 2)
+
+
+def test_speech_probs_match_window_by_window():
+    encoder, decoder = load_silero_onnx(threads=1)
+    rng = np.random.default_rng(0)
+    t = np.arange(16000 * 6) / 16000
+    # a tone in noise, then noise alone
+    audio = (0.01 * rng.standard_normal(len(t)) + 0.3 * np.sin(2 * np.pi * 220 * t) * (t < 3)).astype(np.float32)
+    audio = audio[:-123]
+
+    # the model run on one window at a time, each preceded by the end of the previous one
+    reference = []
+    state = np.zeros((2, 1, 128), dtype=np.float32)
+    context = np.zeros((1, CONTEXT_SIZE_SAMPLES), dtype=np.float32)
+    for start in range(0, len(audio), WINDOW_SIZE_SAMPLES):
+        window = np.zeros((1, WINDOW_SIZE_SAMPLES), dtype=np.float32)
+        chunk = audio[start:start + WINDOW_SIZE_SAMPLES]
+        window[0, :len(chunk)] = chunk
+        features = encoder.run(None, {"input": np.concatenate([context, window], axis=1)})[0].reshape(1, 128)
+        out, state = decoder.run(None, {"input": features, "state": state})
+        reference.append(out[0, 0, 0])
+        context = window[:, -CONTEXT_SIZE_SAMPLES:]
+
+    probs = speech_probs(encoder, decoder, audio, encoder_batch_size=7)
+    np.testing.assert_allclose(probs, reference, atol=1e-5)
+    assert probs[:len(probs) // 3].mean() > probs[-len(probs) // 3:].mean()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from pyannote.core import SlidingWindow, SlidingWindowFeature
+
+from whisperx.diarize import Segment as SegmentX
+from whisperx.vads.energy import EnergyScores
+from whisperx.vads.silero_onnx import WINDOW_SIZE_SAMPLES, SileroScores
+from whisperx.vads.stitch import stitch
+
+
+def test_stitch_silero_scores_with_cores():
+    probs = np.arange(20, dtype=np.float32)
+    num_samples = 20 * WINDOW_SIZE_SAMPLES
+    # two overlapping pieces, each kept for its own half
+    pieces = [(0, SileroScores(probs[:12], 12 * WINDOW_SIZE_SAMPLES)),
+              (8 * WINDOW_SIZE_SAMPLES, SileroScores(probs[8:] + 100, 12 * WINDOW_SIZE_SAMPLES))]
+    cores = [(0, 10 * WINDOW_SIZE_SAMPLES), (10 * WINDOW_SIZE_SAMPLES, num_samples)]
+    stitched = stitch(pieces, num_samples, cores=cores)
+    assert stitched.num_samples == num_samples
+    np.testing.assert_array_equal(stitched.probs, np.concatenate((probs[:10], probs[10:] + 100)))
+
+
+def test_stitch_leaves_gaps_silent():
+    pieces = [(4 * WINDOW_SIZE_SAMPLES, SileroScores(np.ones(3, dtype=np.float32), 3 * WINDOW_SIZE_SAMPLES))]
+    stitched = stitch(pieces, 10 * WINDOW_SIZE_SAMPLES)
+    np.testing.assert_array_equal(stitched.probs, [0, 0, 0, 0, 1, 1, 1, 0, 0, 0])
+
+
+def test_stitch_sliding_window_feature():
+    frames = SlidingWindow(start=0.0, duration=0.025, step=0.01)
+    data = np.random.default_rng(0).random((300, 1)).astype(np.float32)
+    # pieces starting on frames of the whole audio
+    pieces = [(0, SlidingWindowFeature(data[:200], frames)), (100 * 160, SlidingWindowFeature(data[100:], frames))]
+    stitched = stitch(pieces, 300 * 160, cores=[(0, 150 * 160), (150 * 160, 300 * 160)])
+    assert stitched.sliding_window.step == frames.step
+    np.testing.assert_array_equal(stitched.data, data)
+
+
+def test_stitch_energy_scores():
+    scores = np.linspace(0, 1, 50, dtype=np.float32)
+    pieces = [(0, EnergyScores(scores[:30], 0.0125, 0.01)), (3200, EnergyScores(scores[20:], 0.0125, 0.01))]
+    stitched = stitch(pieces, 50 * 160, cores=[(0, 3200), (3200, 50 * 160)])
+    assert (stitched.start, stitched.step) == (0.0125, 0.01)
+    np.testing.assert_array_equal(stitched.scores, scores)
+
+
+def test_stitch_segments():
+    pieces = [(0, [SegmentX(1.0, 2.0, "A"), SegmentX(9.0, 12.0, "A")]),
+              (8 * 16000, [SegmentX(1.0, 3.0, "A"), SegmentX(5.0, 6.0, "A")])]
+    segments = stitch(pieces, 20 * 16000, cores=[(0, 10 * 16000), (10 * 16000, 20 * 16000)])
+    # the segment cut at the shared core boundary is joined again
+    assert [(seg.start, seg.end) for seg in segments] == [(1.0, 2.0), (9.0, 11.0), (13.0, 14.0)]
+
+
+def test_stitch_nothing_and_unknown():
+    assert stitch([], 100) is None
+    with pytest.raises(TypeError):
+        stitch([(0, object())], 100)
@@ -0,0 +1,103 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from whisperx.vads.vad import balanced_split_points, binarize_hysteresis
+
+
+def binarize_reference(scores, timestamps, onset, offset, max_duration=float("inf")):
+    # the frame by frame loop of `Binarize` that `binarize_hysteresis` replaces, without padding
+    starts, ends = [], []
+    start = timestamps[0]
+    is_active = scores[0] > onset
+    curr_scores, curr_timestamps = [scores[0]], [start]
+    t = start
+    for t, y in zip(timestamps[1:], scores[1:]):
+        if is_active:
+            if t - start > max_duration:
+                search_after = len(curr_scores) // 2
+                min_score_div_idx = search_after + np.argmin(curr_scores[search_after:])
+                starts.append(start)
+                ends.append(curr_timestamps[min_score_div_idx])
+                start = curr_timestamps[min_score_div_idx]
+                curr_scores = curr_scores[min_score_div_idx + 1:]
+                curr_timestamps = curr_timestamps[min_score_div_idx + 1:]
+            elif y < offset:
+                starts.append(start)
+                ends.append(t)
+                start = t
+                is_active = False
+                curr_scores, curr_timestamps = [], []
+            curr_scores.append(y)
+            curr_timestamps.append(t)
+        elif y > onset:
+            start = t
+            is_active = True
+    if is_active:
+        starts.append(start)
+        ends.append(t)
+    return starts, ends
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_duration", [float("inf"), 0.5, 2.0])
+def test_binarize_hysteresis_matches_frame_loop(seed, max_duration):
+    rng = np.random.default_rng(seed)
+    # smoothed noise, so that regions span several frames
+    scores = np.convolve(rng.random(2000), np.ones(15) / 15, mode="same")
+    timestamps = 0.01 + np.arange(len(scores)) * 0.017
+    starts, ends = binarize_hysteresis(scores, timestamps, 0.5, 0.45, max_duration=max_duration)
+    ref_starts, ref_ends = binarize_reference(scores, timestamps, 0.5, 0.45, max_duration=max_duration)
+    np.testing.assert_array_equal(starts, ref_starts)
+    np.testing.assert_array_equal(ends, ref_ends)
+
+
+def test_binarize_hysteresis_empty_and_constant():
+    starts, ends = binarize_hysteresis(np.zeros(0), np.zeros(0), 0.5, 0.5)
+    assert len(starts) == len(ends) == 0
+    timestamps = np.arange(10, dtype=np.float64)
+    starts, ends = binarize_hysteresis(np.ones(10), timestamps, 0.5, 0.5)
+    assert starts.tolist() == [0.0] and ends.tolist() == [9.0]
+
+
+def packing_cost(starts, ends, splits, chunk_size):
+    bounds = [0] + list(splits) + [len(starts)]
+    cost = 0.0
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        span = ends[hi - 1] - starts[lo]
+        if span > chunk_size and hi - lo > 1:
+            return None
+        cost += max(chunk_size - span, 0) ** 2
+    return len(bounds) - 1, cost
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_balanced_split_points_is_optimal(seed):
+    rng = np.random.default_rng(seed)
+    num_segments = 9
+    lengths = rng.uniform(0.5, 12, num_segments)
+    gaps = rng.uniform(0.1, 3, num_segments)
+    starts = np.cumsum(gaps + np.concatenate(([0], lengths[:-1])))
+    ends = starts + lengths
+    chunk_size = 30.0
+
+    splits = balanced_split_points(starts, ends, chunk_size)
+    count, cost = packing_cost(starts, ends, splits, chunk_size)
+
+    # every packing of the segments into consecutive chunks
+    packings = []
+    for r in range(num_segments):
+        for candidate in itertools.combinations(range(1, num_segments), r):
+            result = packing_cost(starts, ends, candidate, chunk_size)
+            if result is not None:
+                packings.append(result)
+    best_count = min(c for c, _ in packings)
+    assert count == best_count
+    assert cost == pytest.approx(min(c for n, c in packings if n == best_count))
+
+
+def test_balanced_split_points_long_segment():
+    # a segment longer than a chunk is a chunk of its own
+    assert balanced_split_points(np.array([0.0, 1.0, 50.0]), np.array([0.5, 45.0, 51.0]), 30.0) == [1, 2]
+    assert balanced_split_points(np.zeros(0), np.zeros(0), 30.0) == []
@@ -1,4 +1,4 @@
 from .alignment import load_align_model, align
-from .audio import load_audio
+from .audio import load_audio, iter_audio, PCMAudio, AudioReader
 from .diarize import assign_word_speakers, DiarizationPipeline
 from .asr import load_model
@@ -5,7 +5,7 @@ C. Max Bain
 import math
 
 from dataclasses import dataclass
-from typing import Iterable, Optional, Union, List
+from typing import Iterable, Optional, Union, List, Tuple
 
 import numpy as np
 import pandas as pd
@@ -13,7 +13,8 @@ import torch
 import torchaudio
 from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
 
-from .audio import SAMPLE_RATE, load_audio
+from .audio import SAMPLE_RATE, AudioReader, PCMAudio
+from .diarize import channel_speaker
 from .utils import interpolate_nans
 from .types import (
     AlignedTranscriptionResult,
@@ -113,7 +114,7 @@ def align(
     transcript: Iterable[SingleSegment],
     model: torch.nn.Module,
     align_model_metadata: dict,
-    audio: Union[str, np.ndarray, torch.Tensor],
+    audio: Union[str, np.ndarray, torch.Tensor, PCMAudio, AudioReader, Iterable[Tuple[int, np.ndarray]]],
     device: str,
     interpolate_method: str = "nearest",
     return_char_alignments: bool = False,
@@ -122,16 +123,33 @@ def align(
 ) -> AlignedTranscriptionResult:
     """
     Align phoneme recognition predictions to known transcription.
+    With an `AudioReader`, only the audio of the transcript segments is decoded.
     """
-    
-    if not torch.is_tensor(audio):
-        if isinstance(audio, str):
-            audio = load_audio(audio)
-        audio = torch.from_numpy(audio)
-    if len(audio.shape) == 1:
-        audio = audio.unsqueeze(0)
-    
-    MAX_DURATION = audio.shape[1] / SAMPLE_RATE
+
+    if not isinstance(audio, (str, np.ndarray, PCMAudio, AudioReader)) and not torch.is_tensor(audio):
+        return _align_blocks(
+            transcript,
+            model,
+            align_model_metadata,
+            audio,
+            device,
+            interpolate_method=interpolate_method,
+            return_char_alignments=return_char_alignments,
+            print_progress=print_progress,
+            combined_progress=combined_progress,
+        )
+
+    if isinstance(audio, str):
+        audio = PCMAudio.from_file(audio)
+    if isinstance(audio, (PCMAudio, AudioReader)):
+        # int16 or undecoded audio is read as float32 one segment window at a time
+        MAX_DURATION = audio.duration
+    else:
+        if not torch.is_tensor(audio):
+            audio = torch.from_numpy(audio)
+        if len(audio.shape) == 1:
+            audio = audio.unsqueeze(0)
+        MAX_DURATION = audio.shape[1] / SAMPLE_RATE
 
     model_dictionary = align_model_metadata["dictionary"]
     model_lang = align_model_metadata["language"]
@@ -237,7 +255,10 @@ def align(
         f2 = int(t2 * SAMPLE_RATE)
 
         # TODO: Probably can get some speedup gain with batched inference here
-        waveform_segment = audio[:, f1:f2]
+        if isinstance(audio, (PCMAudio, AudioReader)):
+            waveform_segment = torch.from_numpy(audio.crop(t1, t2)).unsqueeze(0)
+        else:
+            waveform_segment = audio[:, f1:f2]
         # Handle the minimum input length for wav2vec2 models
         if waveform_segment.shape[-1] < 400:
             lengths = torch.as_tensor([waveform_segment.shape[-1]]).to(device)
@@ -378,6 +399,114 @@ def align(
 
     return {"segments": aligned_segments, "word_segments": word_segments}
 
+def align_channels(
+    transcript: Iterable[SingleSegment],
+    model: torch.nn.Module,
+    align_model_metadata: dict,
+    channels: List[Union[np.ndarray, torch.Tensor, PCMAudio]],
+    device: str,
+    **kwargs,
+) -> AlignedTranscriptionResult:
+    """
+    Align a transcript of `FasterWhisperPipeline.transcribe(..., split_channels=True)`, each segment against
+    the audio of its own channel. Segments and words are labelled with the speaker of their channel.
+    """
+    transcript = list(transcript)
+    aligned_segments: List[SingleAlignedSegment] = []
+    for channel, audio in enumerate(channels):
+        channel_transcript = [segment for segment in transcript if segment["channel"] == channel]
+        if not channel_transcript:
+            continue
+        result = align(channel_transcript, model, align_model_metadata, audio, device, **kwargs)
+        speaker = channel_speaker(channel)
+        for segment in result["segments"]:
+            segment["speaker"] = speaker
+            for word in segment["words"]:
+                word["speaker"] = speaker
+        aligned_segments += result["segments"]
+    aligned_segments.sort(key=lambda segment: segment["start"])
+
+    word_segments: List[SingleWordSegment] = []
+    for segment in aligned_segments:
+        word_segments += segment["words"]
+
+    return {"segments": aligned_segments, "word_segments": word_segments}
+
+
+def _align_blocks(
+    transcript: Iterable[SingleSegment],
+    model: torch.nn.Module,
+    align_model_metadata: dict,
+    blocks: Iterable[Tuple[int, np.ndarray]],
+    device: str,
+    **kwargs,
+) -> AlignedTranscriptionResult:
+    """
+    Align a transcript against audio streamed in blocks (see `iter_audio`).
+    Only the samples still needed by segments that are not aligned yet are kept in memory,
+    segments are expected in timeline order.
+    """
+    transcript = list(transcript)
+    aligned_segments: List[SingleAlignedSegment] = []
+    buffer = np.zeros(0, dtype=np.float32)
+    buffer_offset = 0
+    sdx = 0
+
+    def align_ready(ready: List[SingleSegment]):
+        shift = buffer_offset / SAMPLE_RATE
+        shifted = [{**seg, "start": seg["start"] - shift, "end": seg["end"] - shift} for seg in ready]
+        result = align(shifted, model, align_model_metadata, buffer, device, **kwargs)
+        aligned_segments.extend(_shift_aligned_segment(seg, shift) for seg in result["segments"])
+
+    for offset, block in blocks:
+        if buffer.shape[0] == 0:
+            buffer, buffer_offset = block, offset
+        else:
+            buffer = np.concatenate([buffer, block])
+
+        buffer_end = (buffer_offset + buffer.shape[0]) / SAMPLE_RATE
+        ready = []
+        while sdx < len(transcript) and transcript[sdx]["end"] <= buffer_end:
+            ready.append(transcript[sdx])
+            sdx += 1
+        if ready:
+            align_ready(ready)
+
+        # drop the samples before the next pending segment
+        if sdx < len(transcript):
+            keep_from = max(int(transcript[sdx]["start"] * SAMPLE_RATE), buffer_offset)
+        else:
+            keep_from = buffer_offset + buffer.shape[0]
+        buffer = buffer[keep_from - buffer_offset:]
+        buffer_offset = keep_from
+
+    # segments running past the end of the audio
+    if sdx < len(transcript):
+        align_ready(transcript[sdx:])
+
+    word_segments: List[SingleWordSegment] = []
+    for segment in aligned_segments:
+        word_segments += segment["words"]
+
+    return {"segments": aligned_segments, "word_segments": word_segments}
+
+
+def _shift_aligned_segment(segment: SingleAlignedSegment, shift: float) -> SingleAlignedSegment:
+    def shift_times(item: dict) -> dict:
+        for key in ("start", "end"):
+            if item.get(key) is not None:
+                item[key] = round(item[key] + shift, 3)
+        return item
+
+    shift_times(segment)
+    for word in segment["words"]:
+        shift_times(word)
+    if segment.get("chars"):
+        for char in segment["chars"]:
+            shift_times(char)
+    return segment
+
+
 """
 source: https://pytorch.org/tutorials/intermediate/forced_alignment_with_torchaudio_tutorial.html
 """
@@ -1,8 +1,12 @@
+import json
 import os
+import unicodedata
+from dataclasses import replace
+from functools import partial
 from textwrap import dedent
 from venv import logger
 import warnings
-from typing import Generator, List, Union, Optional, NamedTuple
+from typing import Dict, Generator, Iterable, Iterator, List, Tuple, Union, Optional, NamedTuple
 
 import ctranslate2
 import faster_whisper
@@ -15,21 +19,137 @@ from faster_whisper.tokenizer import Tokenizer
 from transformers.pipelines.pt_utils import PipelineIterator
 from transformers import WhisperForConditionalGeneration, AutoProcessor
 import whisper
+import whisper.timing
 
-from .audio import N_SAMPLES, SAMPLE_RATE, load_audio, log_mel_spectrogram, pad_or_trim
+from .audio import N_SAMPLES, SAMPLE_RATE, AudioSource, PCMAudio, is_audio_source
+from .batching import SORT_WINDOW_BATCHES, ChunkDataset, MelCollate, chunk_inputs, in_order, length_sorted_batches, trim_chunk
+from .cache import TokenClassCache, VadScoreCache, array_digest
+from .registry import MODEL_REGISTRY, ModelLease
 # from .vad import load_vad_model, merge_chunks
-from whisperx.vads import Vad, Silero, Pyannote
-from .types import TranscriptionResult, SingleSegment
-from faster_whisper.transcribe import TranscriptionOptions, get_ctranslate2_storage
+from whisperx.vads import Vad, CascadeVad, EnergyVad, SegmentationVad, ShardedVad, Silero, SileroOnnx, Pyannote
+from whisperx.vads.scores import scores_from_arrays, scores_to_arrays
+from whisperx.vads.vad import padding_waste
+from .diarize import channel_speaker
+from .types import TranscriptionResult, SingleSegment, SingleWordSegment
+from .utils import LANGUAGES
+from faster_whisper.transcribe import TranscriptionOptions, get_ctranslate2_storage, merge_punctuations
+
+# characters of each token class, besides "punctuation" (any Unicode punctuation)
+TOKEN_CLASSES = {
+    "numeral": "0123456789",
+    "percent": "%",
+    "currency": "$£",
+}
+# the classes suppressed by `suppress_numerals`, as wav2vec2 cannot align them
+NUMERAL_SYMBOL_CLASSES = ("numeral", "percent", "currency")
+# speech ending closer than this to the end of a streamed block, or than the VAD's context,
+# may go on in the next block, see `FasterWhisperPipeline.transcribe`
+BLOCK_HOLD_SECONDS = 1.0
+
+class TokenClassIndex:
+    '''
+    The text tokens of a vocabulary by class of the characters they contain, see `TOKEN_CLASSES`.
+    Building it decodes every token, `TokenClassCache` keeps it on disk per vocabulary, and the
+    tokens of any combination of classes are looked up once.
+    '''
+
+    def __init__(self, classes: Dict[str, np.ndarray]):
+        self.classes = classes
+        self._tokens: Dict[Tuple[str, ...], List[int]] = {}
+
+    @staticmethod
+    def token_texts(tokenizer) -> List[str]:
+        '''The text of every text token, i.e. every token before end-of-text, of a faster-whisper, openai-whisper or HuggingFace tokenizer.'''
+        if hasattr(tokenizer, "encoding"):
+            # openai-whisper, on tiktoken
+            return tokenizer.encoding.decode_batch([[i] for i in range(tokenizer.eot)])
+        if hasattr(tokenizer, "eot"):
+            # faster-whisper, on tokenizers
+            return tokenizer.tokenizer.decode_batch([[i] for i in range(tokenizer.eot)])
+        eot = tokenizer.convert_tokens_to_ids("<|endoftext|>")
+        return tokenizer.batch_decode([[i] for i in range(eot)])
+
+    @staticmethod
+    def vocabulary(tokenizer) -> str:
+        '''A serialization of the vocabulary of a tokenizer, as accepted by `token_texts`, identifying its token classes.'''
+        if hasattr(tokenizer, "encoding"):
+            # the encoding name is that of its vocabulary file, e.g. "multilingual" or "gpt2"
+            return f"tiktoken:{tokenizer.encoding.name}:{tokenizer.eot}"
+        if hasattr(tokenizer, "eot"):
+            return tokenizer.tokenizer.to_str()
+        return json.dumps(tokenizer.get_vocab(), sort_keys=True)
+
+    @classmethod
+    def find_classes(cls, tokenizer) -> Dict[str, np.ndarray]:
+        classes = {name: [] for name in [*TOKEN_CLASSES, "punctuation"]}
+        for i, text in enumerate(cls.token_texts(tokenizer)):
+            text = text.removeprefix(" ")
+            for name, chars in TOKEN_CLASSES.items():
+                if any(c in chars for c in text):
+                    classes[name].append(i)
+            if any(unicodedata.category(c).startswith("P") for c in text):
+                classes["punctuation"].append(i)
+        return {name: np.array(ids, dtype=np.int64) for name, ids in classes.items()}
+
+    @classmethod
+    def load(cls, tokenizer, cache: Optional[TokenClassCache] = None) -> "TokenClassIndex":
+        if cache is None:
+            return cls(cls.find_classes(tokenizer))
+        return cls(cache.load(cls.vocabulary(tokenizer), lambda: cls.find_classes(tokenizer)))
+
+    def tokens(self, *classes: str) -> List[int]:
+        '''The sorted ids of the tokens in any of `classes`.'''
+        key = tuple(sorted(classes))
+        if key not in self._tokens:
+            self._tokens[key] = sorted(set(np.concatenate([self.classes[name] for name in key]).tolist()))
+        return self._tokens[key]
 
 def find_numeral_symbol_tokens(tokenizer):
-    numeral_symbol_tokens = []
-    for i in range(tokenizer.eot):
-        token = tokenizer.decode([i]).removeprefix(" ")
-        has_numeral_symbol = any(c in "0123456789%$£" for c in token)
-        if has_numeral_symbol:
-            numeral_symbol_tokens.append(i)
-    return numeral_symbol_tokens
+    return TokenClassIndex.load(tokenizer).tokens(*NUMERAL_SYMBOL_CLASSES)
+
+def storage_to_torch(storage: ctranslate2.StorageView) -> torch.Tensor:
+    '''A copy of a CTranslate2 array as a tensor on the same device.'''
+    if storage.device == "cuda":
+        return torch.as_tensor(storage, device=f"cuda:{storage.device_index}").clone()
+    return torch.from_numpy(np.array(storage))
+
+def chunk_key(audio: Union[np.ndarray, torch.Tensor]) -> str:
+    '''Identifies the encoder input of a chunk of at most 30s of float32 audio, see `FasterWhisperPipeline.encoder_cache`.'''
+    audio = audio.numpy() if torch.is_tensor(audio) else np.asarray(audio, dtype=np.float32)
+    return array_digest(audio[:N_SAMPLES])
+
+def with_next_offset(blocks: Iterable[Tuple[int, list]]) -> Iterator[Tuple[Tuple[int, list], Optional[int]]]:
+    '''Every (offset, channels) block along with the offset of the block after it, None for the last one.'''
+    previous = None
+    for block in blocks:
+        if previous is not None:
+            yield previous, block[0]
+        previous = block
+    if previous is not None:
+        yield previous, None
+
+def most_likely_language(probs: List[Tuple[str, float]], candidate_languages: Optional[List[str]] = None) -> str:
+    '''The most likely of `candidate_languages`, or of every language, in `probs` sorted by decreasing probability.'''
+    for language, _ in probs:
+        if candidate_languages is None or language in candidate_languages:
+            return language
+    raise ValueError(f"None of the candidate languages {', '.join(candidate_languages)} is supported by the model")
+
+def word_segments(alignment: List[dict], options: TranscriptionOptions) -> List[SingleWordSegment]:
+    '''
+    Words timed by the decoder's cross-attention (see `find_alignment`), within their 30s window,
+    with punctuation merged into the neighbouring words.
+    '''
+    merge_punctuations(alignment, options.prepend_punctuations, options.append_punctuations)
+    return [
+        {
+            "word": word["word"].strip(),
+            "start": round(float(word["start"]), 3),
+            "end": round(float(word["end"]), 3),
+            "score": round(float(word["probability"]), 3),
+        }
+        for word in alignment if word["word"].strip()
+    ]
 
 class WhisperModel(faster_whisper.WhisperModel):
     '''
@@ -43,7 +163,12 @@ class WhisperModel(faster_whisper.WhisperModel):
         tokenizer: Tokenizer,
         options: TranscriptionOptions,
         encoder_output=None,
+        num_frames: Optional[List[int]] = None,
     ):
+        '''
+        With `options.word_timestamps`, the words of every output are also returned, timed by DTW on
+        the cross-attention of the alignment heads over the `num_frames` frames of audio of each input.
+        '''
         batch_size = features.shape[0]
         all_tokens = []
         prompt_reset_since = 0
@@ -59,7 +184,8 @@ class WhisperModel(faster_whisper.WhisperModel):
             prefix=options.prefix,
         )
 
-        encoder_output = self.encode(features)
+        if encoder_output is None:
+            encoder_output = self.encode(features)
         max_initial_timestamp_index = int(
             round(options.max_initial_timestamp / self.time_precision)
         )
@@ -99,7 +225,8 @@ class WhisperModel(faster_whisper.WhisperModel):
 
             if avg_logprob < -1.0 or r.no_speech_prob > 0.7:
                 print(f"{avg_logprob:.2f}, {r.no_speech_prob:.2f}, {text}")
-                continue
+                # one output per input, the caller matches them by position
+                text = ""
             output.append(
                 dict(
                     avg_logprob=avg_logprob,
@@ -109,8 +236,7 @@ class WhisperModel(faster_whisper.WhisperModel):
                 )
             )
 
-        results = output
-        # print("results:", results)
+        # print("results:", output)
         
         # subs = []
         # segment_info = []
@@ -158,8 +284,15 @@ class WhisperModel(faster_whisper.WhisperModel):
             # )
             # sub_index += 1
 
-        text = [x['text'] for x in results]
-        return text
+        text = [x['text'] for x in output]
+        if not options.word_timestamps:
+            return text
+
+        # all the inputs are aligned in one batch, on the encoder output of the decoding
+        text_tokens = [[token for token in r.sequences_ids[0] if token < tokenizer.eot] for r in results]
+        alignments = self.find_alignment(tokenizer, text_tokens, encoder_output, num_frames)
+        words = [word_segments(alignment, options) if t else [] for t, alignment in zip(text, alignments)]
+        return text, words
 
     def encode(self, features: np.ndarray) -> ctranslate2.StorageView:
         # When the model is running on multiple GPUs, the encoder output should be moved
@@ -241,6 +374,9 @@ class FasterWhisperPipeline(Pipeline):
         framework="pt",
         language: Optional[str] = None,
         suppress_numerals: bool = False,
+        vad_score_cache: Optional[VadScoreCache] = None,
+        model_lease: Optional[ModelLease] = None,
+        token_class_cache: Optional[TokenClassCache] = None,
         **kwargs,
     ):
         self.model: whisper.model.Whisper | WhisperModel | HuggingfaceWhisperModel = model
@@ -265,9 +401,34 @@ class FasterWhisperPipeline(Pipeline):
         else:
             self.device = device
 
+        # module-level callables, DataLoader workers would otherwise receive the pipeline with its model
+        if isinstance(self.model, HuggingfaceWhisperModel):
+            self.chunk_preprocess, self.chunk_collate = chunk_inputs, list
+        elif isinstance(self.model, WhisperModel):
+            model_n_mels = self.model.feat_kwargs.get("feature_size")
+            self.chunk_preprocess, self.chunk_collate = trim_chunk, MelCollate(n_mels=model_n_mels if model_n_mels is not None else 80)
+        else:
+            self.chunk_preprocess, self.chunk_collate = trim_chunk, MelCollate(n_mels=self.model.dims.n_mels)
+        self.mel_frontend = getattr(self.chunk_collate, "mel_frontend", None)
+
         super(Pipeline, self).__init__()
         self.vad_model = vad
         self._vad_params = vad_params
+        self.vad_score_cache = vad_score_cache
+        # shared models (see `MODEL_REGISTRY`) are released along with the pipeline
+        self.model_lease = model_lease
+        # encoder outputs of the first chunk of speech of the audios whose language was detected, keyed
+        # by `chunk_key`, each taken by the transcription of its audio instead of encoding the chunk again
+        self.encoder_cache: Dict[str, torch.Tensor] = {}
+        # VAD chunks computed ahead of transcription by `detect_file_languages`, keyed by audio and chunking
+        self._vad_chunks: Dict[Tuple[str, float, str], List[dict]] = {}
+        # tokenizers of the languages detected per chunk, keyed by task and language
+        self._language_tokenizers: Dict[Tuple[str, str], Tokenizer] = {}
+        # token classes of the vocabulary for `suppress_numerals`, defaults to a TokenClassCache on first use
+        self.token_class_cache = token_class_cache
+        self._token_index: Optional[TokenClassIndex] = None
+        # options with the numeral and symbol tokens suppressed, along with the options they extend
+        self._numeral_options: Optional[Tuple[TranscriptionOptions, TranscriptionOptions]] = None
 
     def _sanitize_parameters(self, **kwargs):
         preprocess_kwargs = {}
@@ -276,79 +437,176 @@ class FasterWhisperPipeline(Pipeline):
         return preprocess_kwargs, {}, {}
 
     def preprocess(self, audio):
-        audio = audio['inputs']
-        if isinstance(self.model, whisper.model.Whisper):
-            audio = pad_or_trim(audio)
-            return {'inputs': audio}
-        elif isinstance(self.model, HuggingfaceWhisperModel):
-            return audio
-        else:
-            model_n_mels = self.model.feat_kwargs.get("feature_size")
-            features = log_mel_spectrogram(
-                audio,
-                n_mels=model_n_mels if model_n_mels is not None else 80,
-                padding=N_SAMPLES - audio.shape[0],
-            )
-            return {'inputs': features}
+        # log-Mel features are computed for the whole batch at once in `collate`
+        return self.chunk_preprocess(audio)
 
-    def _forward(self, model_inputs):
-        if isinstance(self.model, whisper.model.Whisper):
-            suppress_low = [
-                "Thanks for", "ike and ", "Bye.", "Bye!", "Bye bye!", "lease sub", "The end."
-            ]
-            suppress_high = [
-                "ubscribe", "my channel", "the channel", "our channel", "ollow me on", "for watching", "hank you for watching",
-                "Hãy subscribe", "Ghiền Mì Gõ", "không bỏ lỡ những video hấp dẫn", "kênh La La School"
-            ]
-            outputs = []
-            for i in range(len(model_inputs['inputs'])):
-                result = self.model.transcribe(
-                    verbose=False,
-                    audio=model_inputs['inputs'][i],
-                    task="transcribe",
-                    language="vi",
-                    initial_prompt="",
-                    logprob_threshold = -1.0,
-                    no_speech_threshold = 0.6,
-                    condition_on_previous_text=False,
-                    hallucination_silence_threshold=2,
-                    temperature=0,
-                    beam_size=self.options.beam_size,
-                    patience=self.options.patience,
-                    length_penalty=self.options.length_penalty,
-                    # compression_ratio_threshold=1
-                )
-                result = result["segments"]
-                output = []
-                for r in result:
-                    for s in suppress_low:
-                        if s in r["text"]:
-                            r["avg_logprob"] -= 0.15
-                    for s in suppress_high:
-                        if s in r["text"]:
-                            r["avg_logprob"] -= 0.35
-
-                    if (r["avg_logprob"] < -0.5 and r["compression_ratio"] < 1) \
-                        or (r["avg_logprob"] < -0.5 and r["compression_ratio"] > 2) \
-                        or r["no_speech_prob"] > 0.7 \
-                        or r["text"].strip() == "":
-                        print(dedent(f"""
-                            text: {r['text']}
-                            avg_logprob: {r['avg_logprob']:.2f}
-                            no_speech_prob: {r['no_speech_prob']:.2f}
-                            compression_ratio: {r['compression_ratio']}
-                        """))
-                        continue
-                    output.append(r["text"])
-                output = " ".join(output)
-                output = " ".join(output.split())
-                outputs.append(output)
-        elif isinstance(self.model, HuggingfaceWhisperModel):
+    def _forward(self, model_inputs, language_per_chunk: bool = False, candidate_languages: Optional[List[str]] = None,
+                 language: Optional[str] = None):
+        if isinstance(self.model, HuggingfaceWhisperModel):
             outputs = self.model.transcribe(model_inputs)
+        elif language_per_chunk:
+            outputs, words, languages = self.generate_by_language(model_inputs, candidate_languages)
+            if self.options.word_timestamps:
+                return {'text': outputs, 'words': words, 'language': languages}
+            return {'text': outputs, 'language': languages}
+        elif isinstance(self.model, whisper.model.Whisper):
+            # the encoder runs once on the stacked batch and beam search decodes all the chunks together,
+            # each chunk is a single 30s window
+            mel = model_inputs['inputs'].to(self.model.device)
+            outputs, words = self.decode_whisper(mel, self.encode_batch({**model_inputs, 'inputs': mel}),
+                                                 model_inputs['num_frames'], language or "vi")
+        elif self.options.word_timestamps:
+            outputs, words = self.model.generate_segment_batched(model_inputs['inputs'], self.tokenizer, self.options,
+                                                                 encoder_output=self.encode_batch(model_inputs),
+                                                                 num_frames=model_inputs['num_frames'])
         else:
-            outputs = self.model.generate_segment_batched(model_inputs['inputs'], self.tokenizer, self.options)
+            outputs = self.model.generate_segment_batched(model_inputs['inputs'], self.tokenizer, self.options,
+                                                          encoder_output=self.encode_batch(model_inputs))
+        if self.options.word_timestamps and not isinstance(self.model, HuggingfaceWhisperModel):
+            return {'text': outputs, 'words': words}
         return {'text': outputs}
 
+    def decode_whisper(self, mel: torch.Tensor, audio_features: torch.Tensor, num_frames: List[int], language: str):
+        """
+        Decode a batch in `language` with openai-whisper, from its encoder output `audio_features`.
+        Returns the text of every chunk, empty if it is filtered out as a hallucination, and its words
+        with `word_timestamps`, aligned on `mel`.
+        """
+        suppress_low = [
+            "Thanks for", "ike and ", "Bye.", "Bye!", "Bye bye!", "lease sub", "The end."
+        ]
+        suppress_high = [
+            "ubscribe", "my channel", "the channel", "our channel", "ollow me on", "for watching", "hank you for watching",
+            "Hãy subscribe", "Ghiền Mì Gõ", "không bỏ lỡ những video hấp dẫn", "kênh La La School"
+        ]
+        results = whisper.decode(self.model, audio_features, whisper.DecodingOptions(
+            task="transcribe",
+            language=language,
+            temperature=0.0,
+            beam_size=self.options.beam_size,
+            patience=self.options.patience,
+            length_penalty=self.options.length_penalty,
+            fp16=self.model.device.type != "cpu",
+            suppress_tokens=self.options.suppress_tokens,
+            suppress_blank=self.options.suppress_blank,
+        ))
+        outputs = []
+        words = []
+        for i, r in enumerate(results):
+            avg_logprob = r.avg_logprob
+            for s in suppress_low:
+                if s in r.text:
+                    avg_logprob -= 0.15
+            for s in suppress_high:
+                if s in r.text:
+                    avg_logprob -= 0.35
+
+            # `no_speech_threshold` and `logprob_threshold` of `whisper.transcribe`
+            no_speech = r.no_speech_prob > 0.6 and r.avg_logprob < -1.0
+            if no_speech \
+                or (avg_logprob < -0.5 and r.compression_ratio < 1) \
+                or (avg_logprob < -0.5 and r.compression_ratio > 2) \
+                or r.no_speech_prob > 0.7 \
+                or r.text.strip() == "":
+                print(dedent(f"""
+                    text: {r.text}
+                    avg_logprob: {avg_logprob:.2f}
+                    no_speech_prob: {r.no_speech_prob:.2f}
+                    compression_ratio: {r.compression_ratio}
+                """))
+                outputs.append("")
+                words.append([])
+                continue
+            outputs.append(" ".join(r.text.split()))
+            if self.options.word_timestamps:
+                # openai-whisper aligns one input at a time, on the mel of the batch
+                tokenizer = whisper.tokenizer.get_tokenizer(self.model.is_multilingual, num_languages=self.model.num_languages,
+                                                            language=language, task="transcribe")
+                text_tokens = [token for token in r.tokens if token < tokenizer.eot]
+                alignment = whisper.timing.find_alignment(self.model, tokenizer, text_tokens, mel[i], num_frames[i])
+                words.append(word_segments([
+                    dict(word=t.word, tokens=t.tokens, start=t.start, end=t.end, probability=t.probability) for t in alignment
+                ], self.options))
+        return outputs, words
+
+    def generate_by_language(self, model_inputs, candidate_languages: Optional[List[str]] = None):
+        """
+        Decode a batch whose chunks may be in different languages: the language of every chunk is
+        detected on the encoder output of the batch, then the chunks of each language are decoded
+        together in that language. Returns the text, words and language of every chunk.
+        """
+        openai_whisper = isinstance(self.model, whisper.model.Whisper)
+        features = model_inputs['inputs'].to(self.model.device) if openai_whisper else model_inputs['inputs']
+        encoder_output = self.encode_batch({**model_inputs, 'inputs': features})
+        languages = [most_likely_language(probs, candidate_languages) for probs in self._language_probs(encoder_output)]
+
+        outputs = [""] * len(languages)
+        words = [[] for _ in languages]
+        single = len(set(languages)) == 1
+        encoded = storage_to_torch(encoder_output) if not (single or openai_whisper) else None
+        for language in dict.fromkeys(languages):
+            idx = [i for i, chunk_language in enumerate(languages) if chunk_language == language]
+            num_frames = [model_inputs['num_frames'][i] for i in idx]
+            if openai_whisper:
+                texts, group_words = self.decode_whisper(features if single else features[idx],
+                                                         encoder_output if single else encoder_output[idx],
+                                                         num_frames, language)
+            else:
+                group_output = encoder_output if single else get_ctranslate2_storage(encoded[idx])
+                result = self.model.generate_segment_batched(features[idx], self.language_tokenizer(language), self.options,
+                                                             encoder_output=group_output, num_frames=num_frames)
+                texts, group_words = result if self.options.word_timestamps else (result, None)
+            for j, i in enumerate(idx):
+                outputs[i] = texts[j]
+                if group_words is not None:
+                    words[i] = group_words[j]
+        return outputs, words, languages
+
+    def language_tokenizer(self, language: str) -> Tokenizer:
+        """The tokenizer of the current task for `language`, built once per language."""
+        task = self.tokenizer.task if self.tokenizer is not None else "transcribe"
+        if (task, language) not in self._language_tokenizers:
+            self._language_tokenizers[(task, language)] = faster_whisper.tokenizer.Tokenizer(
+                self.model.hf_tokenizer, self.model.model.is_multilingual, task=task, language=language
+            )
+        return self._language_tokenizers[(task, language)]
+
+    def encode_batch(self, model_inputs) -> Union[ctranslate2.StorageView, torch.Tensor]:
+        """Encoder output of a batch, only the chunks without an output in model_inputs['encoded'] are encoded."""
+        features = model_inputs['inputs']
+        cached = list(model_inputs.get('encoded') or [])
+        missing = [i for i, output in enumerate(cached) if output is None]
+        if not cached or len(missing) == len(cached):
+            return self._encode(features)
+        if missing:
+            for i, output in zip(missing, self._unstack(self._encode(features[missing]))):
+                cached[i] = output
+        # kept outputs may come from another device or precision than the model's current ones
+        reference = cached[missing[0]] if missing else cached[0]
+        stacked = torch.stack([output.to(device=reference.device, dtype=reference.dtype) for output in cached])
+        return stacked if isinstance(self.model, whisper.model.Whisper) else get_ctranslate2_storage(stacked)
+
+    def _encode(self, features: torch.Tensor) -> Union[ctranslate2.StorageView, torch.Tensor]:
+        if isinstance(self.model, whisper.model.Whisper):
+            # in the precision `whisper.decode` expects of precomputed audio features
+            mel = features.to(self.model.device)
+            with torch.no_grad():
+                return self.model.encoder(mel.half() if self.model.device.type != "cpu" else mel)
+        return self.model.encode(features)
+
+    def _unstack(self, encoder_output: Union[ctranslate2.StorageView, torch.Tensor]) -> List[torch.Tensor]:
+        if isinstance(encoder_output, torch.Tensor):
+            return list(encoder_output)
+        return list(storage_to_torch(encoder_output))
+
+    def _language_probs(self, encoder_output: Union[ctranslate2.StorageView, torch.Tensor]) -> List[List[Tuple[str, float]]]:
+        # the languages of every chunk with their probability, most likely first
+        if isinstance(self.model, whisper.model.Whisper):
+            _, probs = whisper.decoding.detect_language(self.model, encoder_output)
+            return [sorted(chunk_probs.items(), key=lambda item: -item[1]) for chunk_probs in probs]
+        return [[(token[2:-2], probability) for token, probability in result]
+                for result in self.model.model.detect_language(encoder_output)]
+
     def postprocess(self, model_outputs):
         return model_outputs
 
@@ -365,112 +623,327 @@ class FasterWhisperPipeline(Pipeline):
         if "TOKENIZERS_PARALLELISM" not in os.environ:
             os.environ["TOKENIZERS_PARALLELISM"] = "false"
         # TODO hack by collating feature_extractor and image_processor
-
-        def stack(items):
-            if isinstance(self.model, HuggingfaceWhisperModel):
-                return items
-            else:
-                return {'inputs': torch.stack([x['inputs'] for x in items])}
-        dataloader = torch.utils.data.DataLoader(dataset, num_workers=num_workers, batch_size=batch_size, collate_fn=stack)
+        dataloader = torch.utils.data.DataLoader(dataset, num_workers=num_workers, batch_size=batch_size, collate_fn=self.collate)
         model_iterator = PipelineIterator(dataloader, self.forward, forward_params, loader_batch_size=batch_size)
         final_iterator = PipelineIterator(model_iterator, self.postprocess, postprocess_params)
         return final_iterator
 
-    def transcribe(
-        self, audio: Union[str, np.ndarray], batch_size=None, num_workers=0, language='vi', task='transcribe', chunk_size=30, print_progress = True, combined_progress=False
-    ):
-        if isinstance(audio, str):
-            audio = load_audio(audio)
+    def collate(self, items):
+        return self.chunk_collate(items)
 
-        def data(audio, segments):
-            for seg in segments:
-                f1 = int(seg['start'] * SAMPLE_RATE)
-                f2 = int(seg['end'] * SAMPLE_RATE)
-                yield {'inputs': torch.from_numpy(audio[f1:f2])}
+    def iter_batches(self, dataset: ChunkDataset, batches: List[List[int]], num_workers: int = 0,
+                     encoded: Optional[Dict[int, torch.Tensor]] = None, **forward_params):
+        """
+        Transcribe the chunks of `dataset` in the given batches of indices, yielding (index, output) for
+        every chunk as soon as its batch is decoded, in the order of `batches`. The output holds the
+        'text' of the chunk, its 'words' with `word_timestamps` and its 'language' with `language_per_chunk`.
+        `encoded` holds the encoder outputs of chunks already encoded, by index, which are not encoded again.
+        """
+        if "TOKENIZERS_PARALLELISM" not in os.environ:
+            os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        dataloader = torch.utils.data.DataLoader(dataset, num_workers=num_workers, batch_sampler=batches, collate_fn=self.chunk_collate)
+        for batch, model_inputs in zip(batches, dataloader):
+            if encoded and not isinstance(model_inputs, list):
+                model_inputs['encoded'] = [encoded.pop(i, None) for i in batch]
+            out = self.postprocess(self.forward(model_inputs, **{**self._forward_params, **forward_params}), **self._postprocess_params)
+            for i, index in enumerate(batch):
+                yield index, {key: value[i] for key, value in out.items()}
 
-        # Pre-process audio and merge chunks as defined by the respective VAD child class 
-        # In case vad_model is manually assigned (see 'load_model') follow the functionality of pyannote toolkit
-        if issubclass(type(self.vad_model), Vad):
-            waveform = self.vad_model.preprocess_audio(audio)
-            merge_chunks =  self.vad_model.merge_chunks
+    def transcribe(
+        self, audio: Union[AudioSource, np.ndarray, PCMAudio, Iterable[Tuple[int, np.ndarray]], List[Union[np.ndarray, PCMAudio]]], batch_size=None, num_workers=0, language='vi', task='transcribe', chunk_size=30, print_progress = True, combined_progress=False, split_channels=False, chunk_strategy="greedy", sort_batches=True, max_batch_seconds=None, language_per_chunk=False, candidate_languages=None
+    ):
+        """
+        `audio` may be a path, the encoded content of a file as bytes, memoryview or a binary stream,
+        a decoded waveform, or a stream of (offset, block) waveform blocks.
+        With `split_channels`, `audio` holds one waveform per channel (an encoded file, a (channels, samples)
+        array or a list of waveforms): VAD runs on each channel, their chunks share the ASR batches and
+        the segments are labelled with the speaker of their channel, e.g. for call recordings with one
+        speaker per channel, where diarization is then unnecessary.
+        `chunk_strategy` is how VAD segments are packed into chunks of at most `chunk_size` seconds:
+        "greedy" fills chunks in order, "balanced" splits at the silences that give the fullest chunks.
+        With `sort_batches`, chunks of similar length share a batch (see `length_sorted_batches`), and
+        `max_batch_seconds` caps the total audio of a batch on top of `batch_size`; the texts are
+        still yielded in timeline order.
+        With the `word_timestamps` ASR option, the segments hold their words timed by the decoder's
+        cross-attention, within about 100ms, instead of needing `align` and a wav2vec2 model.
+        With `language_per_chunk`, e.g. for code-switched audio, the language of every chunk is detected
+        on the encoder output of its batch, among `candidate_languages` if given, and each segment gets
+        its 'language'; the result's 'language' is then the most frequent one. The HuggingFace backend
+        does not detect languages per chunk.
+        """
+        # Every block is a list of channels, a single one unless `split_channels` is set.
+        # A decoded waveform is a single block, a streamed input (see `iter_audio`) is
+        # processed block by block so that at most two blocks are held in memory at a time.
+        # The last chunk of speech of a streamed block is held back when it reaches the end of
+        # the block, its samples are prepended to the next block if it follows on, so that speech
+        # across the boundary is transcribed once and whole, as in a single pass.
+        if split_channels:
+            if is_audio_source(audio):
+                audio = PCMAudio.channels_from_file(audio)
+            blocks = [(0, list(audio))]
+        elif is_audio_source(audio):
+            blocks = [(0, [PCMAudio.from_file(audio)])]
+        elif isinstance(audio, (np.ndarray, PCMAudio)):
+            blocks = [(0, [audio])]
         else:
-            waveform = Pyannote.preprocess_audio(audio)
-            merge_chunks = Pyannote.merge_chunks
+            blocks = ((offset, [block]) for offset, block in audio)
 
-        vad_segments = self.vad_model({"waveform": waveform, "sample_rate": SAMPLE_RATE})
-        vad_segments = merge_chunks(
-            vad_segments,
-            chunk_size,
-            onset=self._vad_params["vad_onset"],
-            offset=self._vad_params["vad_offset"],
-        )
-        if isinstance(self.model, WhisperModel):
-            if self.tokenizer is None:
-                language = language or self.detect_language(audio)
-                task = task or "transcribe"
-                self.tokenizer = faster_whisper.tokenizer.Tokenizer(self.model.hf_tokenizer,
-                                                                    self.model.model.is_multilingual, task=task,
-                                                                    language=language)
-            else:
-                language = language or self.tokenizer.language_code
-                task = task or self.tokenizer.task
-                if task != self.tokenizer.task or language != self.tokenizer.language_code:
-                    self.tokenizer = faster_whisper.tokenizer.Tokenizer(self.model.hf_tokenizer,
-                                                                        self.model.model.is_multilingual, task=task,
-                                                                        language=language)
-        if self.suppress_numerals:
-            previous_suppress_tokens = self.options.suppress_tokens
-            numeral_symbol_tokens = find_numeral_symbol_tokens(self.tokenizer)
-            print(f"Suppressing numeral and symbol tokens")
-            new_suppressed_tokens = numeral_symbol_tokens + self.options.suppress_tokens
-            new_suppressed_tokens = list(set(new_suppressed_tokens))
-            self.options = replace(self.options, suppress_tokens=new_suppressed_tokens)
+        def data(channels, segments):
+            # workers only receive the sample offsets of the chunks, the audio is shared with them
+            bounds = [(seg['channel'], int(seg['start'] * SAMPLE_RATE), int(seg['end'] * SAMPLE_RATE)) for seg in segments]
+            return ChunkDataset(channels, bounds, self.chunk_preprocess, shared=num_workers > 0)
+
+        def schedule(segments):
+            durations = [seg['end'] - seg['start'] for seg in segments]
+            speech = [sum(end - start for start, end in seg['segments']) for seg in segments]
+            return length_sorted_batches(durations, speech, batch_size=batch_size, max_batch_seconds=max_batch_seconds,
+                                         window=SORT_WINDOW_BATCHES * (batch_size or 1), sort=sort_batches)
 
         segments: List[SingleSegment] = []
         batch_size = batch_size or self._batch_size
-        total_segments = len(vad_segments)
+        previous_options = self.options
+        forward_params = {}
+        if language_per_chunk:
+            unknown = [code for code in candidate_languages or [] if code not in LANGUAGES]
+            if unknown:
+                raise ValueError(f"Unsupported candidate languages: {', '.join(unknown)}")
+            if isinstance(self.model, HuggingfaceWhisperModel):
+                print("Warning: language_per_chunk is not supported by the HuggingFace backend, ignoring it.")
+            else:
+                forward_params = {"language_per_chunk": True, "candidate_languages": candidate_languages}
 
-        print("total_segments:", total_segments)
-        
-        for idx, out in enumerate(self.__call__(data(audio, vad_segments), batch_size=batch_size, num_workers=num_workers)):
-            if print_progress:
-                base_progress = ((idx + 1) / total_segments) * 100
-                percent_complete = base_progress / 2 if combined_progress else base_progress
-                print(f"Progress: {percent_complete:.2f}%...")
-            text = out['text']
-            if batch_size in [0, 1, None]:
-                text = text[0]
-            segment = {
-                "text": text,
-                "start": round(vad_segments[idx]['start'], 3),
-                "end": round(vad_segments[idx]['end'], 3)
-            }
-            segments.append(segment)
-            yield text
+        # the held back speech of the previous block, as (offset, samples)
+        carry = None
+        for block_idx, ((offset, channels), next_offset) in enumerate(with_next_offset(blocks)):
+            if carry is not None:
+                offset, channels = carry[0], [np.concatenate([carry[1], channels[0]])]
+                carry = None
+            vad_segments = self.vad_chunks(channels, chunk_size, chunk_strategy)
+            if next_offset is not None and next_offset == offset + len(channels[0]) and vad_segments:
+                hold = max(getattr(self.vad_model, "context", 0.0), BLOCK_HOLD_SECONDS)
+                if vad_segments[-1]['end'] > len(channels[0]) / SAMPLE_RATE - hold:
+                    # with the silence before it, up to the chunk before, as context for the VAD
+                    held = vad_segments.pop()
+                    start = max(held['start'] - hold, vad_segments[-1]['end'] if vad_segments else 0.0)
+                    start = int(start * SAMPLE_RATE)
+                    carry = (offset + start, channels[0][start:])
+            offset = offset / SAMPLE_RATE
+            dataset = data(channels, vad_segments)
+
+            encoded = {}
+            if block_idx == 0:
+                # languages are detected on the first chunk of speech rather than the first 30s, which may be
+                # silence or music, its encoder output is then reused by the transcription
+                has_speech = len(dataset) > 0 and not isinstance(self.model, HuggingfaceWhisperModel)
+                first_chunk = dataset[0]['inputs'] if has_speech else channels[0]
+                if isinstance(self.model, WhisperModel):
+                    if self.tokenizer is None:
+                        language = language or self.detect_language(first_chunk, cache=has_speech)
+                        task = task or "transcribe"
+                        self.tokenizer = faster_whisper.tokenizer.Tokenizer(self.model.hf_tokenizer,
+                                                                            self.model.model.is_multilingual, task=task,
+                                                                            language=language)
+                    else:
+                        language = language or self.tokenizer.language_code
+                        task = task or self.tokenizer.task
+                        if task != self.tokenizer.task or language != self.tokenizer.language_code:
+                            self.tokenizer = faster_whisper.tokenizer.Tokenizer(self.model.hf_tokenizer,
+                                                                                self.model.model.is_multilingual, task=task,
+                                                                                language=language)
+                elif isinstance(self.model, whisper.model.Whisper):
+                    # openai-whisper takes the language with every decoding
+                    language = language or self.detect_language(first_chunk, cache=has_speech)
+                    forward_params["language"] = language
+                if self.suppress_numerals and self.vocabulary_tokenizer() is not None:
+                    print(f"Suppressing numeral and symbol tokens")
+                    self.options = self.numeral_options(previous_options)
+                if self.encoder_cache and has_speech:
+                    # taken out of the cache even if unused, so that no entry outlives the transcription of its audio
+                    output = self.encoder_cache.pop(chunk_key(first_chunk), None)
+                    if output is not None:
+                        encoded[0] = output
+
+            total_segments = len(vad_segments)
+
+            # every chunk is padded to 30s for the encoder
+            print("total_segments:", total_segments, f"(padding: {padding_waste(vad_segments, N_SAMPLES / SAMPLE_RATE):.0%})")
+
+            for idx, out in in_order(self.iter_batches(dataset, schedule(vad_segments), num_workers=num_workers,
+                                                       encoded=encoded, **forward_params)):
+                if print_progress:
+                    base_progress = ((idx + 1) / total_segments) * 100
+                    percent_complete = base_progress / 2 if combined_progress else base_progress
+                    print(f"Progress: {percent_complete:.2f}%...")
+                text = out['text']
+                segment = {
+                    "text": text,
+                    "start": round(offset + vad_segments[idx]['start'], 3),
+                    "end": round(offset + vad_segments[idx]['end'], 3)
+                }
+                if "words" in out:
+                    # the words are timed within the chunk
+                    shift = offset + vad_segments[idx]['start']
+                    segment["words"] = [
+                        {**word, "start": round(shift + word["start"], 3), "end": round(shift + word["end"], 3)}
+                        for word in out["words"]
+                    ]
+                if "language" in out:
+                    segment["language"] = out["language"]
+                if split_channels:
+                    segment["channel"] = vad_segments[idx]["channel"]
+                    segment["speaker"] = channel_speaker(vad_segments[idx]["channel"])
+                segments.append(segment)
+                yield text
 
         # revert the tokenizer if multilingual inference is enabled
         if self.preset_language is None:
             self.tokenizer = None
 
         # revert suppressed tokens if suppress_numerals is enabled
-        if self.suppress_numerals:
-            self.options = replace(self.options, suppress_tokens=previous_suppress_tokens)
+        self.options = previous_options
 
+        if forward_params.get("language_per_chunk") and segments:
+            languages = [segment["language"] for segment in segments]
+            language = max(set(languages), key=languages.count)
+
+        if self.options.word_timestamps:
+            # same layout as `align` output, which is then unnecessary
+            words = [word for segment in segments for word in segment.get("words", [])]
+            return {"segments": segments, "word_segments": words, "language": language}
         return {"segments": segments, "language": language}
 
-    def detect_language(self, audio: np.ndarray):
+    def transcribe_result(self, audio, **kwargs) -> TranscriptionResult:
+        """
+        Run `transcribe` to the end and return its result, the segments and language, rather than
+        yielding the text of every chunk; takes the same arguments.
+        """
+        texts = self.transcribe(audio, **kwargs)
+        while True:
+            try:
+                next(texts)
+            except StopIteration as stop:
+                return stop.value
+
+    def vocabulary_tokenizer(self):
+        """
+        A tokenizer of the vocabulary the model decodes with: openai-whisper decodes with its own
+        tokenizer rather than `self.tokenizer`, the other backends with `self.tokenizer` once set.
+        """
+        if isinstance(self.model, whisper.model.Whisper):
+            return whisper.tokenizer.get_tokenizer(self.model.is_multilingual, num_languages=self.model.num_languages)
+        return self.tokenizer
+
+    def numeral_options(self, options: TranscriptionOptions) -> TranscriptionOptions:
+        """`options` also suppressing the numeral and symbol tokens, built once for the same options."""
+        if self._numeral_options is None or self._numeral_options[0] is not options:
+            if self._token_index is None:
+                self._token_index = TokenClassIndex.load(self.vocabulary_tokenizer(), self.token_class_cache or TokenClassCache())
+            suppress_tokens = sorted(set(self._token_index.tokens(*NUMERAL_SYMBOL_CLASSES)) | set(options.suppress_tokens))
+            self._numeral_options = (options, replace(options, suppress_tokens=suppress_tokens))
+        return self._numeral_options[1]
+
+    def vad_chunks(self, channels: List[Union[np.ndarray, PCMAudio]], chunk_size=30, chunk_strategy="greedy", keep=False) -> List[dict]:
+        """
+        The chunks of speech of every channel, as merged by the VAD, in timeline order.
+        With `keep`, the chunks of each channel are kept for the next call on the same audio and chunking.
+        """
+        # Pre-process audio and merge chunks as defined by the respective VAD child class 
+        # In case vad_model is manually assigned (see 'load_model') follow the functionality of pyannote toolkit
+        if issubclass(type(self.vad_model), Vad):
+            preprocess_audio = self.vad_model.preprocess_audio
+            merge_chunks =  self.vad_model.merge_chunks
+        else:
+            preprocess_audio = Pyannote.preprocess_audio
+            merge_chunks = Pyannote.merge_chunks
+
+        vad_segments = []
+        for channel, audio in enumerate(channels):
+            samples = audio.samples if isinstance(audio, PCMAudio) else np.asarray(audio)
+            memo_key = (array_digest(samples), chunk_size, chunk_strategy) if keep or self._vad_chunks else None
+            if memo_key in self._vad_chunks:
+                vad_segments.extend({**seg, "channel": channel} for seg in self._vad_chunks.pop(memo_key))
+                continue
+
+            def run_vad():
+                # the VAD models need the whole waveform, int16 audio is only expanded for the VAD call
+                waveform = preprocess_audio(audio.to_float32() if isinstance(audio, PCMAudio) else audio)
+                return self.vad_model({"waveform": waveform, "sample_rate": SAMPLE_RATE})
+
+            # with a score cache, only the thresholding and chunking below run again on known audio
+            cache_key = getattr(self.vad_model, "cache_key", None)
+            if self.vad_score_cache is not None and cache_key is not None:
+                channel_segments = scores_from_arrays(self.vad_score_cache.load(cache_key, samples,
+                                                                                lambda: scores_to_arrays(run_vad())))
+            else:
+                channel_segments = run_vad()
+            channel_segments = merge_chunks(
+                channel_segments,
+                chunk_size,
+                onset=self._vad_params["vad_onset"],
+                offset=self._vad_params["vad_offset"],
+                strategy=chunk_strategy,
+            )
+            if keep:
+                self._vad_chunks[memo_key] = channel_segments
+            vad_segments.extend({**seg, "channel": channel} for seg in channel_segments)
+        # chunks of all channels share the batches, in timeline order
+        vad_segments.sort(key=lambda seg: seg["start"])
+        return vad_segments
+
+    def detect_language(self, audio: Union[np.ndarray, PCMAudio, torch.Tensor], cache: bool = False):
         if audio.shape[0] < N_SAMPLES:
             print("Warning: audio is shorter than 30s, language detection may be inaccurate.")
-        model_n_mels = self.model.feat_kwargs.get("feature_size")
-        segment = log_mel_spectrogram(audio[: N_SAMPLES],
-                                      n_mels=model_n_mels if model_n_mels is not None else 80,
-                                      padding=0 if audio.shape[0] >= N_SAMPLES else N_SAMPLES - audio.shape[0])
-        encoder_output = self.model.encode(segment)
-        results = self.model.model.detect_language(encoder_output)
-        language_token, language_probability = results[0][0]
-        language = language_token[2:-2]
-        print(f"Detected language: {language} ({language_probability:.2f}) in first 30s of audio...")
-        return language
+        return self.detect_languages([audio], cache=[cache])[0]
+
+    def detect_languages(self, audios: List[Union[np.ndarray, PCMAudio, torch.Tensor]], cache: Optional[List[bool]] = None) -> List[str]:
+        """
+        The language of the first 30s of every audio, detected with a single encoder pass.
+        The encoder outputs of the audios flagged in `cache`, which should be chunks the transcription
+        will encode, are kept in `encoder_cache` until then.
+        """
+        audios = [audio[: N_SAMPLES] for audio in audios]
+        encoder_output = self._encode(self.mel_frontend(audios))
+        if cache is not None and any(cache):
+            for audio, keep, output in zip(audios, cache, self._unstack(encoder_output)):
+                if keep:
+                    # a copy, not a view keeping the output of the whole batch
+                    self.encoder_cache[chunk_key(audio)] = output.clone()
+
+        languages = []
+        for probs in self._language_probs(encoder_output):
+            language, language_probability = probs[0]
+            languages.append(language)
+            print(f"Detected language: {language} ({language_probability:.2f})")
+        return languages
+
+    def detect_file_languages(self, audios: List[Union[np.ndarray, PCMAudio, List[PCMAudio]]], batch_size=None, chunk_size=30, chunk_strategy="greedy") -> List[str]:
+        """
+        The language of every audio, detected on its first chunk of speech, in batches across the audios.
+        Lists of channels are detected on their first chunk over all channels. The VAD chunks and
+        encoder outputs are kept for the transcription of the same audios with the same chunking, detect
+        a bounded number of audios at a time and `clear_detections` once they are transcribed.
+        """
+        first_chunks, has_speech = [], []
+        for audio in audios:
+            channels = audio if isinstance(audio, list) else [audio]
+            vad_segments = self.vad_chunks(channels, chunk_size, chunk_strategy, keep=True)
+            dataset = ChunkDataset(channels, [
+                (seg['channel'], int(seg['start'] * SAMPLE_RATE), int(seg['end'] * SAMPLE_RATE)) for seg in vad_segments[:1]
+            ], self.chunk_preprocess)
+            first_chunks.append(dataset[0]['inputs'] if len(dataset) > 0 else channels[0][: N_SAMPLES])
+            # without speech, there is no chunk to transcribe with the encoder output
+            has_speech.append(len(dataset) > 0)
+
+        batch_size = batch_size or self._batch_size or 1
+        languages = []
+        for i in range(0, len(first_chunks), batch_size):
+            languages.extend(self.detect_languages(first_chunks[i : i + batch_size], cache=has_speech[i : i + batch_size]))
+        return languages
+
+    def clear_detections(self):
+        """Drop the VAD chunks and encoder outputs kept by `detect_file_languages` that were not used."""
+        self.encoder_cache.clear()
+        self._vad_chunks.clear()
 
 
 def load_model(
@@ -488,19 +961,22 @@ def load_model(
     download_root: Optional[str] = None,
     local_files_only=False,
     threads=4,
+    vad_score_cache: Optional[VadScoreCache] = None,
 ) -> FasterWhisperPipeline:
     """Load a Whisper model for inference.
     Args:
         whisper_arch - The name of the Whisper model to load.
         device - The device to load the model on.
         compute_type - The compute type to use for the model.
-        vad_method - The vad method to use. vad_model has higher priority if is not None.
+        vad_method - The vad method to use ("pyannote", "silero", "silero_onnx" or "energy"). vad_model has higher priority if is not None.
+        vad_options - The VAD thresholds ("vad_onset", "vad_offset"), with "vad_cascade": True the VAD only runs on the regions an energy gate finds not silent, with "vad_workers": N it runs on shards of the audio in N processes, with "vad_fast": True Pyannote only scores every "vad_coarse_step" seconds (default 5) and refines around the boundaries.
         options - A dictionary of options to use for the model.
         language - The language of the model. (use English for now)
         model - The WhisperModel instance to use.
         download_root - The root directory to download the model to.
         local_files_only - If `True`, avoid downloading the file and return the path to the local cached file if it exists.
         threads - The number of cpu threads to use per worker, e.g. will be multiplied by num workers.
+        vad_score_cache - If set, VAD scores are cached per audio, so re-running with other VAD thresholds or chunk sizes skips the VAD model.
     Returns:
         A Whisper pipeline.
     """
@@ -508,9 +984,14 @@ def load_model(
     if whisper_arch.endswith(".en"):
         language = "en"
 
-    model = whisper.load_model(whisper_arch)
+    # models are shared by all the pipelines of the process, see `MODEL_REGISTRY`
+    lease = ModelLease(MODEL_REGISTRY)
+    # a model loaded on another device, with another compute type or from another download root is another model
+    model_device = f"cuda:{device_index}" if device == "cuda" else device
+    model = lease.acquire(("whisper", whisper_arch, device, device_index, compute_type, download_root),
+                          lambda: whisper.load_model(whisper_arch, device=model_device, download_root=download_root))
     # model = HuggingfaceWhisperModel('openai/whisper-large-v3', device)
-    tokenizer = AutoTokenizer.from_pretrained('openai/whisper-large-v3')
+    tokenizer = lease.acquire(("hf_tokenizer", 'openai/whisper-large-v3'), lambda: AutoTokenizer.from_pretrained('openai/whisper-large-v3'))
 
     # model2 = WhisperModel(whisper_arch,
     #                      device=device,
@@ -572,17 +1053,50 @@ def load_model(
         default_vad_options.update(vad_options)
 
     # Note: manually assigned vad_model has higher priority than vad_method!
+    # `vad_factory` builds the VAD of each worker process when the VAD is sharded
+    vad_factory = None
     if vad_model is not None:
         print("Use manually assigned vad_model. vad_method is ignored.")
         vad_model = vad_model
     else:
+        # thresholds are applied by `merge_chunks` from `vad_params`, so most VAD instances
+        # are shared across options; Silero applies them itself and is keyed by all its options
         if vad_method == "silero":
-            vad_model = Silero(**default_vad_options)
+            vad_model = lease.acquire(("vad", "silero", tuple(sorted(default_vad_options.items()))),
+                                      lambda: Silero(**default_vad_options))
+            vad_factory = partial(Silero, **default_vad_options)
+        elif vad_method == "silero_onnx":
+            vad_model = lease.acquire(("vad", "silero_onnx", default_vad_options.get("model_dir")),
+                                      lambda: SileroOnnx(**default_vad_options))
+            vad_factory = partial(SileroOnnx, **{**default_vad_options, "threads": 1})
+        elif vad_method == "energy":
+            # no model to load, and no `vad_factory`: its noise floor is a percentile of the whole audio,
+            # which shards would each compute on their own, and it scores hours of audio in seconds
+            vad_model = EnergyVad(**default_vad_options)
         elif vad_method == "pyannote":
-            vad_model = Pyannote(torch.device(device), use_auth_token=None, **default_vad_options)
+            key = ("vad", "pyannote", str(torch.device(device)), default_vad_options.get("model_fp"))
+            if default_vad_options.get("vad_fast"):
+                # the fast mode refines the scores around the boundaries of its thresholds
+                key += tuple(sorted(default_vad_options.items()))
+            vad_model = lease.acquire(key, lambda: Pyannote(torch.device(device), use_auth_token=None, **default_vad_options))
+            # the workers run on the CPU cores
+            vad_factory = partial(Pyannote, "cpu", use_auth_token=None, **default_vad_options)
         else:
             raise ValueError(f"Invalid vad_method: {vad_method}")
 
+    if isinstance(vad_model, SegmentationVad) and (default_vad_options.get("vad_workers", 0) > 1 or default_vad_options.get("vad_cascade")):
+        # the segmentations it keeps for diarization are those of the whole audio, which pieces would never match
+        print("vad_cascade and vad_workers are not supported with a SegmentationVad, VAD runs in a single pass.")
+    elif default_vad_options.get("vad_workers", 0) > 1:
+        if vad_factory is None:
+            print("vad_workers needs a pyannote or silero vad_method to build the VAD of each worker, VAD is not sharded.")
+        else:
+            vad_model = ShardedVad(vad_model, vad_factory, default_vad_options["vad_workers"], **default_vad_options)
+
+    if default_vad_options.get("vad_cascade") and not isinstance(vad_model, SegmentationVad):
+        # the VAD model only scores the parts of the audio the energy gate lets through
+        vad_model = CascadeVad(vad_model, **default_vad_options)
+
     return FasterWhisperPipeline(
         model=model,
         vad=vad_model,
@@ -591,4 +1105,6 @@ def load_model(
         language=language,
         suppress_numerals=suppress_numerals,
         vad_params=default_vad_options,
+        vad_score_cache=vad_score_cache,
+        model_lease=lease,
     )
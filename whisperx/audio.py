@@ -1,12 +1,21 @@
+import io
 import os
+import struct
 import subprocess
+import tempfile
+import threading
 from functools import lru_cache
-from typing import Optional, Union
+from typing import BinaryIO, Callable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 import torch
 import torch.nn.functional as F
 
+try:
+    import av
+except ImportError:
+    av = None
+
 from .utils import exact_div
 
 # hard-coded audio hyperparameters
@@ -22,47 +31,450 @@ FRAMES_PER_SECOND = exact_div(SAMPLE_RATE, HOP_LENGTH)  # 10ms per audio frame
 TOKENS_PER_SECOND = exact_div(SAMPLE_RATE, N_SAMPLES_PER_TOKEN)  # 20ms per audio token
 
 
-def load_audio(file: str, sr: int = SAMPLE_RATE) -> np.ndarray:
+# An audio input: the path of a file, or its encoded content as bytes or a binary stream.
+AudioSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+
+def is_audio_source(audio) -> bool:
+    """Whether `audio` is an encoded `AudioSource` rather than decoded samples."""
+    return isinstance(audio, (str, os.PathLike, bytes, bytearray, memoryview)) or hasattr(audio, "read")
+
+
+def _read_source(file: AudioSource) -> Union[str, memoryview]:
+    # Paths are kept as is, in-memory content becomes a byte memoryview without copying it.
+    # Streams are read once here, the decoders may each need to start from the beginning.
+    if isinstance(file, (str, os.PathLike)):
+        return os.fspath(file)
+    if not isinstance(file, (bytes, bytearray, memoryview)):
+        file = file.read()
+    return memoryview(file).cast("B")
+
+
+def _ffmpeg_command(
+    file: Union[str, memoryview], sr: int, mono: bool = True, start: Optional[float] = None, duration: Optional[float] = None
+) -> List[str]:
+    # Decodes to raw s16le on stdout while down-mixing and resampling as necessary.
+    # In-memory content is read from stdin.
+    # Without down-mixing the output is a WAV stream instead, its header carries the channel count.
+    # `start` and `duration` are input options, so ffmpeg seeks instead of decoding up to `start`.
+    # Requires the ffmpeg CLI to be installed.
+    if mono:
+        output = ["-f", "s16le", "-ac", "1"]
+    else:
+        output = ["-f", "wav"]
+    seek = []
+    if start is not None:
+        seek += ["-ss", f"{start:.6f}"]
+    if duration is not None:
+        seek += ["-t", f"{duration:.6f}"]
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-threads",
+        "0",
+        *seek,
+        "-i",
+        file if isinstance(file, str) else "pipe:0",
+        *output,
+        "-acodec",
+        "pcm_s16le",
+        "-ar",
+        str(sr),
+        "-",
+    ]
+
+
+class PCMLayout(NamedTuple):
+    """Location and format of the sample data in a PCM WAV file."""
+    data_offset: int
+    num_frames: int
+    channels: int
+    sample_rate: int
+    bits_per_sample: int
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+RAW_PCM_EXTENSIONS = (".raw", ".pcm")
+# the header of in-memory WAV content is only searched for the data chunk within this prefix
+WAV_HEADER_MAX_BYTES = 1 << 20
+
+
+def _parse_wav_header(f: BinaryIO, total_size: int) -> Optional[PCMLayout]:
+    try:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(chunk_size - 16 + chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+        data_offset = f.tell()
+    except (OSError, struct.error):
+        return None
+
+    if fmt is None:
+        return None
+    format_tag, channels, sample_rate, _, block_align, bits_per_sample = fmt
+    # WAVE_FORMAT_EXTENSIBLE is only accepted for plain 16-bit PCM, its sub-format is not checked
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE) or block_align != channels * bits_per_sample // 8:
+        return None
+    # streamed WAVs may carry a placeholder data size, the actual size is authoritative
+    num_frames = min(chunk_size, total_size - data_offset) // block_align
+    return PCMLayout(data_offset, num_frames, channels, sample_rate, bits_per_sample)
+
+
+def read_wav_layout(file: Union[str, memoryview]) -> Optional[PCMLayout]:
+    """
+    Parse the RIFF header of an integer PCM WAV file, returns None for any other file.
+    """
+    if isinstance(file, memoryview):
+        return _parse_wav_header(io.BytesIO(file[:WAV_HEADER_MAX_BYTES]), file.nbytes)
+    try:
+        with open(file, "rb") as f:
+            return _parse_wav_header(f, os.path.getsize(file))
+    except OSError:
+        return None
+
+
+def decode_pcm_memmap(file: Union[str, memoryview], sr: int, mono: bool = True) -> Optional[np.ndarray]:
+    """
+    Zero-copy decoder for 16-bit PCM WAV files already at `sr` (mono ones, unless `mono` is False),
+    and for headerless .raw/.pcm files which are assumed to be s16le mono at `sr`:
+    the samples are memory-mapped in place, or viewed in place for in-memory WAV content.
+    """
+    if isinstance(file, memoryview):
+        layout = read_wav_layout(file)
+        if layout is None or layout.sample_rate != sr or layout.bits_per_sample != 16:
+            return None
+        if mono and layout.channels != 1:
+            return None
+        samples = np.frombuffer(
+            file, dtype="<i2", count=layout.num_frames * layout.channels, offset=layout.data_offset
+        ).reshape(layout.num_frames, layout.channels)
+        return samples[:, 0] if mono else samples.T
+
+    if os.path.splitext(file)[1].lower() in RAW_PCM_EXTENSIONS:
+        num_frames = os.path.getsize(file) // 2
+        layout = PCMLayout(0, num_frames, 1, sr, 16)
+    else:
+        layout = read_wav_layout(file)
+    if layout is None or layout.sample_rate != sr or layout.bits_per_sample != 16:
+        return None
+    if mono and layout.channels != 1:
+        return None
+    if layout.num_frames == 0:
+        samples = np.zeros((0, layout.channels), dtype=np.int16)
+    else:
+        samples = np.memmap(
+            file, dtype="<i2", mode="r", offset=layout.data_offset, shape=(layout.num_frames, layout.channels)
+        )
+    return samples[:, 0] if mono else samples.T
+
+
+def decode_pyav(file: Union[str, memoryview], sr: int, mono: bool = True) -> Optional[np.ndarray]:
+    """
+    In-process decoder using PyAV (libav* bindings, a dependency of faster-whisper).
+    """
+    if av is None:
+        return None
+    if isinstance(file, memoryview):
+        file = io.BytesIO(file)
+    try:
+        with av.open(file, metadata_errors="ignore") as container:
+            if not container.streams.audio:
+                return None
+            # planar output is (channels, samples), the input channel layout is kept unless down-mixing
+            resampler = av.AudioResampler(format="s16p", layout="mono" if mono else None, rate=sr)
+            frames = []
+            for frame in container.decode(container.streams.audio[0]):
+                frames.extend(resampled.to_ndarray() for resampled in resampler.resample(frame))
+            frames.extend(resampled.to_ndarray() for resampled in resampler.resample(None))
+    except av.error.FFmpegError:
+        return None
+    samples = np.concatenate(frames, axis=1) if frames else np.zeros((1, 0), dtype=np.int16)
+    return samples[0] if mono else samples
+
+
+def decode_ffmpeg(file: Union[str, memoryview], sr: int, mono: bool = True) -> np.ndarray:
+    """
+    Decoder launching an ffmpeg subprocess, handles anything the ffmpeg CLI can read.
+    In-memory content is piped to its stdin, so formats needing to seek (e.g. MP4 with a trailing
+    index) should go through `decode_pyav` instead.
+    """
+    stdin = None if isinstance(file, str) else file
+    try:
+        # Launches a subprocess to decode audio while down-mixing and resampling as necessary.
+        out = subprocess.run(_ffmpeg_command(file, sr, mono=mono), input=stdin, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to load audio: {e.stderr.decode()}") from e
+    if mono:
+        return np.frombuffer(out, np.int16)
+
+    layout = _parse_wav_header(io.BytesIO(out), len(out))
+    if layout is None:
+        raise RuntimeError("Failed to load audio: unexpected ffmpeg output")
+    samples = np.frombuffer(out, np.int16, count=layout.num_frames * layout.channels, offset=layout.data_offset)
+    return samples.reshape(-1, layout.channels).T
+
+
+# Decoders tried in order by `load_audio`. Each one takes (file, sr, mono), where file is a path or
+# the encoded content as a byte memoryview, and returns the int16 samples at `sr`, of shape (samples,)
+# if mono else (channels, samples), or None if it cannot handle the file.
+AUDIO_DECODERS: List[Callable[[Union[str, memoryview], int, bool], Optional[np.ndarray]]] = [
+    decode_pcm_memmap,
+    decode_pyav,
+    decode_ffmpeg,
+]
+
+
+def register_decoder(decoder: Callable[[Union[str, memoryview], int, bool], Optional[np.ndarray]], index: int = 0):
+    """Add a decoder to `AUDIO_DECODERS`, by default ahead of the built-in ones."""
+    AUDIO_DECODERS.insert(index, decoder)
+
+
+def decode_audio(file: AudioSource, sr: int = SAMPLE_RATE, mono: bool = True) -> np.ndarray:
+    """
+    Decode an audio file to int16 samples with the first decoder of `AUDIO_DECODERS` able to read it.
+    The result may be a read-only memory map of the file itself, or a view of in-memory WAV content.
+    """
+    source = _read_source(file)
+    for decoder in AUDIO_DECODERS:
+        samples = decoder(source, sr, mono)
+        if samples is not None:
+            return samples
+    name = source if isinstance(source, str) else f"<{source.nbytes} bytes>"
+    raise RuntimeError(f"Failed to load audio: no decoder could read {name}")
+
+
+def load_audio(file: AudioSource, sr: int = SAMPLE_RATE, mono: bool = True) -> np.ndarray:
     """
     Open an audio file and read as mono waveform, resampling as necessary
 
     Parameters
     ----------
-    file: str
-        The audio file to open
+    file: AudioSource
+        The audio file to open, a path or its encoded content as bytes, memoryview or a binary stream
 
     sr: int
         The sample rate to resample the audio if necessary
 
+    mono: bool
+        If False, every channel is kept instead of being down-mixed, all of them decoded in a single pass
+
     Returns
     -------
     A NumPy array containing the audio waveform, in float32 dtype.
+    Its shape is (samples,), or (channels, samples) if `mono` is False.
+    """
+    return np.asarray(decode_audio(file, sr, mono)).astype(np.float32) / 32768.0
+
+
+def iter_pcm(
+    file: AudioSource,
+    sr: int = SAMPLE_RATE,
+    block_seconds: float = 20 * CHUNK_LENGTH,
+) -> Iterator[Tuple[int, np.ndarray]]:
     """
+    Same as `iter_audio`, but yields the blocks as int16 samples.
+    """
+    block_size = int(block_seconds * sr)
+    if block_size <= 0:
+        raise ValueError("block_seconds must be positive.")
+
+    file = _read_source(file)
+    samples = decode_pcm_memmap(file, sr)
+    if samples is not None:
+        for offset in range(0, samples.shape[0], block_size):
+            yield offset, np.asarray(samples[offset : offset + block_size])
+        return
+
+    # stderr goes to a file rather than a pipe so a chatty ffmpeg can never block on it
+    with tempfile.TemporaryFile() as stderr:
+        stdin = None if isinstance(file, str) else subprocess.PIPE
+        process = subprocess.Popen(_ffmpeg_command(file, sr), stdin=stdin, stdout=subprocess.PIPE, stderr=stderr)
+        if stdin is not None:
+            # fed from another thread, ffmpeg blocks on its stdout until the blocks are consumed
+            threading.Thread(target=_feed_stdin, args=(process.stdin, file), daemon=True).start()
+        try:
+            offset = 0
+            while True:
+                buffer = process.stdout.read(2 * block_size)
+                if not buffer:
+                    break
+                block = np.frombuffer(buffer, np.int16)
+                yield offset, block
+                offset += block.shape[0]
+
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"Failed to load audio: {stderr.read().decode()}")
+        finally:
+            process.stdout.close()
+            # the consumer may stop early, don't leave ffmpeg running in the background
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+def _feed_stdin(stdin: BinaryIO, content: memoryview):
     try:
-        # Launches a subprocess to decode audio while down-mixing and resampling as necessary.
-        # Requires the ffmpeg CLI to be installed.
-        cmd = [
-            "ffmpeg",
-            "-nostdin",
-            "-threads",
-            "0",
-            "-i",
-            file,
-            "-f",
-            "s16le",
-            "-ac",
-            "1",
-            "-acodec",
-            "pcm_s16le",
-            "-ar",
-            str(sr),
-            "-",
-        ]
-        out = subprocess.run(cmd, capture_output=True, check=True).stdout
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to load audio: {e.stderr.decode()}") from e
+        stdin.write(content)
+        stdin.close()
+    except (BrokenPipeError, ValueError):
+        # ffmpeg exited or was killed early, its exit status is reported by the reader
+        pass
+
+
+def iter_audio(
+    file: AudioSource,
+    sr: int = SAMPLE_RATE,
+    block_seconds: float = 20 * CHUNK_LENGTH,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Open an audio file and read it incrementally as mono waveform blocks, resampling as necessary.
+    Only one block is held in memory at a time, so peak memory does not depend on the input length.
+    The blocks follow on from each other, `FasterWhisperPipeline.transcribe` accepts them and
+    transcribes speech crossing their boundaries whole.
+
+    Parameters
+    ----------
+    file: AudioSource
+        The audio file to open, a path or its encoded content as bytes, memoryview or a binary stream
+
+    sr: int
+        The sample rate to resample the audio if necessary
+
+    block_seconds: float
+        The duration of each yielded block, the last block may be shorter
+
+    Yields
+    ------
+    (offset, block): Tuple[int, np.ndarray]
+        The offset of the block's first sample in the whole waveform, and the block itself in float32 dtype.
+    """
+    for offset, block in iter_pcm(file, sr=sr, block_seconds=block_seconds):
+        yield offset, block.astype(np.float32) / 32768.0
+
+
+class PCMAudio:
+    """
+    Mono waveform kept as int16 samples, half the size of the float32 array returned by `load_audio`.
+    float32 samples are only produced for the range being processed, e.g. one VAD chunk or one alignment window.
+    `FasterWhisperPipeline.transcribe`, `align` and `DiarizationPipeline` accept it in place of a float32 array.
+
+    Parameters
+    ----------
+    samples: np.ndarray
+        The int16 samples, possibly a memory map
+
+    sample_rate: int
+        The sample rate of the samples
+    """
+
+    def __init__(self, samples: np.ndarray, sample_rate: int = SAMPLE_RATE):
+        if samples.dtype != np.int16:
+            raise ValueError(f"Expected int16 samples, got {samples.dtype}")
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_file(cls, file: AudioSource, sr: int = SAMPLE_RATE) -> "PCMAudio":
+        """Decode an audio file, see `decode_audio`."""
+        return cls(decode_audio(file, sr), sr)
+
+    @classmethod
+    def channels_from_file(cls, file: AudioSource, sr: int = SAMPLE_RATE) -> List["PCMAudio"]:
+        """Decode every channel of an audio file in a single pass, see `decode_audio`."""
+        return [cls(channel, sr) for channel in decode_audio(file, sr, mono=False)]
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return self.samples.shape
+
+    @property
+    def duration(self) -> float:
+        return self.samples.shape[0] / self.sample_rate
+
+    def __len__(self) -> int:
+        return self.samples.shape[0]
+
+    def __getitem__(self, index: slice) -> np.ndarray:
+        """float32 samples of a range, indexed in samples."""
+        return np.asarray(self.samples[index]).astype(np.float32) / 32768.0
+
+    def crop(self, start: float, end: float) -> np.ndarray:
+        """float32 samples between `start` and `end`, in seconds."""
+        return self[int(start * self.sample_rate) : int(end * self.sample_rate)]
+
+    def to_float32(self) -> np.ndarray:
+        """float32 copy of the whole waveform, as returned by `load_audio`."""
+        return self[:]
+
+
+class AudioReader:
+    """
+    Seekable mono audio file, only the requested time ranges are decoded.
+    Conforming PCM WAV files are sliced in place (see `decode_pcm_memmap`),
+    anything else is decoded range by range by an ffmpeg subprocess seeking to the range start.
+    It has the same `crop` interface as `PCMAudio`, and `align` accepts it in place of a waveform.
 
-    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+    Parameters
+    ----------
+    file: str
+        The audio file to open
+
+    sr: int
+        The sample rate to resample the audio if necessary
+    """
+
+    def __init__(self, file: str, sr: int = SAMPLE_RATE):
+        self.file = file
+        self.sample_rate = sr
+        samples = decode_pcm_memmap(file, sr)
+        self._audio = PCMAudio(samples, sr) if samples is not None else None
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds, inf if it cannot be known without decoding the whole file."""
+        if self._audio is not None:
+            return self._audio.duration
+        if av is not None:
+            try:
+                with av.open(self.file, metadata_errors="ignore") as container:
+                    if container.duration is not None:
+                        return container.duration / av.time_base
+            except av.error.FFmpegError:
+                pass
+        return float("inf")
+
+    def crop(self, start: float, end: float) -> np.ndarray:
+        """float32 samples between `start` and `end`, in seconds."""
+        if self._audio is not None:
+            return self._audio.crop(start, end)
+        start = max(start, 0.0)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        cmd = _ffmpeg_command(self.file, self.sample_rate, start=start, duration=end - start)
+        try:
+            out = subprocess.run(cmd, capture_output=True, check=True).stdout
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Failed to load audio: {e.stderr.decode()}") from e
+        return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+    def iter_ranges(self, ranges: List[Tuple[float, float]]) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Decode each (start, end) range in seconds, yielding blocks in the format of `iter_audio`,
+        which `FasterWhisperPipeline.transcribe` accepts.
+        """
+        for start, end in ranges:
+            yield int(start * self.sample_rate), self.crop(start, end)
 
 
 def pad_or_trim(array, length: int = N_SAMPLES, *, axis: int = -1):
@@ -157,3 +569,74 @@ def log_mel_spectrogram(
     log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
     log_spec = (log_spec + 4.0) / 4.0
     return log_spec
+
+
+class MelFrontend:
+    """
+    Batched log-Mel spectrogram of encoder inputs, equivalent to padding each waveform to N_SAMPLES
+    and calling `log_mel_spectrogram` on it.
+
+    The Hann window and the Mel filterbank are cached per device, the whole batch goes through a single STFT,
+    and the frames that only cover the zero padding are filled with the log-Mel of silence instead of being computed.
+
+    Parameters
+    ----------
+    n_mels: int
+        The number of Mel-frequency filters, 80 or 128
+
+    device: Optional[Union[str, torch.device]]
+        If given, the audio is moved to this device before STFT
+    """
+
+    def __init__(self, n_mels: int = 80, device: Optional[Union[str, torch.device]] = None):
+        self.n_mels = n_mels
+        self.device = device
+        self._windows = {}
+
+    def window(self, device: torch.device) -> torch.Tensor:
+        if device not in self._windows:
+            self._windows[device] = torch.hann_window(N_FFT).to(device)
+        return self._windows[device]
+
+    def __call__(self, audios: List[Union[np.ndarray, torch.Tensor]]) -> torch.Tensor:
+        """
+        Compute the log-Mel spectrogram of a batch of waveforms
+
+        Parameters
+        ----------
+        audios: List[Union[np.ndarray, torch.Tensor]]
+            The waveforms in 16 kHz, each one up to N_SAMPLES long (longer ones are trimmed)
+
+        Returns
+        -------
+        torch.Tensor, shape = (batch, n_mels, N_FRAMES)
+            A Tensor that contains the Mel spectrograms
+        """
+        audios = [(audio if torch.is_tensor(audio) else torch.from_numpy(audio))[:N_SAMPLES] for audio in audios]
+        device = torch.device(self.device) if self.device is not None else audios[0].device
+
+        # frame t is centered on sample t * HOP_LENGTH and spans N_FFT samples, only the frames
+        # overlapping some audio are computed, the audio is zero padded just enough for them to be exact
+        longest = max(audio.shape[-1] for audio in audios)
+        n_active = min(N_FRAMES, -(-(longest + N_FFT // 2) // HOP_LENGTH))
+        n_samples = min(N_SAMPLES, n_active * HOP_LENGTH + N_FFT // 2)
+
+        batch = torch.zeros(len(audios), n_samples, dtype=torch.float32)
+        for i, audio in enumerate(audios):
+            batch[i, : audio.shape[-1]] = audio
+        batch = batch.to(device)
+
+        stft = torch.stft(batch, N_FFT, HOP_LENGTH, window=self.window(device), return_complex=True)
+        magnitudes = stft[..., :n_active].abs() ** 2
+
+        filters = mel_filters(device, self.n_mels)
+        mel_spec = filters @ magnitudes
+
+        log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+        if n_active < N_FRAMES:
+            # log-Mel of the all-zero frames, before the dynamic range clamp below
+            silence = log_spec.new_full((len(audios), self.n_mels, N_FRAMES - n_active), -10.0)
+            log_spec = torch.cat([log_spec, silence], dim=-1)
+        log_spec = torch.maximum(log_spec, log_spec.amax(dim=(1, 2), keepdim=True) - 8.0)
+        log_spec = (log_spec + 4.0) / 4.0
+        return log_spec
@@ -0,0 +1,219 @@
+import mmap
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+
+from .audio import HOP_LENGTH, N_SAMPLES, MelFrontend, PCMAudio
+
+# chunks sorted together by `length_sorted_batches` in `FasterWhisperPipeline.transcribe`, in batches
+SORT_WINDOW_BATCHES = 8
+
+
+def length_sorted_batches(durations: Sequence[float],
+                          speech: Optional[Sequence[float]] = None,
+                          batch_size: Optional[int] = None,
+                          max_batch_seconds: Optional[float] = None,
+                          window: Optional[int] = None,
+                          sort: bool = True,
+                          ) -> List[List[int]]:
+    """
+    Group chunks of similar length into batches, so that a long chunk does not hold back a batch of short ones:
+    padding to the longest input and decoding until the longest transcript both cost the whole batch.
+
+    Chunks are sorted by decreasing duration, then by decreasing speech duration as the number of
+    tokens to decode grows with it, and filled into batches of at most `batch_size` chunks and
+    `max_batch_seconds` of audio in total. With `window`, only chunks within consecutive windows of that
+    many chunks are sorted together, so that the results of the first chunks are not held back until
+    the last ones are decoded when they are consumed in timeline order (see `in_order`).
+
+    Parameters
+    ----------
+    durations: Sequence[float]
+        The duration of every chunk in seconds, in timeline order
+
+    speech: Optional[Sequence[float]]
+        The duration of the speech in every chunk in seconds, defaults to `durations`
+
+    batch_size: Optional[int]
+        The maximum number of chunks in a batch, unbounded if None and `max_batch_seconds` is given, 1 otherwise
+
+    max_batch_seconds: Optional[float]
+        The maximum total duration of the chunks in a batch, a chunk longer than that is a batch of its own
+
+    window: Optional[int]
+        The number of consecutive chunks sorted together, all of them if None
+
+    sort: bool
+        If False, the chunks are not sorted and batches follow the timeline, only capped as above
+
+    Returns
+    -------
+    List[List[int]]
+        The indices of the chunks in every batch, in the order the batches should run
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    speech = durations if speech is None else np.asarray(speech, dtype=np.float64)
+    if not batch_size:
+        batch_size = None if max_batch_seconds is not None else 1
+    window = (window if sort else None) or max(len(durations), 1)
+
+    batches = []
+    for lo in range(0, len(durations), window):
+        hi = min(lo + window, len(durations))
+        # np.lexsort sorts by the last key first, both decreasing, ties kept in timeline order
+        order = lo + np.lexsort((-speech[lo:hi], -durations[lo:hi])) if sort else np.arange(lo, hi)
+        batch, total = [], 0.0
+        for i in order.tolist():
+            full = batch_size is not None and len(batch) >= batch_size
+            too_long = max_batch_seconds is not None and total + durations[i] > max_batch_seconds
+            if batch and (full or too_long):
+                batches.append(batch)
+                batch, total = [], 0.0
+            batch.append(i)
+            total += durations[i]
+        if batch:
+            batches.append(batch)
+    return batches
+
+
+def in_order(results: Iterable[Tuple[int, Any]]) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (index, result) pairs produced in any order by index 0, 1, 2..., each as soon as all the previous ones are.
+    """
+    pending: Dict[int, Any] = {}
+    next_index = 0
+    for index, result in results:
+        pending[index] = result
+        while next_index in pending:
+            yield next_index, pending.pop(next_index)
+            next_index += 1
+    # indices missing from the results
+    for index in sorted(pending):
+        yield index, pending.pop(index)
+
+
+def share_samples(audio: Union[np.ndarray, PCMAudio]) -> Union[np.ndarray, torch.Tensor]:
+    """
+    The samples of `audio` for DataLoader workers: memory maps as they are, as every process maps the
+    same file pages, otherwise copied once into shared memory, int16 for a `PCMAudio` and float32 otherwise.
+    """
+    samples = audio.samples if isinstance(audio, PCMAudio) else audio
+    if isinstance(samples, np.memmap):
+        return samples
+    samples = np.asarray(samples, dtype=np.int16 if isinstance(audio, PCMAudio) else np.float32)
+    shared = torch.empty(samples.shape, dtype=torch.int16 if samples.dtype == np.int16 else torch.float32).share_memory_()
+    shared.numpy()[:] = samples
+    return shared
+
+
+def _map_view(filename: str, offset: int, length: int, dtype: np.dtype, stride: int) -> np.ndarray:
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    span = (length - 1) * stride + dtype.itemsize
+    return np.ndarray((length,), dtype=dtype, buffer=np.memmap(filename, dtype=np.uint8, mode="r", offset=offset, shape=(span,)),
+                      strides=(stride,))
+
+
+def _reduce_view(samples: np.memmap) -> Tuple[Callable, tuple]:
+    # a pickled np.memmap holds a copy of its samples, a spawned worker maps the file again instead:
+    # the view starts where its first sample is in the mapping, which starts at the file offset the
+    # memmap was opened with, rounded down to the allocation granularity
+    mapping = np.frombuffer(samples._mmap, dtype=np.uint8)
+    position = samples.offset - samples.offset % mmap.ALLOCATIONGRANULARITY
+    position += samples.__array_interface__["data"][0] - mapping.__array_interface__["data"][0]
+    return _map_view, (samples.filename, position, len(samples), samples.dtype, samples.strides[0])
+
+
+def trim_chunk(item: dict) -> dict:
+    """The preprocessing of a chunk for the Whisper encoder, which sees up to N_SAMPLES of it."""
+    return {'inputs': item['inputs'][:N_SAMPLES]}
+
+
+def chunk_inputs(item: dict) -> Any:
+    """The preprocessing of a chunk for a model taking the waveform itself."""
+    return item['inputs']
+
+
+class MelCollate:
+    """
+    Collate the chunks of a batch into the log-Mel spectrograms of the Whisper encoder with a `MelFrontend`,
+    along with the number of frames of audio in each one. Only `n_mels` is pickled for DataLoader workers.
+    """
+
+    def __init__(self, n_mels: int = 80):
+        self.n_mels = n_mels
+        self.mel_frontend = MelFrontend(n_mels)
+
+    def __reduce__(self):
+        return MelCollate, (self.n_mels,)
+
+    def __call__(self, items: List[dict]) -> dict:
+        # frames of audio in each input, the rest of its 30s window is padding
+        num_frames = [min(len(x['inputs']), N_SAMPLES) // HOP_LENGTH for x in items]
+        return {'inputs': self.mel_frontend([x['inputs'] for x in items]), 'num_frames': num_frames}
+
+
+class ChunkDataset(torch.utils.data.Dataset):
+    """
+    The chunks of the channels of an audio as a map-style dataset, for a DataLoader batching them with a `batch_sampler`.
+
+    With `shared`, DataLoader workers receive the sample offsets of the chunks, not a copy of the audio each,
+    so they can compute the encoder inputs while the model decodes the previous batch: forked workers share
+    the memory of this process, spawned ones get the channels in shared memory (see `share_samples`) or map
+    the same file again. Chunks of a `PCMAudio` stay int16 until they are read. Pass module-level callables
+    like `trim_chunk` and `MelCollate`, not methods of a pipeline, which would be pickled with its model.
+
+    Parameters
+    ----------
+    channels: List[Union[np.ndarray, PCMAudio]]
+        The waveform of every channel in 16 kHz
+
+    bounds: List[Tuple[int, int, int]]
+        The channel, start and end sample of every chunk
+
+    preprocess: Optional[Callable[[dict], Any]]
+        Applied to {'inputs': chunk} for every float32 chunk, e.g. `trim_chunk`
+
+    shared: bool
+        Prepare the channels for DataLoader workers
+    """
+
+    def __init__(self,
+                 channels: List[Union[np.ndarray, PCMAudio]],
+                 bounds: List[Tuple[int, int, int]],
+                 preprocess: Optional[Callable[[dict], Any]] = None,
+                 shared: bool = False):
+        if shared and torch.multiprocessing.get_start_method() != "fork":
+            self.channels = [share_samples(channel) for channel in channels]
+        else:
+            self.channels = [channel.samples if isinstance(channel, PCMAudio) else channel for channel in channels]
+        self.bounds = bounds
+        self.preprocess = preprocess
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state['channels'] = [_reduce_view(channel) if isinstance(channel, np.memmap) and channel._mmap is not None
+                             else channel for channel in self.channels]
+        return state
+
+    def __setstate__(self, state: dict):
+        state['channels'] = [channel[0](*channel[1]) if isinstance(channel, tuple) else channel
+                             for channel in state['channels']]
+        self.__dict__.update(state)
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    def __getitem__(self, index: int) -> Any:
+        channel, start, end = self.bounds[index]
+        chunk = self.channels[channel][start:end]
+        if isinstance(chunk, np.ndarray) and chunk.dtype == np.int16:
+            # converted straight from the samples, which may be a read-only memory map
+            chunk = torch.from_numpy(chunk.astype(np.float32) / 32768.0)
+        elif isinstance(chunk, np.ndarray):
+            chunk = torch.from_numpy(chunk)
+        if chunk.dtype == torch.int16:
+            chunk = chunk.float() / 32768.0
+        item = {'inputs': chunk}
+        return self.preprocess(item) if self.preprocess is not None else item
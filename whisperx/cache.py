@@ -0,0 +1,272 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .audio import SAMPLE_RATE, PCMAudio, decode_audio, decode_pcm_memmap
+
+
+def default_cache_dir(name: str) -> str:
+    cache_home = os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "whisperx", name)
+
+
+# content digests of the files already hashed by this process, keyed by (path, mtime, size)
+_file_digests: Dict[Tuple[str, int, int], str] = {}
+
+
+def file_digest(file: str, block_size: int = 1 << 20) -> str:
+    """sha256 of a file's content, each file is hashed at most once per process while unchanged."""
+    stat = os.stat(file)
+    key = (os.path.abspath(file), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        sha = hashlib.sha256()
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(block_size), b""):
+                sha.update(chunk)
+        _file_digests[key] = sha.hexdigest()
+    return _file_digests[key]
+
+
+def array_digest(array: np.ndarray, block_size: int = 1 << 20) -> str:
+    """sha256 of an array's dtype, shape and samples, read block by block so memory maps are not loaded at once."""
+    sha = hashlib.sha256(f"{array.dtype.str}{array.shape}".encode())
+    flat = array.reshape(-1)
+    step = max(1, block_size // array.itemsize)
+    for i in range(0, flat.shape[0], step):
+        sha.update(np.ascontiguousarray(flat[i : i + step]).data)
+    return sha.hexdigest()
+
+
+class LRUDirectory:
+    """
+    A directory of cache entries bounded in total size, the least recently used entries are evicted first.
+    Usage is tracked with each entry's mtime, so it is shared by every process using the same directory.
+
+    Parameters
+    ----------
+    cache_dir: str
+        The directory holding the entries, created if missing
+
+    max_bytes: Optional[int]
+        The total size the entries may take on disk, unbounded if None
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def lookup(self, name: str) -> Optional[str]:
+        """Path of an existing entry, marking it as recently used."""
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    @contextmanager
+    def create(self, name: str) -> Iterator[BinaryIO]:
+        """
+        Write a new entry through a temporary file, published atomically once fully written,
+        then enforce the size limit.
+        """
+        path = self.path(name)
+        # a unique temporary file, as other threads and processes may be writing the same entry
+        tmp = tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=f"{name}.", suffix=".tmp", delete=False)
+        try:
+            with tmp as f:
+                yield f
+            os.replace(tmp.name, path)
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+        self.evict(keep=(path,))
+
+    def evict(self, keep: Iterable[str] = ()):
+        if self.max_bytes is None:
+            return
+        keep = set(keep)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class DecodedAudioCache:
+    """
+    On-disk cache of decoded mono int16 PCM, keyed by the content of the source file and the sample rate.
+    Entries are opened with `np.memmap`, so every pipeline stage reading the same file shares
+    one decode and the pages of one file instead of holding its own copy of the waveform.
+
+    Parameters
+    ----------
+    cache_dir: Optional[str]
+        The directory holding the decoded audio, defaults to ~/.cache/whisperx/audio
+
+    max_bytes: Optional[int]
+        The size limit of the cache, least recently used entries are evicted beyond it
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = 10 * 1024**3):
+        self.entries = LRUDirectory(cache_dir or default_cache_dir("audio"), max_bytes)
+
+    def load(self, file: str, sr: int = SAMPLE_RATE) -> PCMAudio:
+        """
+        Open an audio file as mono waveform, decoding it only if it is not cached yet
+
+        Parameters
+        ----------
+        file: str
+            The audio file to open
+
+        sr: int
+            The sample rate to resample the audio if necessary
+
+        Returns
+        -------
+        The audio waveform, backed by a memory map of the cached int16 samples, or of the file itself
+        for a WAV file already in that format.
+        """
+        # already shared by every stage mapping it, copying it would only add a write of the whole file
+        samples = decode_pcm_memmap(file, sr)
+        if samples is not None:
+            return PCMAudio(samples, sr)
+
+        name = f"{file_digest(file)}-{sr}.s16"
+        if self.entries.lookup(name) is None:
+            with self.entries.create(name) as f:
+                # in-process decoding first (see `AUDIO_DECODERS`), ffmpeg only for what PyAV cannot read
+                f.write(np.ascontiguousarray(decode_audio(file, sr)).tobytes())
+
+        path = self.entries.path(name)
+        if os.path.getsize(path) < 2:
+            return PCMAudio(np.zeros(0, dtype=np.int16), sr)
+        return PCMAudio(np.memmap(path, dtype=np.int16, mode="r"), sr)
+
+    def load_channels(self, file: str, sr: int = SAMPLE_RATE) -> List[PCMAudio]:
+        """
+        Same as `load`, but every channel is kept instead of being down-mixed.
+        """
+        samples = decode_pcm_memmap(file, sr, mono=False)
+        if samples is not None:
+            return [PCMAudio(channel, sr) for channel in samples]
+
+        name = f"{file_digest(file)}-{sr}-channels.npy"
+        if self.entries.lookup(name) is None:
+            with self.entries.create(name) as f:
+                np.save(f, np.ascontiguousarray(decode_audio(file, sr, mono=False)))
+
+        samples = np.load(self.entries.path(name), mmap_mode="r")
+        return [PCMAudio(channel, sr) for channel in samples]
+
+
+class VadScoreCache:
+    """
+    On-disk cache of the raw output of a VAD model, keyed by the audio samples and the model's `cache_key`.
+    The outputs are frame scores for the VADs setting a `cache_key`, binarization and chunking
+    (`merge_chunks`) run again on every call, so their parameters can be tuned without re-running the model.
+
+    Parameters
+    ----------
+    cache_dir: Optional[str]
+        The directory holding the scores, defaults to ~/.cache/whisperx/vad
+
+    max_bytes: Optional[int]
+        The size limit of the cache, least recently used entries are evicted beyond it
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = 1024**3):
+        self.entries = LRUDirectory(cache_dir or default_cache_dir("vad"), max_bytes)
+
+    def load(self, cache_key: str, samples: np.ndarray, compute: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """
+        The VAD output for `samples`, from the cache or else from `compute()`, whose result is then cached
+
+        Parameters
+        ----------
+        cache_key: str
+            Identifies the VAD model and any parameter its output depends on
+
+        samples: np.ndarray
+            The audio given to the VAD, only used for its digest
+
+        compute: Callable[[], Dict[str, np.ndarray]]
+            Runs the VAD, its output as arrays (see `scores_to_arrays`), which are stored without pickling
+        """
+        key = hashlib.sha256(cache_key.encode()).hexdigest()[:16]
+        name = f"{array_digest(samples)}-{key}.npz"
+        if self.entries.lookup(name) is not None:
+            try:
+                with np.load(self.entries.path(name)) as entry:
+                    return {key: entry[key] for key in entry.files}
+            except (OSError, ValueError, zipfile.BadZipFile):
+                # evicted by another process in the meantime, or unreadable: compute it again
+                pass
+
+        scores = compute()
+        with self.entries.create(name) as f:
+            np.savez(f, **scores)
+        return scores
+
+
+class TokenClassCache:
+    """
+    On-disk cache of the token classes of a tokenizer vocabulary (see `TokenClassIndex`), keyed by the vocabulary,
+    as finding them decodes every token of the vocabulary.
+
+    Parameters
+    ----------
+    cache_dir: Optional[str]
+        The directory holding the token classes, defaults to ~/.cache/whisperx/tokens
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.entries = LRUDirectory(cache_dir or default_cache_dir("tokens"))
+
+    def load(self, vocabulary: str, compute: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """
+        The token ids of every class for `vocabulary`, from the cache or else from `compute()`, whose result is then cached
+
+        Parameters
+        ----------
+        vocabulary: str
+            The serialized tokenizer, only used for its digest
+
+        compute: Callable[[], Dict[str, np.ndarray]]
+            Finds the token ids of every class
+        """
+        name = f"{hashlib.sha256(vocabulary.encode()).hexdigest()}.npz"
+        if self.entries.lookup(name) is not None:
+            try:
+                with np.load(self.entries.path(name)) as entry:
+                    return {key: entry[key] for key in entry.files}
+            except (OSError, ValueError, zipfile.BadZipFile):
+                # evicted by another process in the meantime, or unreadable: compute it again
+                pass
+
+        classes = compute()
+        with self.entries.create(name) as f:
+            np.savez(f, **classes)
+        return classes
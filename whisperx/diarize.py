@@ -1,12 +1,17 @@
 import numpy as np
 import pandas as pd
 from pyannote.audio import Pipeline
-from typing import Optional, Union
+from pyannote.core import Segment as PyannoteSegment
+from pyannote.core import SlidingWindowFeature
+from typing import Optional, Tuple, Union
 import torch
 
-from .audio import load_audio, SAMPLE_RATE
+from .audio import load_audio, AudioReader, PCMAudio, SAMPLE_RATE
 from .types import TranscriptionResult, AlignedTranscriptionResult
 
+# key of the file given to the pyannote pipeline holding precomputed segmentations
+PRECOMPUTED_SEGMENTATIONS = "whisperx_segmentations"
+
 
 class DiarizationPipeline:
     def __init__(
@@ -19,26 +24,67 @@ class DiarizationPipeline:
             device = torch.device(device)
         self.model = Pipeline.from_pretrained(model_name, use_auth_token=use_auth_token).to(device)
 
+        # skip the segmentation model when its output comes with the file
+        get_segmentations = self.model.get_segmentations
+
+        def precomputed_segmentations(file, hook=None):
+            if PRECOMPUTED_SEGMENTATIONS in file:
+                return file[PRECOMPUTED_SEGMENTATIONS]
+            return get_segmentations(file, hook=hook)
+
+        self.model.get_segmentations = precomputed_segmentations
+
     def __call__(
         self,
-        audio: Union[str, np.ndarray],
+        audio: Union[str, np.ndarray, PCMAudio, AudioReader],
         num_speakers: Optional[int] = None,
         min_speakers: Optional[int] = None,
         max_speakers: Optional[int] = None,
+        time_range: Optional[Tuple[float, float]] = None,
+        segmentations: Optional[SlidingWindowFeature] = None,
     ):
-        if isinstance(audio, str):
+        """
+        If `time_range` is given, only the audio between its (start, end) seconds is diarized,
+        the returned times are still relative to the start of the whole audio.
+        `segmentations` is the output of the pipeline's segmentation model for the same audio, e.g. kept
+        by `whisperx.vads.SegmentationVad` during VAD, the model is then not run again.
+        """
+        if segmentations is not None and time_range is not None:
+            raise ValueError("segmentations are computed on the whole audio, not on a time_range")
+        if time_range is not None:
+            if isinstance(audio, str):
+                audio = AudioReader(audio)
+            if isinstance(audio, np.ndarray):
+                audio = audio[int(time_range[0] * SAMPLE_RATE) : int(time_range[1] * SAMPLE_RATE)]
+            else:
+                audio = audio.crop(*time_range)
+        elif isinstance(audio, str):
             audio = load_audio(audio)
+        elif isinstance(audio, PCMAudio):
+            # pyannote needs the whole waveform, the float32 copy only lives for this call
+            audio = audio.to_float32()
+        elif isinstance(audio, AudioReader):
+            audio = audio.crop(0.0, audio.duration)
         audio_data = {
             'waveform': torch.from_numpy(audio[None, :]),
             'sample_rate': SAMPLE_RATE
         }
+        if segmentations is not None:
+            audio_data[PRECOMPUTED_SEGMENTATIONS] = segmentations
         segments = self.model(audio_data, num_speakers = num_speakers, min_speakers=min_speakers, max_speakers=max_speakers)
         diarize_df = pd.DataFrame(segments.itertracks(yield_label=True), columns=['segment', 'label', 'speaker'])
+        if time_range is not None:
+            diarize_df['segment'] = diarize_df['segment'].apply(lambda x: PyannoteSegment(x.start + time_range[0], x.end + time_range[0]))
         diarize_df['start'] = diarize_df['segment'].apply(lambda x: x.start)
         diarize_df['end'] = diarize_df['segment'].apply(lambda x: x.end)
         return diarize_df
 
 
+def channel_speaker(channel: int) -> str:
+    """Speaker label of the audio channel `channel`, in the same format as the diarization labels."""
+    return f"SPEAKER_{channel:02d}"
+
+
 def assign_word_speakers(
     diarize_df: pd.DataFrame,
     transcript_result: Union[AlignedTranscriptionResult, TranscriptionResult],
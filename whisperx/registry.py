@@ -0,0 +1,75 @@
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+
+class ModelRegistry:
+    """
+    Process-wide store of loaded models, so that pipelines built with the same models share a single copy.
+    Each model is loaded on first use and reference-counted: it is dropped once no user holds it anymore.
+
+    Keys identify everything the loaded object depends on, e.g. ("whisper", name, device, compute_type).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> [model, reference count, lock serializing its loading]
+        self._entries: Dict[Hashable, List[Any]] = {}
+
+    def acquire(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """The model stored under `key`, loaded with `loader()` if needed. Each call must be paired with a `release`."""
+        with self._lock:
+            entry = self._entries.setdefault(key, [None, 0, threading.Lock()])
+            entry[1] += 1
+        try:
+            # other models can be acquired meanwhile, only the users of this key wait for it to load
+            with entry[2]:
+                if entry[0] is None:
+                    entry[0] = loader()
+        except BaseException:
+            self.release(key)
+            raise
+        return entry[0]
+
+    def release(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._entries[key]
+
+    def loaded(self) -> List[Tuple[Hashable, int]]:
+        """The keys of the loaded models, with their reference count."""
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items() if entry[0] is not None]
+
+
+def _release_all(registry: ModelRegistry, keys: List[Hashable]):
+    for key in keys:
+        registry.release(key)
+
+
+class ModelLease:
+    """
+    The models one user acquired from a registry, all released once the lease is closed or garbage collected.
+    A pipeline keeps its lease as an attribute, so the models are released along with the pipeline.
+    """
+
+    def __init__(self, registry: ModelRegistry):
+        self.registry = registry
+        self.keys: List[Hashable] = []
+        self._finalizer = weakref.finalize(self, _release_all, registry, self.keys)
+
+    def acquire(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        model = self.registry.acquire(key, loader)
+        self.keys.append(key)
+        return model
+
+    def close(self):
+        self._finalizer()
+
+
+# the registry `load_model` shares its models through
+MODEL_REGISTRY = ModelRegistry()
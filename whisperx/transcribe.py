@@ -1,22 +1,27 @@
 import argparse
 import gc
 import os
+import tempfile
 import warnings
 
 import numpy as np
+import pandas as pd
 import torch
 
-from .alignment import align, load_align_model
+from .alignment import align, align_channels, load_align_model
 from .asr import load_model
-from .audio import load_audio
+from .audio import AudioReader
+from .cache import DecodedAudioCache, VadScoreCache
 from .diarize import DiarizationPipeline, assign_word_speakers
 from .types import AlignedTranscriptionResult, TranscriptionResult
+from .vads import SegmentationVad
 from .utils import (
     LANGUAGES,
     TO_LANGUAGE_CODE,
     get_writer,
     optional_float,
     optional_int,
+    parse_time_ranges,
     str2bool,
 )
 
@@ -31,6 +36,9 @@ def cli():
     parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu", help="device to use for PyTorch inference")
     parser.add_argument("--device_index", default=0, type=int, help="device index to use for FasterWhisper inference")
     parser.add_argument("--batch_size", default=8, type=int, help="the preferred batch size for inference")
+    parser.add_argument("--num_workers", default=0, type=int, help="number of DataLoader workers computing the encoder inputs while the model decodes, they share the audio in memory")
+    parser.add_argument("--sort_batches", type=str2bool, default=True, help="batch chunks of similar length together, results keep their timeline order")
+    parser.add_argument("--max_batch_seconds", type=optional_float, default=None, help="cap the total audio of a batch in seconds, on top of --batch_size")
     parser.add_argument("--compute_type", default="float16", type=str, choices=["float16", "float32", "int8"], help="compute type for computation")
 
     parser.add_argument("--output_dir", "-o", type=str, default=".", help="directory to save the outputs")
@@ -38,23 +46,32 @@ def cli():
     parser.add_argument("--verbose", type=str2bool, default=True, help="whether to print out the progress and debug messages")
 
     parser.add_argument("--task", type=str, default="transcribe", choices=["transcribe", "translate"], help="whether to perform X->X speech recognition ('transcribe') or X->English translation ('translate')")
+    parser.add_argument("--chunk_languages", type=str, default=None, help="detect the language of every VAD chunk, among these comma-separated languages (e.g. 'vi,en') or 'all', for code-switched audio; segments then have a 'language'")
     parser.add_argument("--language", type=str, default='vi', choices=sorted(LANGUAGES.keys()) + sorted([k.title() for k in TO_LANGUAGE_CODE.keys()]), help="language spoken in the audio, specify None to perform language detection")
 
     # alignment params
     parser.add_argument("--align_model", default=None, help="Name of phoneme-level ASR model to do alignment")
     parser.add_argument("--interpolate_method", default="nearest", choices=["nearest", "linear", "ignore"], help="For word .srt, method to assign timestamps to non-aligned words, or merge them into neighbouring.")
     parser.add_argument("--no_align", action='store_true', help="Do not perform phoneme alignment")
+    parser.add_argument("--word_timestamps", type=str2bool, default=False, help="time words with the cross-attention of the Whisper decoder instead of a phoneme alignment model, within about 100ms, no alignment model is loaded")
     parser.add_argument("--return_char_alignments", action='store_true', help="Return character-level alignments in the output json file")
 
     # vad params
+    parser.add_argument("--vad_method", type=str, default="pyannote", choices=["pyannote", "silero", "silero_onnx", "energy", "segmentation"], help="VAD backend; 'energy' needs no model and suits clean recordings, 'segmentation' uses the segmentation model of the diarization pipeline, which --diarize then does not run again")
     parser.add_argument("--vad_onset", type=float, default=0.8, help="Onset threshold for VAD (see pyannote.audio), reduce this if speech is not being detected")
     parser.add_argument("--vad_offset", type=float, default=0.5, help="Offset threshold for VAD (see pyannote.audio), reduce this if speech is not being detected.")
     parser.add_argument("--chunk_size", type=int, default=30, help="Chunk size for merging VAD segments. Default is 30, reduce this if the chunk is too long.")
+    parser.add_argument("--chunk_strategy", type=str, default="greedy", choices=["greedy", "balanced"], help="how VAD segments are packed into chunks: 'balanced' splits at silences so chunks are fuller, for fewer encoder passes")
+    parser.add_argument("--vad_cascade", type=str2bool, default=False, help="skip the clearly silent parts of the audio with an energy gate before running the VAD model, faster on sparse recordings")
+    parser.add_argument("--vad_workers", type=int, default=0, help="number of processes running VAD on shards of long audio, 0 runs it in a single pass")
+    parser.add_argument("--vad_fast", type=str2bool, default=False, help="pyannote VAD only: score coarse chunks first, then refine the scores around speech boundaries")
+    parser.add_argument("--vad_cache_dir", type=str, default=None, help="directory caching the VAD scores of each input, so runs with other --vad_onset, --vad_offset or --chunk_size skip the VAD model")
 
     # diarization params
     parser.add_argument("--diarize", action="store_true", help="Apply diarization to assign speaker labels to each segment/word")
     parser.add_argument("--min_speakers", default=None, type=int, help="Minimum number of speakers to in audio file")
     parser.add_argument("--max_speakers", default=None, type=int, help="Maximum number of speakers to in audio file")
+    parser.add_argument("--split_channels", action="store_true", help="Transcribe each audio channel separately and label segments with the speaker of their channel, e.g. for call recordings with one speaker per channel (replaces --diarize)")
 
     parser.add_argument("--temperature", type=float, default=0, help="temperature to use for sampling")
     parser.add_argument("--best_of", type=optional_int, default=5, help="number of candidates when sampling with non-zero temperature")
@@ -84,11 +101,24 @@ def cli():
     parser.add_argument("--hf_token", type=str, default=None, help="Hugging Face Access Token to access PyAnnote gated models")
 
     parser.add_argument("--print_progress", type=str2bool, default=False, help = "if True, progress will be printed in transcribe() and align() methods.")
+
+    parser.add_argument("--audio_cache_dir", type=str, default=None, help="directory caching decoded audio across runs; by default decoded audio is only shared between the stages of this run")
+    parser.add_argument("--audio_cache_size", type=float, default=10, help="size limit of the decoded audio cache in GB, least recently used files are evicted first")
+    parser.add_argument("--clip", type=parse_time_ranges, default=None, help="comma-separated time ranges to process, e.g. '0-90,1:30:00-1:32:00'; only these spans of the input are decoded")
     # fmt: on
 
     args = parser.parse_args().__dict__
     model_name: str = args.pop("model")
     batch_size: int = args.pop("batch_size")
+    num_workers: int = args.pop("num_workers")
+    chunk_languages: str = args.pop("chunk_languages")
+    candidate_languages = None if chunk_languages in (None, "all") else [code.strip() for code in chunk_languages.split(",")]
+    if candidate_languages is not None:
+        unknown = [code for code in candidate_languages if code not in LANGUAGES]
+        if unknown:
+            parser.error(f"--chunk_languages: unsupported languages {', '.join(unknown)}, expected codes among {', '.join(sorted(LANGUAGES))}")
+    sort_batches: bool = args.pop("sort_batches")
+    max_batch_seconds: float = args.pop("max_batch_seconds")
     model_dir: str = args.pop("model_dir")
     model_cache_only: bool = args.pop("model_cache_only")
     output_dir: str = args.pop("output_dir")
@@ -104,6 +134,7 @@ def cli():
     align_model: str = args.pop("align_model")
     interpolate_method: str = args.pop("interpolate_method")
     no_align: bool = args.pop("no_align")
+    word_timestamps: bool = args.pop("word_timestamps")
     task: str = args.pop("task")
     if task == "translate":
         # translation cannot be aligned
@@ -117,12 +148,38 @@ def cli():
     vad_offset: float = args.pop("vad_offset")
 
     chunk_size: int = args.pop("chunk_size")
+    chunk_strategy: str = args.pop("chunk_strategy")
+    vad_cascade: bool = args.pop("vad_cascade")
+    vad_workers: int = args.pop("vad_workers")
+    vad_fast: bool = args.pop("vad_fast")
+    vad_cache_dir: str = args.pop("vad_cache_dir")
+    vad_score_cache = VadScoreCache(vad_cache_dir) if vad_cache_dir is not None else None
 
     diarize: bool = args.pop("diarize")
     min_speakers: int = args.pop("min_speakers")
     max_speakers: int = args.pop("max_speakers")
+    split_channels: bool = args.pop("split_channels")
+    if split_channels and diarize:
+        warnings.warn("--diarize has no effect with --split_channels, speakers are labelled by channel")
+        diarize = False
     print_progress: bool = args.pop("print_progress")
 
+    # every input is decoded once (a WAV file already in 16 kHz PCM not at all), then each stage memory-maps the PCM
+    audio_cache_dir: str = args.pop("audio_cache_dir")
+    audio_cache_size: float = args.pop("audio_cache_size")
+    if audio_cache_dir is None:
+        tmp_cache_dir = tempfile.TemporaryDirectory(prefix="whisperx-")
+        audio_cache_dir = tmp_cache_dir.name
+    audio_cache = DecodedAudioCache(audio_cache_dir, max_bytes=int(audio_cache_size * 1024**3))
+    load_input = audio_cache.load_channels if split_channels else audio_cache.load
+
+    clips = args.pop("clip")
+    if clips is not None:
+        if split_channels:
+            parser.error("--clip not possible with --split_channels")
+        # seek to the requested spans instead of decoding the whole input
+        load_input = AudioReader
+
     if args["language"] is not None:
         args["language"] = args["language"].lower()
         if args["language"] not in LANGUAGES:
@@ -162,11 +219,12 @@ def cli():
         "initial_prompt": args.pop("initial_prompt"),
         "suppress_tokens": [int(x) for x in args.pop("suppress_tokens").split(",")],
         "suppress_numerals": args.pop("suppress_numerals"),
+        "word_timestamps": word_timestamps,
     }
 
     writer = get_writer(output_format, output_dir)
     word_options = ["highlight_words", "max_line_count", "max_line_width"]
-    if no_align:
+    if no_align and not word_timestamps:
         for option in word_options:
             if args[option]:
                 parser.error(f"--{option} not possible with --no_align")
@@ -177,20 +235,48 @@ def cli():
     # Part 1: VAD & ASR Loop
     results = []
     tmp_results = []
-    model = load_model(model_name, device=device, device_index=device_index, download_root=model_dir, compute_type=compute_type, language=args['language'], asr_options=asr_options, vad_options={"vad_onset": vad_onset, "vad_offset": vad_offset}, task=task, threads=faster_whisper_threads)
-
-    for audio_path in args.pop("audio"):
-        audio = load_audio(audio_path)
-        # >> VAD & ASR
-        print(">>Performing transcription...")
-        result: TranscriptionResult = model.transcribe(
-            audio,
-            batch_size=batch_size,
-            chunk_size=chunk_size,
-            print_progress=print_progress,
-            verbose=verbose,
-        )
-        results.append((result, audio_path))
+    vad_options = {"vad_onset": vad_onset, "vad_offset": vad_offset, "vad_cascade": vad_cascade, "vad_workers": vad_workers, "vad_fast": vad_fast}
+    diarize_model = None
+    segmentation_vad = None
+    if vad_method == "segmentation":
+        # VAD and diarization share the segmentation of each input, it is kept until diarization
+        diarize_model = DiarizationPipeline(use_auth_token=hf_token, device=device)
+        segmentation_vad = SegmentationVad(diarize_model.model, keep_segmentations=diarize and clips is None, **vad_options)
+    model = load_model(model_name, device=device, device_index=device_index, download_root=model_dir, compute_type=compute_type, language=args['language'], asr_options=asr_options, vad_model=segmentation_vad, vad_method=vad_method, vad_options=vad_options, task=task, threads=faster_whisper_threads, vad_score_cache=vad_score_cache)
+
+    audio_paths = args.pop("audio")
+    detect_languages = args["language"] is None and clips is None and len(audio_paths) > 1
+    # languages are detected a batch of files at a time, in one encoder pass on the first chunk of speech
+    # of each, whose encoder output is kept until the file is transcribed
+    window = (batch_size or 1) if detect_languages else max(len(audio_paths), 1)
+    for lo in range(0, len(audio_paths), window):
+        window_paths = audio_paths[lo:lo + window]
+        languages = [args["language"]] * len(window_paths)
+        if detect_languages:
+            print(">>Detecting languages...")
+            languages = model.detect_file_languages([load_input(audio_path) for audio_path in window_paths],
+                                                    batch_size=batch_size, chunk_size=chunk_size, chunk_strategy=chunk_strategy)
+
+        for audio_path, language in zip(window_paths, languages):
+            audio = load_input(audio_path)
+            # >> VAD & ASR
+            print(">>Performing transcription...")
+            result: TranscriptionResult = model.transcribe_result(
+                audio if clips is None else audio.iter_ranges(clips),
+                language=language,
+                batch_size=batch_size,
+                num_workers=num_workers,
+                chunk_size=chunk_size,
+                chunk_strategy=chunk_strategy,
+                sort_batches=sort_batches,
+                max_batch_seconds=max_batch_seconds,
+                language_per_chunk=chunk_languages is not None,
+                candidate_languages=candidate_languages,
+                print_progress=print_progress,
+                split_channels=split_channels,
+            )
+            results.append((result, audio_path))
+        model.clear_detections()
 
     # Unload Whisper and VAD
     del model
@@ -198,14 +284,15 @@ def cli():
     torch.cuda.empty_cache()
 
     # Part 2: Align Loop
-    if not no_align:
+    # decoder word timestamps need no alignment model
+    if not no_align and not word_timestamps:
         tmp_results = results
         results = []
         align_model, align_metadata = load_align_model(align_language, device, model_name=align_model)
         for result, audio_path in tmp_results:
             # >> Align
             if len(tmp_results) > 1:
-                input_audio = audio_path
+                input_audio = load_input(audio_path)
             else:
                 # lazily load audio from part 1
                 input_audio = audio
@@ -216,7 +303,7 @@ def cli():
                     print(f"New language found ({result['language']})! Previous was ({align_metadata['language']}), loading new alignment model for new language...")
                     align_model, align_metadata = load_align_model(result["language"], device)
                 print(">>Performing alignment...")
-                result: AlignedTranscriptionResult = align(
+                result: AlignedTranscriptionResult = (align_channels if split_channels else align)(
                     result["segments"],
                     align_model,
                     align_metadata,
@@ -241,9 +328,19 @@ def cli():
         tmp_results = results
         print(">>Performing diarization...")
         results = []
-        diarize_model = DiarizationPipeline(use_auth_token=hf_token, device=device)
+        if diarize_model is None:
+            diarize_model = DiarizationPipeline(use_auth_token=hf_token, device=device)
         for result, input_audio_path in tmp_results:
-            diarize_segments = diarize_model(input_audio_path, min_speakers=min_speakers, max_speakers=max_speakers)
+            if clips is None:
+                input_audio = audio_cache.load(input_audio_path)
+                segmentations = segmentation_vad.pop_segmentations(input_audio) if segmentation_vad is not None else None
+                diarize_segments = diarize_model(input_audio, min_speakers=min_speakers, max_speakers=max_speakers, segmentations=segmentations)
+            else:
+                reader = AudioReader(input_audio_path)
+                diarize_segments = pd.concat(
+                    [diarize_model(reader, min_speakers=min_speakers, max_speakers=max_speakers, time_range=clip) for clip in clips],
+                    ignore_index=True,
+                )
             result = assign_word_speakers(diarize_segments, result)
             results.append((result, input_audio_path))
     # >> Write
@@ -164,6 +164,28 @@ def optional_float(string):
     return None if string == "None" else float(string)
 
 
+def parse_timestamp(string):
+    """seconds from "ss[.ms]", "mm:ss[.ms]" or "hh:mm:ss[.ms]"."""
+    seconds = 0.0
+    for part in string.strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_time_ranges(string):
+    """list of (start, end) seconds from a comma-separated list of "start-end" timestamps."""
+    ranges = []
+    for item in string.split(","):
+        start, sep, end = item.partition("-")
+        if not sep:
+            raise ValueError(f"Expected a time range 'start-end', got {item!r}")
+        start, end = parse_timestamp(start), parse_timestamp(end)
+        if end <= start:
+            raise ValueError(f"Time range {item!r} ends before it starts")
+        ranges.append((start, end))
+    return sorted(ranges)
+
+
 def compression_ratio(text) -> float:
     text_bytes = text.encode("utf-8")
     return len(text_bytes) / len(zlib.compress(text_bytes))
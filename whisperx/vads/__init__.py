@@ -1,3 +1,8 @@
+from whisperx.vads.cascade import CascadeVad
+from whisperx.vads.energy import EnergyVad
 from whisperx.vads.pyannote import Pyannote
+from whisperx.vads.segmentation import SegmentationVad
+from whisperx.vads.sharded import ShardedVad
 from whisperx.vads.silero import Silero
+from whisperx.vads.silero_onnx import SileroOnnx
 from whisperx.vads.vad import Vad
\ No newline at end of file
@@ -0,0 +1,149 @@
+from typing import Any, Optional
+
+import numpy as np
+
+from whisperx.vads.stitch import stitch
+from whisperx.vads.vad import Vad
+
+
+def candidate_regions(audio: np.ndarray,
+                      sample_rate: int = 16000,
+                      margin_db: float = 6.0,
+                      silence_db: float = -60.0,
+                      noise_percentile: float = 10.0,
+                      guard: float = 1.0,
+                      align: int = 1,
+                      ) -> np.ndarray:
+    """Regions of `audio` that may contain speech: everything but the clearly silent stretches.
+
+    A 10ms frame is clearly silent when its level is within `margin_db` of the noise floor (the
+    `noise_percentile` of the frame levels) or below `silence_db` dBFS. The other frames are extended
+    by `guard` seconds on both sides, which also bridges silences shorter than twice the guard.
+
+    Parameters
+    ----------
+    audio : np.ndarray
+        (num_samples,) float waveform.
+    align : int
+        Region starts are rounded down to a multiple of that many samples, and ends up.
+
+    Returns
+    -------
+    regions : np.ndarray
+        (num_regions, 2) sorted and disjoint start and end samples.
+    """
+    frame = sample_rate // 100
+    num_frames = -(-len(audio) // frame)
+    if num_frames == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    power = np.zeros(num_frames * frame, dtype=np.float32)
+    power[:len(audio)] = audio
+    power = np.mean(power.reshape(num_frames, frame) ** 2, axis=1)
+    log_energy = 10 * np.log10(power + 1e-10)
+
+    noise_floor = np.percentile(log_energy, noise_percentile)
+    active = np.flatnonzero((log_energy > noise_floor + margin_db) & (log_energy > silence_db))
+    if len(active) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # runs of active frames, once extended by the guard on both sides
+    guard_frames = int(round(guard * sample_rate / frame))
+    breaks = np.flatnonzero(np.diff(active) > 2 * guard_frames + 1)
+    starts = active[np.concatenate(([0], breaks + 1))] - guard_frames
+    ends = active[np.concatenate((breaks, [len(active) - 1]))] + 1 + guard_frames
+    starts = np.maximum(starts, 0) * frame // align * align
+    ends = np.minimum(-(-np.minimum(ends * frame, len(audio)) // align) * align, len(audio))
+
+    # rounding can make neighbours overlap
+    new_region = np.concatenate(([True], starts[1:] > ends[:-1]))
+    ends = np.maximum.reduceat(ends, np.flatnonzero(new_region))
+    starts = starts[new_region]
+    return np.stack([starts, ends], axis=1).astype(np.int64)
+
+
+class CascadeVad(Vad):
+    """Runs a VAD model only where the audio is not clearly silent, as found by a cheap energy gate.
+
+    Long recordings are often mostly silence, which the gate (see `candidate_regions`) skips at
+    almost no cost. The wrapped VAD scores each remaining region and the outputs are stitched back
+    onto the timeline of the whole audio (see `stitch`), so its `merge_chunks` sees the same kind of
+    scores as without the cascade. Regions start at a multiple of the VAD's `align_samples` and
+    their guard margins cover its `context`, so a windowed model like `Pyannote` scores the speech
+    as on the whole audio. Recurrent models like Silero remember minutes of audio, and `EnergyVad`
+    takes its noise floor from each region instead of the whole audio: their regions only
+    approximately match the whole audio.
+
+    Parameters
+    ----------
+    vad : Vad
+        The VAD scoring the candidate regions.
+    gate_margin_db, gate_silence_db, noise_percentile : float
+        See `candidate_regions`.
+    guard : float
+        Minimum margin around the audio let through by the gate, raised to the `context` of `vad`.
+    max_coverage : float
+        When the candidate regions cover more than this fraction of the audio, the VAD runs on
+        the whole audio instead.
+    """
+
+    def __init__(self,
+                 vad: Vad,
+                 gate_margin_db: float = 6.0,
+                 gate_silence_db: float = -60.0,
+                 noise_percentile: float = 10.0,
+                 guard: float = 1.0,
+                 max_coverage: float = 0.8,
+                 sample_rate: int = 16000,
+                 **kwargs):
+        print(">>Gating voice activity detection on signal energy...")
+        super().__init__(kwargs['vad_onset'])
+        self.vad = vad
+        self.gate_margin_db = gate_margin_db
+        self.gate_silence_db = gate_silence_db
+        self.noise_percentile = noise_percentile
+        self.guard = guard
+        self.max_coverage = max_coverage
+        self.sample_rate = sample_rate
+        if vad.cache_key is not None:
+            self.cache_key = (f"cascade-{gate_margin_db}-{gate_silence_db}-{noise_percentile}-{guard}-"
+                              f"{max_coverage}-{sample_rate}-{vad.cache_key}")
+
+    def __call__(self, audio, **kwargs) -> Optional[Any]:
+        if audio["sample_rate"] != self.sample_rate:
+            raise ValueError(f"Only {self.sample_rate}Hz sample rate is allowed")
+        waveform = np.asarray(audio["waveform"], dtype=np.float32).reshape(-1)
+
+        regions = candidate_regions(waveform,
+                                    self.sample_rate,
+                                    margin_db=self.gate_margin_db,
+                                    silence_db=self.gate_silence_db,
+                                    noise_percentile=self.noise_percentile,
+                                    guard=max(self.guard, self.vad.context),
+                                    align=self.vad.align_samples)
+        coverage = (regions[:, 1] - regions[:, 0]).sum() / max(len(waveform), 1)
+        if coverage > self.max_coverage:
+            return self.vad({"waveform": self.vad.preprocess_audio(waveform), "sample_rate": self.sample_rate})
+
+        print(f">>Running voice activity detection on {len(regions)} regions, {coverage:.0%} of the audio")
+        pieces = []
+        for start, end in regions.tolist():
+            piece = self.vad.preprocess_audio(waveform[start:end])
+            pieces.append((start, self.vad({"waveform": piece, "sample_rate": self.sample_rate})))
+        return stitch(pieces, len(waveform), self.sample_rate)
+
+    @staticmethod
+    def preprocess_audio(audio):
+        return audio
+
+    # not static: the stitched output is binarized by the wrapped VAD
+    def merge_chunks(self,
+                     segments,
+                     chunk_size,
+                     onset: float = 0.5,
+                     offset: Optional[float] = None,
+                     strategy: str = "greedy",
+                     ):
+        if segments is None:
+            print("No active speech found in audio")
+            return []
+        return self.vad.merge_chunks(segments, chunk_size, onset=onset, offset=offset, strategy=strategy)
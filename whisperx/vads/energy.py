@@ -0,0 +1,138 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from whisperx.diarize import Segment as SegmentX
+from whisperx.vads.vad import Vad, binarize_hysteresis
+
+
+class EnergyScores(NamedTuple):
+    """Speech score of every frame of an audio, frame i is centered on `start + i * step` seconds."""
+    scores: np.ndarray
+    start: float
+    step: float
+
+
+def frame_features(audio: np.ndarray,
+                   frame_length: int = 400,
+                   hop_length: int = 160,
+                   n_fft: int = 512,
+                   block_frames: int = 8192,
+                   ):
+    """Log energy (dB), spectral flatness and zero-crossing rate of every frame of `audio`.
+
+    Frames are strided views of the waveform, processed `block_frames` at a time to bound memory.
+
+    Returns
+    -------
+    log_energy, flatness, zcr : np.ndarray
+        (num_frames,) features, flatness and zcr in [0, 1].
+    """
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    if len(audio) < frame_length:
+        audio = np.pad(audio, (0, frame_length - len(audio)))
+    frames = np.lib.stride_tricks.sliding_window_view(audio, frame_length)[::hop_length]
+    window = np.hanning(frame_length).astype(np.float32)
+
+    num_frames = len(frames)
+    log_energy = np.empty(num_frames, dtype=np.float32)
+    flatness = np.empty(num_frames, dtype=np.float32)
+    zcr = np.empty(num_frames, dtype=np.float32)
+    for i in range(0, num_frames, block_frames):
+        block = frames[i:i + block_frames]
+        log_energy[i:i + block_frames] = 10 * np.log10(np.mean(block ** 2, axis=1) + 1e-10)
+
+        power = np.abs(np.fft.rfft(block * window, n=n_fft, axis=1)) ** 2 + 1e-10
+        flatness[i:i + block_frames] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+        signs = np.signbit(block)
+        zcr[i:i + block_frames] = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return log_energy, flatness, zcr
+
+
+class EnergyVad(Vad):
+    """Model-free VAD for clean recordings, from log energy, spectral flatness and zero-crossing rate.
+
+    A frame scores high when it is well above the noise floor (the `noise_percentile` of the frame
+    energies) and either tonal (low spectral flatness, voiced speech) or noisy with a high
+    zero-crossing rate (fricatives). Like `Pyannote`, `__call__` returns the frame scores and
+    `merge_chunks` applies the onset/offset hysteresis, so it plugs into the same pipeline.
+
+    Parameters
+    ----------
+    energy_margin_db : float
+        Level above the noise floor at which the energy score is 0.5.
+    energy_slope_db : float
+        Width of the transition of the energy score around `energy_margin_db`.
+    noise_percentile : float
+        Percentile of the frame energies taken as the noise floor.
+    max_flatness : float
+        Spectral flatness at which a frame stops counting as voiced.
+    max_zcr : float
+        Zero-crossing rate at which a frame fully counts as a fricative.
+    smoothing_frames : int
+        Length of the moving average applied to the scores.
+    """
+
+    def __init__(self,
+                 energy_margin_db: float = 15.0,
+                 energy_slope_db: float = 3.0,
+                 noise_percentile: float = 10.0,
+                 max_flatness: float = 0.5,
+                 max_zcr: float = 0.3,
+                 smoothing_frames: int = 10,
+                 sample_rate: int = 16000,
+                 **kwargs):
+        print(">>Performing voice activity detection using energy features...")
+        super().__init__(kwargs['vad_onset'])
+        self.energy_margin_db = energy_margin_db
+        self.energy_slope_db = energy_slope_db
+        self.noise_percentile = noise_percentile
+        self.max_flatness = max_flatness
+        self.max_zcr = max_zcr
+        self.smoothing_frames = smoothing_frames
+        self.sample_rate = sample_rate
+        # 25ms frames every 10ms
+        self.frame_length = int(0.025 * sample_rate)
+        self.hop_length = int(0.010 * sample_rate)
+        self.align_samples = self.hop_length
+        self.cache_key = (f"energy-{energy_margin_db}-{energy_slope_db}-{noise_percentile}-"
+                          f"{max_flatness}-{max_zcr}-{smoothing_frames}-{sample_rate}")
+
+    def __call__(self, audio, **kwargs) -> EnergyScores:
+        if audio["sample_rate"] != self.sample_rate:
+            raise ValueError(f"Only {self.sample_rate}Hz sample rate is allowed")
+
+        log_energy, flatness, zcr = frame_features(audio["waveform"], self.frame_length, self.hop_length)
+        noise_floor = np.percentile(log_energy, self.noise_percentile)
+        loudness = 1 / (1 + np.exp(-(log_energy - noise_floor - self.energy_margin_db) / self.energy_slope_db))
+        voicing = np.clip(1 - flatness / self.max_flatness, 0, 1)
+        friction = np.clip(zcr / self.max_zcr, 0, 1)
+        scores = loudness * np.maximum(voicing, friction)
+
+        if self.smoothing_frames > 1 and len(scores) > 1:
+            kernel = np.ones(self.smoothing_frames, dtype=np.float32) / self.smoothing_frames
+            scores = np.convolve(scores, kernel, mode="same")
+        start = self.frame_length / 2 / self.sample_rate
+        return EnergyScores(scores.astype(np.float32), start, self.hop_length / self.sample_rate)
+
+    @staticmethod
+    def preprocess_audio(audio):
+        return audio
+
+    @staticmethod
+    def merge_chunks(scores: EnergyScores,
+                     chunk_size,
+                     onset: float = 0.5,
+                     offset: Optional[float] = None,
+                     strategy: str = "greedy",
+                     ):
+        assert chunk_size > 0
+        timestamps = scores.start + np.arange(len(scores.scores)) * scores.step
+        starts, ends = binarize_hysteresis(scores.scores, timestamps, onset, offset or onset, max_duration=chunk_size)
+        segments_list = [SegmentX(start, end, "UNKNOWN") for start, end in zip(starts.tolist(), ends.tolist())
+                         if end > start]
+        if len(segments_list) == 0:
+            print("No active speech found in audio")
+            return []
+        return Vad.merge_chunks(segments_list, chunk_size, onset, offset, strategy)
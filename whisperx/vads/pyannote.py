@@ -1,32 +1,34 @@
 import os
-from typing import Callable, Text, Union
+from typing import Callable, Text, Tuple, Union
 from typing import Optional
 
 import numpy as np
 import torch
-from pyannote.audio import Model
+from pyannote.audio import Inference, Model
 from pyannote.audio.core.io import AudioFile
 from pyannote.audio.pipelines import VoiceActivityDetection
 from pyannote.audio.pipelines.utils import PipelineModel
-from pyannote.core import Annotation, SlidingWindowFeature
+from pyannote.core import Annotation, SlidingWindow, SlidingWindowFeature
 from pyannote.core import Segment
 
+from whisperx.cache import file_digest
 from whisperx.diarize import Segment as SegmentX
-from whisperx.vads.vad import Vad
+from whisperx.vads.vad import Vad, binarize_hysteresis
+
+
+def vad_model_path(model_fp=None):
+    if model_fp is None:
+        # Dynamically resolve the path to the model file
+        main_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        model_fp = os.path.join(main_dir, "assets", "pytorch_model.bin")
+    return os.path.abspath(model_fp)  # Ensure the path is absolute
 
 
 def load_vad_model(device, vad_onset=0.800, vad_offset=0.5, use_auth_token=None, model_fp=None):
     model_dir = torch.hub._get_torch_home()
 
-    main_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
     os.makedirs(model_dir, exist_ok = True)
-    if model_fp is None:
-        # Dynamically resolve the path to the model file
-        model_fp = os.path.join(main_dir, "assets", "pytorch_model.bin")
-        model_fp = os.path.abspath(model_fp)  # Ensure the path is absolute
-    else:
-        model_fp = os.path.abspath(model_fp)  # Ensure any provided path is absolute
+    model_fp = vad_model_path(model_fp)
 
     # Check if the resolved model file exists
     if not os.path.exists(model_fp):
@@ -35,8 +37,6 @@ def load_vad_model(device, vad_onset=0.800, vad_offset=0.5, use_auth_token=None,
     if os.path.exists(model_fp) and not os.path.isfile(model_fp):
         raise RuntimeError(f"{model_fp} exists and is not a regular file")
 
-    model_bytes = open(model_fp, "rb").read()
-
     vad_model = Model.from_pretrained(model_fp, use_auth_token=use_auth_token)
     hyperparameters = {"onset": vad_onset,
                     "offset": vad_offset,
@@ -47,6 +47,125 @@ def load_vad_model(device, vad_onset=0.800, vad_offset=0.5, use_auth_token=None,
 
     return vad_pipeline
 
+# pyannote.core.Segment treats segments shorter than this as empty
+SEGMENT_PRECISION = 1e-6
+
+
+def frame_middles(frames: SlidingWindow, num_frames: int) -> np.ndarray:
+    """Mid-time of the first `num_frames` positions of `frames`, same values as `frames[i].middle`."""
+    starts = frames.start + np.arange(num_frames) * frames.step
+    return .5 * (starts + (starts + frames.duration))
+
+
+def chunk_starts(num_samples: int, window_size: int, step_size: int) -> np.ndarray:
+    """Start sample of the chunks `Inference` slides over an audio: every `step_size` samples,
+    and a last zero-padded chunk over the remaining samples."""
+    num_chunks = (num_samples - window_size) // step_size + 1 if num_samples >= window_size else 0
+    has_last_chunk = num_samples < window_size or (num_samples - window_size) % step_size > 0
+    return np.arange(num_chunks + has_last_chunk) * step_size
+
+
+def model_frames(model: Model) -> SlidingWindow:
+    """The resolution of the outputs of a segmentation model."""
+    # `receptive_field` since pyannote.audio 3.1
+    frames = getattr(model, "receptive_field", None)
+    if frames is None:
+        frames = model.example_output.frames
+    return frames
+
+
+def fast_segmentation(inference: Inference,
+                      waveform: torch.Tensor,
+                      sample_rate: int,
+                      onset: float,
+                      offset: float,
+                      coarse_step: float = 5.0,
+                      refine_radius: float = 0.5,
+                      ) -> SlidingWindowFeature:
+    """Speech scores of `inference` computed on a coarse subset of its chunks, refined around boundaries.
+
+    `inference` scores every chunk starting on its grid of `step` seconds (1s for 10s chunks).
+    Here only the chunks every `coarse_step` seconds are scored first. Then, wherever the aggregated
+    scores cross `onset` or `offset`, the chunks of the full grid centered within `refine_radius`
+    seconds of the crossing are scored too: they see the boundary with the most context, until the
+    crossings of the refined scores need no new chunk. The scored chunks are aggregated like
+    `inference` would, the missing ones being left out, so the scores equal those of `inference`
+    where every overlapping chunk got scored.
+
+    Parameters
+    ----------
+    inference : Inference
+        The segmentation inference of `VoiceActivitySegmentation`.
+    waveform : torch.Tensor
+        (1, num_samples) waveform.
+
+    Returns
+    -------
+    scores : SlidingWindowFeature
+        (num_frames, 1) speech scores.
+    """
+    window_size = inference.model.audio.get_num_samples(inference.duration)
+    step_size = round(inference.step * sample_rate)
+    num_samples = waveform.shape[1]
+    starts = chunk_starts(num_samples, window_size, step_size)
+    frames = model_frames(inference.model)
+    chunks = SlidingWindow(start=0.0, duration=inference.duration, step=inference.step)
+
+    outputs = None
+    scored = np.zeros(len(starts), dtype=bool)
+
+    def score(indices):
+        nonlocal outputs
+        indices = indices[~scored[indices]]
+        for i in range(0, len(indices), inference.batch_size):
+            batch = []
+            for start in starts[indices[i:i + inference.batch_size]].tolist():
+                chunk = waveform[:, start:start + window_size]
+                batch.append(torch.nn.functional.pad(chunk, (0, window_size - chunk.shape[1])))
+            batch_outputs = inference.pre_aggregation_hook(inference.infer(torch.stack(batch)))
+            if outputs is None:
+                outputs = np.full((len(starts),) + batch_outputs.shape[1:], np.nan, dtype=np.float32)
+            outputs[indices[i:i + inference.batch_size]] = batch_outputs
+        scored[indices] = True
+
+    def aggregate():
+        # the chunks left unscored are NaN, which `Inference.aggregate` leaves out
+        aggregated = Inference.aggregate(SlidingWindowFeature(outputs.copy(), chunks),
+                                         frames,
+                                         warm_up=inference.warm_up,
+                                         hamming=True,
+                                         missing=0.0)
+        if starts[-1] + window_size > num_samples:
+            # remove padding that was added to last chunk
+            aggregated.data = aggregated.crop(Segment(0.0, num_samples / sample_rate), mode="loose")
+        return aggregated
+
+    # coarse pass, with the last chunk so that the end of the audio is covered
+    coarse = max(1, round(coarse_step * sample_rate / step_size))
+    score(np.unique(np.append(np.arange(0, len(starts), coarse), len(starts) - 1)))
+    scores = aggregate()
+
+    # refine until the boundaries only lie where every overlapping chunk near them got scored
+    centers = (starts + window_size / 2) / sample_rate
+    while True:
+        # frames where the speech state may change
+        speech = scores.data[:, 0]
+        changes = np.flatnonzero(np.diff(speech > onset) | np.diff(speech < offset)) + 1
+        times = frame_middles(scores.sliding_window, len(speech))[changes]
+
+        # the chunks of the full grid centered around each change
+        lo = np.searchsorted(centers, times - refine_radius)
+        hi = np.searchsorted(centers, times + refine_radius, side="right")
+        refine = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.add.at(refine, lo, 1)
+        np.add.at(refine, hi, -1)
+        refine = np.flatnonzero(np.cumsum(refine[:-1]) > 0)
+        if scored[refine].all():
+            return scores
+        score(refine)
+        scores = aggregate()
+
+
 class Binarize:
     """Binarize detection scores using hysteresis thresholding, with min-cut operation
     to ensure not segments are longer than max_duration.
@@ -117,55 +236,16 @@ class Binarize:
         """
 
         num_frames, num_classes = scores.data.shape
-        frames = scores.sliding_window
-        timestamps = [frames[i].middle for i in range(num_frames)]
+        timestamps = frame_middles(scores.sliding_window, num_frames)
 
         # annotation meant to store 'active' regions
         active = Annotation()
         for k, k_scores in enumerate(scores.data.T):
 
             label = k if scores.labels is None else scores.labels[k]
-
-            # initial state
-            start = timestamps[0]
-            is_active = k_scores[0] > self.onset
-            curr_scores = [k_scores[0]]
-            curr_timestamps = [start]
-            t = start
-            for t, y in zip(timestamps[1:], k_scores[1:]):
-                # currently active
-                if is_active:
-                    curr_duration = t - start
-                    if curr_duration > self.max_duration:
-                        search_after = len(curr_scores) // 2
-                        # divide segment
-                        min_score_div_idx = search_after + np.argmin(curr_scores[search_after:])
-                        min_score_t = curr_timestamps[min_score_div_idx]
-                        region = Segment(start - self.pad_onset, min_score_t + self.pad_offset)
-                        active[region, k] = label
-                        start = curr_timestamps[min_score_div_idx]
-                        curr_scores = curr_scores[min_score_div_idx + 1:]
-                        curr_timestamps = curr_timestamps[min_score_div_idx + 1:]
-                    # switching from active to inactive
-                    elif y < self.offset:
-                        region = Segment(start - self.pad_onset, t + self.pad_offset)
-                        active[region, k] = label
-                        start = t
-                        is_active = False
-                        curr_scores = []
-                        curr_timestamps = []
-                    curr_scores.append(y)
-                    curr_timestamps.append(t)
-                # currently inactive
-                else:
-                    # switching from inactive to active
-                    if y > self.onset:
-                        start = t
-                        is_active = True
-
-            # if active at the end, add final region
-            if is_active:
-                region = Segment(start - self.pad_onset, t + self.pad_offset)
+            starts, ends = binarize_hysteresis(k_scores, timestamps, self.onset, self.offset, self.max_duration)
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                region = Segment(start - self.pad_onset, end + self.pad_offset)
                 active[region, k] = label
 
         # because of padding, some active regions might be overlapping: merge them.
@@ -183,6 +263,48 @@ class Binarize:
 
         return active
 
+    def segments(self, scores: SlidingWindowFeature) -> Tuple[np.ndarray, np.ndarray]:
+        """Binarize single-class detection scores to plain arrays, without building an `Annotation`.
+
+        Parameters
+        ----------
+        scores : SlidingWindowFeature
+            (num_frames, 1) detection scores.
+        Returns
+        -------
+        starts, ends : np.ndarray
+            Start and end times of the active regions, sorted as in `Annotation.get_timeline()`.
+        """
+        num_frames, num_classes = scores.data.shape
+        if num_classes != 1:
+            raise ValueError(f"Expected single-class scores, got {num_classes} classes")
+        timestamps = frame_middles(scores.sliding_window, num_frames)
+        starts, ends = binarize_hysteresis(scores.data[:, 0], timestamps, self.onset, self.offset, self.max_duration)
+        starts = starts - self.pad_onset
+        ends = ends + self.pad_offset
+
+        # same as an Annotation would: drop empty regions, sort and deduplicate the others
+        keep = ends - starts > SEGMENT_PRECISION
+        regions = np.unique(np.stack([starts[keep], ends[keep]], axis=1), axis=0)
+        starts, ends = regions[:, 0], regions[:, 1]
+
+        if self.pad_offset > 0.0 or self.pad_onset > 0.0 or self.min_duration_off > 0.0:
+            if self.max_duration < float("inf"):
+                raise NotImplementedError(f"This would break current max_duration param")
+            if len(starts) > 0:
+                # merge overlapping regions and gaps shorter than min_duration_off, like `Timeline.support`
+                gaps = starts[1:] - np.maximum.accumulate(ends)[:-1]
+                new_region = np.concatenate(([True], (gaps > SEGMENT_PRECISION) & (gaps >= self.min_duration_off)))
+                ends = np.maximum.reduceat(ends, np.flatnonzero(new_region))
+                starts = starts[new_region]
+
+        # remove regions shorter than min_duration_on
+        if self.min_duration_on > 0:
+            keep = ends - starts >= self.min_duration_on
+            starts, ends = starts[keep], ends[keep]
+
+        return starts, ends
+
 
 class VoiceActivitySegmentation(VoiceActivityDetection):
     def __init__(
@@ -231,12 +353,53 @@ class VoiceActivitySegmentation(VoiceActivityDetection):
 
 class Pyannote(Vad):
 
-    def __init__(self, device, use_auth_token=None, model_fp=None, **kwargs):
+    """
+    With `vad_fast`, the segmentation model only runs on a coarse subset of its chunks and around
+    the speech boundaries found with them, see `fast_segmentation`.
+    """
+
+    def __init__(self, device, use_auth_token=None, model_fp=None,
+                 vad_fast=False, vad_coarse_step=5.0, vad_refine_radius=0.5, **kwargs):
         print(">>Performing voice activity detection using Pyannote...")
         super().__init__(kwargs['vad_onset'])
         self.vad_pipeline = load_vad_model(device, use_auth_token=use_auth_token, model_fp=model_fp)
+        self.vad_onset = kwargs['vad_onset']
+        self.vad_offset = kwargs.get('vad_offset') or self.vad_onset
+        self.vad_fast = vad_fast
+        self.vad_coarse_step = vad_coarse_step
+        self.vad_refine_radius = vad_refine_radius
+        # the frame scores only depend on the segmentation model, or also on the thresholds in fast mode
+        self.cache_key = f"pyannote-{file_digest(vad_model_path(model_fp))}"
+        if vad_fast:
+            self.cache_key += f"-fast-{vad_coarse_step}-{vad_refine_radius}-{self.vad_onset}-{self.vad_offset}"
+
+    @property
+    def align_samples(self) -> int:
+        # the model scores chunks starting every `step` seconds from the start of the audio, or every
+        # coarse step in fast mode, and aggregates them on frames placed at `rint(chunk start / frame step)`:
+        # a piece starting at a multiple of both steps (27s for 1s chunks of 270 samples frames) gets
+        # the same chunks on the same frames as the whole audio
+        inference = self.vad_pipeline._segmentation
+        step = inference.step
+        if self.vad_fast:
+            step *= max(1, round(self.vad_coarse_step / step))
+        frame_step = model_frames(inference.model).step
+        return int(np.lcm(round(step * 16000), round(frame_step * 16000)))
+
+    @property
+    def context(self) -> float:
+        # each frame score is aggregated from the chunks overlapping it
+        return self.vad_pipeline._segmentation.duration
 
     def __call__(self, audio: AudioFile, **kwargs):
+        if self.vad_fast:
+            return fast_segmentation(self.vad_pipeline._segmentation,
+                                     audio["waveform"],
+                                     audio["sample_rate"],
+                                     self.vad_onset,
+                                     self.vad_offset,
+                                     coarse_step=self.vad_coarse_step,
+                                     refine_radius=self.vad_refine_radius)
         return self.vad_pipeline(audio)
 
     @staticmethod
@@ -248,16 +411,17 @@ class Pyannote(Vad):
                      chunk_size,
                      onset: float = 0.5,
                      offset: Optional[float] = None,
+                     strategy: str = "greedy",
                      ):
         assert chunk_size > 0
         binarize = Binarize(max_duration=chunk_size, onset=onset, offset=offset)
-        segments = binarize(segments)
+        starts, ends = binarize.segments(segments)
         segments_list = []
-        for speech_turn in segments.get_timeline():
-            segments_list.append(SegmentX(speech_turn.start, speech_turn.end, "UNKNOWN"))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            segments_list.append(SegmentX(start, end, "UNKNOWN"))
 
         if len(segments_list) == 0:
             print("No active speech found in audio")
             return []
         assert segments_list, "segments_list is empty."
-        return Vad.merge_chunks(segments_list, chunk_size, onset, offset)
\ No newline at end of file
+        return Vad.merge_chunks(segments_list, chunk_size, onset, offset, strategy)
\ No newline at end of file
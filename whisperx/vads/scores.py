@@ -0,0 +1,59 @@
+from typing import Any, Dict
+
+import numpy as np
+from pyannote.core import SlidingWindow, SlidingWindowFeature
+
+from whisperx.vads.energy import EnergyScores
+from whisperx.vads.silero_onnx import SileroScores
+
+
+def scores_to_arrays(scores: Any) -> Dict[str, np.ndarray]:
+    """The frame scores of a VAD as plain arrays, which `np.savez` stores without pickling (see `VadScoreCache`).
+
+    Parameters
+    ----------
+    scores : Any
+        The output of a VAD setting a `cache_key`: a `SlidingWindowFeature`, `SileroScores` or `EnergyScores`.
+
+    Returns
+    -------
+    arrays : Dict[str, np.ndarray]
+        The scores and their frames, read back by `scores_from_arrays`.
+    """
+    if isinstance(scores, SlidingWindowFeature):
+        frames = scores.sliding_window
+        arrays = {
+            "type": np.array("sliding_window"),
+            "data": scores.data,
+            "frames": np.array([frames.start, frames.duration, frames.step], dtype=np.float64),
+        }
+        if scores.labels is not None:
+            arrays["labels"] = np.array(scores.labels, dtype=str)
+        return arrays
+
+    if isinstance(scores, SileroScores):
+        return {"type": np.array("silero"), "probs": scores.probs, "num_samples": np.array(scores.num_samples, dtype=np.int64)}
+
+    if isinstance(scores, EnergyScores):
+        return {"type": np.array("energy"), "scores": scores.scores,
+                "frames": np.array([scores.start, scores.step], dtype=np.float64)}
+
+    raise TypeError(f"Cannot store VAD outputs of type {type(scores).__name__}")
+
+
+def scores_from_arrays(arrays: Dict[str, np.ndarray]) -> Any:
+    """The frame scores of a VAD from the arrays of `scores_to_arrays`."""
+    kind = str(arrays["type"])
+    if kind == "sliding_window":
+        start, duration, step = arrays["frames"].tolist()
+        labels = arrays["labels"].tolist() if "labels" in arrays else None
+        return SlidingWindowFeature(arrays["data"], SlidingWindow(start=start, duration=duration, step=step), labels=labels)
+
+    if kind == "silero":
+        return SileroScores(arrays["probs"], int(arrays["num_samples"]))
+
+    if kind == "energy":
+        start, step = arrays["frames"].tolist()
+        return EnergyScores(arrays["scores"], start, step)
+
+    raise ValueError(f"Unknown VAD output type {kind}")
@@ -0,0 +1,65 @@
+from typing import Dict, Optional, Union
+
+import numpy as np
+from pyannote.audio import Inference, Pipeline
+from pyannote.audio.core.io import AudioFile
+from pyannote.core import Segment, SlidingWindowFeature
+
+from whisperx.audio import PCMAudio
+from whisperx.cache import array_digest
+from whisperx.vads.pyannote import Pyannote, chunk_starts, model_frames
+from whisperx.vads.vad import Vad
+
+
+class SegmentationVad(Pyannote):
+    """VAD from the segmentation model of a pyannote speaker diarization pipeline.
+
+    The speech score of a frame is the activity of its most active speaker, aggregated over the
+    chunks as pyannote's `VoiceActivityDetection` does. With `keep_segmentations`, the chunk
+    segmentations of each audio are kept until `pop_segmentations` hands them over to
+    `DiarizationPipeline`, which then skips its own segmentation step: the model runs once per audio.
+
+    Parameters
+    ----------
+    pipeline : Pipeline
+        A pyannote speaker diarization pipeline, e.g. `DiarizationPipeline(...).model`.
+    keep_segmentations : bool
+        Keep the segmentations of every audio scored, keyed by its samples, for `pop_segmentations`.
+    """
+
+    def __init__(self, pipeline: Pipeline, keep_segmentations: bool = False, **kwargs):
+        print(">>Performing voice activity detection using the diarization segmentation model...")
+        Vad.__init__(self, kwargs['vad_onset'])
+        self.vad_pipeline = pipeline
+        self.vad_fast = False
+        self.keep_segmentations = keep_segmentations
+        self._segmentations: Dict[str, SlidingWindowFeature] = {}
+
+    def __call__(self, audio: AudioFile, **kwargs) -> SlidingWindowFeature:
+        inference: Inference = self.vad_pipeline._segmentation
+        waveform = audio["waveform"]
+        sample_rate = audio["sample_rate"]
+
+        # (num_chunks, num_frames, num_speakers), what the diarization pipeline would compute
+        segmentations: SlidingWindowFeature = inference(audio)
+        if self.keep_segmentations:
+            self._segmentations[array_digest(waveform.numpy())] = segmentations
+
+        speech = SlidingWindowFeature(np.max(segmentations.data, axis=-1, keepdims=True),
+                                      segmentations.sliding_window)
+        scores = Inference.aggregate(speech,
+                                     model_frames(inference.model),
+                                     warm_up=inference.warm_up,
+                                     hamming=True,
+                                     missing=0.0)
+        num_samples = waveform.shape[1]
+        window_size = inference.model.audio.get_num_samples(inference.duration)
+        if chunk_starts(num_samples, window_size, round(inference.step * sample_rate))[-1] + window_size > num_samples:
+            # remove padding that was added to last chunk
+            scores.data = scores.crop(Segment(0.0, num_samples / sample_rate), mode="loose")
+        return scores
+
+    def pop_segmentations(self, audio: Union[np.ndarray, PCMAudio]) -> Optional[SlidingWindowFeature]:
+        """The segmentations of the audio this VAD scored, None if it did not, forgotten once returned."""
+        waveform = audio.to_float32() if isinstance(audio, PCMAudio) else np.asarray(audio, dtype=np.float32)
+        return self._segmentations.pop(array_digest(waveform.reshape(1, -1)), None)
@@ -0,0 +1,150 @@
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from whisperx.vads.stitch import stitch
+from whisperx.vads.vad import Vad
+
+# the VAD of a worker process, see `ShardedVad`
+_worker_vad: Optional[Vad] = None
+
+
+def _init_worker(vad_factory: Callable[[], Vad], threads: int):
+    global _worker_vad
+    # the workers share the cores, each model running on all of them would oversubscribe
+    torch.set_num_threads(threads)
+    _worker_vad = vad_factory()
+
+
+def _score_shard(waveform: np.ndarray, sample_rate: int) -> Any:
+    return _worker_vad({"waveform": _worker_vad.preprocess_audio(waveform), "sample_rate": sample_rate})
+
+
+def shard_bounds(num_samples: int, shard_samples: int, overlap_samples: int) -> List[Tuple[int, int, int, int]]:
+    """Split `num_samples` into consecutive cores of `shard_samples`, each extended by `overlap_samples`
+    on both sides.
+
+    Returns
+    -------
+    shards : List[Tuple[int, int, int, int]]
+        Start and end sample of each shard, then of its core.
+    """
+    shards = []
+    for core_start in range(0, num_samples, shard_samples):
+        core_end = min(core_start + shard_samples, num_samples)
+        shards.append((max(core_start - overlap_samples, 0), min(core_end + overlap_samples, num_samples),
+                       core_start, core_end))
+    return shards
+
+
+class ShardedVad(Vad):
+    """Runs a VAD model on overlapping shards of the audio in a pool of worker processes.
+
+    Each worker builds its own model with `vad_factory`, which must be picklable (e.g. a
+    `functools.partial` of the VAD class) as workers are spawned. The scores of each shard are only
+    kept for its core and stitched back onto the timeline of the whole audio (see `stitch`), so the
+    overlap gives every core the context it would have in a single pass: shards start at a multiple
+    of the VAD's `align_samples` and overlaps cover its `context`, and a windowed model like
+    `Pyannote` gives the same scores as on the whole audio. Silero carries minutes of history in
+    its LSTM state, its scores only approximately match a single pass. `EnergyVad` takes its noise
+    floor from a percentile of the whole input, each shard would get its own, so `load_model` does
+    not shard it. Audio shorter than one shard is scored by `vad` in this process.
+
+    Parameters
+    ----------
+    vad : Vad
+        The VAD of this process, for short audio and for `merge_chunks`.
+    vad_factory : Callable[[], Vad]
+        Builds the VAD of each worker, configured as `vad`.
+    num_workers : int
+        Number of worker processes.
+    shard_duration : float
+        Length of the core of each shard in seconds.
+    overlap : float
+        Minimum length added on both sides of each core in seconds, raised to the `context` of `vad`.
+    threads : int
+        Number of torch threads of each worker.
+    """
+
+    def __init__(self,
+                 vad: Vad,
+                 vad_factory: Callable[[], Vad],
+                 num_workers: int,
+                 shard_duration: float = 300.0,
+                 overlap: float = 60.0,
+                 threads: int = 1,
+                 sample_rate: int = 16000,
+                 **kwargs):
+        print(f">>Sharding voice activity detection over {num_workers} processes...")
+        super().__init__(kwargs['vad_onset'])
+        self.vad = vad
+        self.vad_factory = vad_factory
+        self.num_workers = num_workers
+        self.shard_duration = shard_duration
+        self.overlap = overlap
+        self.threads = threads
+        self.sample_rate = sample_rate
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._finalizer = None
+        if vad.cache_key is not None:
+            self.cache_key = f"sharded-{shard_duration}-{overlap}-{sample_rate}-{vad.cache_key}"
+
+    @property
+    def align_samples(self) -> int:
+        return self.vad.align_samples
+
+    @property
+    def context(self) -> float:
+        return self.vad.context
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # the workers load their model once and are kept for the next audio
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker,
+                                                 initargs=(self.vad_factory, self.threads))
+            self._finalizer = weakref.finalize(self, self._executor.shutdown)
+        return self._executor
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+            self._executor = self._finalizer = None
+
+    def __call__(self, audio, **kwargs) -> Optional[Any]:
+        if audio["sample_rate"] != self.sample_rate:
+            raise ValueError(f"Only {self.sample_rate}Hz sample rate is allowed")
+        waveform = np.asarray(audio["waveform"], dtype=np.float32).reshape(-1)
+
+        align = self.vad.align_samples
+        shard_samples = max(1, round(self.shard_duration * self.sample_rate / align)) * align
+        overlap_samples = -(-int(max(self.overlap, self.vad.context) * self.sample_rate) // align) * align
+        shards = shard_bounds(len(waveform), shard_samples, overlap_samples)
+        if len(shards) <= 1:
+            return self.vad({"waveform": self.vad.preprocess_audio(waveform), "sample_rate": self.sample_rate})
+
+        outputs = self._pool().map(_score_shard,
+                                   [waveform[start:end] for start, end, _, _ in shards],
+                                   [self.sample_rate] * len(shards))
+        pieces = [(start, output) for (start, _, _, _), output in zip(shards, outputs)]
+        cores = [(core_start, core_end) for _, _, core_start, core_end in shards]
+        return stitch(pieces, len(waveform), self.sample_rate, cores=cores)
+
+    @staticmethod
+    def preprocess_audio(audio):
+        return audio
+
+    # not static: the stitched output is binarized by the wrapped VAD
+    def merge_chunks(self,
+                     segments,
+                     chunk_size,
+                     onset: float = 0.5,
+                     offset: Optional[float] = None,
+                     strategy: str = "greedy",
+                     ):
+        return self.vad.merge_chunks(segments, chunk_size, onset=onset, offset=offset, strategy=strategy)
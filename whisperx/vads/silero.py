@@ -19,7 +19,7 @@ class Silero(Vad):
         super().__init__(kwargs['vad_onset'])
 
         self.vad_onset = kwargs['vad_onset']
-        self.chunk_size = kwargs['chunk_size']
+        self.chunk_size = kwargs.get('chunk_size', 30)
         self.vad_pipeline, vad_utils = torch.hub.load(repo_or_dir='snakers4/silero-vad',
                                                       model='silero_vad',
                                                       force_reload=False,
@@ -57,10 +57,11 @@ class Silero(Vad):
                      chunk_size,
                      onset: float = 0.5,
                      offset: Optional[float] = None,
+                     strategy: str = "greedy",
                      ):
         assert chunk_size > 0
         if len(segments_list) == 0:
             print("No active speech found in audio")
             return []
         assert segments_list, "segments_list is empty."
-        return Vad.merge_chunks(segments_list, chunk_size, onset, offset)
+        return Vad.merge_chunks(segments_list, chunk_size, onset, offset, strategy)
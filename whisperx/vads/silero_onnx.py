@@ -0,0 +1,252 @@
+import bisect
+import os
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+import onnxruntime
+from faster_whisper.utils import get_assets_path
+
+from whisperx.diarize import Segment as SegmentX
+from whisperx.vads.silero import AudioFile, Silero
+from whisperx.vads.vad import Vad
+
+SILERO_SAMPLE_RATE = 16000
+WINDOW_SIZE_SAMPLES = 512
+CONTEXT_SIZE_SAMPLES = 64
+
+
+def load_silero_onnx(
+        model_dir: Optional[str] = None, threads: int = 0
+) -> Tuple[onnxruntime.InferenceSession, onnxruntime.InferenceSession]:
+    """Silero VAD v5 split in two models: the encoder (STFT and convolutions) has no state,
+    so it runs on any number of windows at once, only the small LSTM decoder is sequential.
+    By default the models are those faster-whisper ships for its own VAD filter."""
+    if model_dir is None:
+        model_dir = get_assets_path()
+
+    opts = onnxruntime.SessionOptions()
+    opts.inter_op_num_threads = 1
+    opts.intra_op_num_threads = threads
+    sessions = []
+    for name in ("silero_encoder_v5.onnx", "silero_decoder_v5.onnx"):
+        model_fp = os.path.abspath(os.path.join(model_dir, name))
+        if not os.path.isfile(model_fp):
+            raise FileNotFoundError(f"Model file not found at {model_fp}")
+        sessions.append(onnxruntime.InferenceSession(model_fp, providers=["CPUExecutionProvider"], sess_options=opts))
+    return sessions[0], sessions[1]
+
+
+def speech_probs(
+        encoder: onnxruntime.InferenceSession,
+        decoder: onnxruntime.InferenceSession,
+        audio: np.ndarray,
+        encoder_batch_size: int = 10000,
+) -> np.ndarray:
+    """Speech probability of every 512-sample window of `audio`, as computed by the Silero model
+    window by window, but with the encoder batched over `encoder_batch_size` windows per call.
+
+    Parameters
+    ----------
+    encoder, decoder : onnxruntime.InferenceSession
+        The Silero VAD model, see `load_silero_onnx`.
+    audio : np.ndarray
+        (num_samples,) float32 waveform at 16kHz.
+    encoder_batch_size : int
+        Number of windows per encoder call.
+
+    Returns
+    -------
+    probs : np.ndarray
+        (ceil(num_samples / 512),) speech probabilities.
+    """
+    num_windows = -(-len(audio) // WINDOW_SIZE_SAMPLES)
+    # the last window is zero-padded
+    windows = np.zeros((num_windows, WINDOW_SIZE_SAMPLES), dtype=np.float32)
+    windows.reshape(-1)[:len(audio)] = audio
+    # each window is preceded by the last samples of the previous one, zeros for the first one
+    contexts = np.zeros((num_windows, CONTEXT_SIZE_SAMPLES), dtype=np.float32)
+    contexts[1:] = windows[:-1, -CONTEXT_SIZE_SAMPLES:]
+
+    features = np.zeros((num_windows, 128), dtype=np.float32)
+    for i in range(0, num_windows, encoder_batch_size):
+        inputs = np.concatenate([contexts[i:i + encoder_batch_size], windows[i:i + encoder_batch_size]], axis=1)
+        features[i:i + encoder_batch_size] = encoder.run(None, {"input": inputs})[0].reshape(-1, 128)
+
+    # The decoder is a single LSTM step, whose batch dimension is independent streams: every window
+    # needs the state left by the previous one, so the windows of one audio cannot share a call.
+    # Splitting the audio into independent streams changes the probabilities near each stream start,
+    # for hundreds of windows, while a call only takes tens of microseconds (under 0.5s per 10 minutes).
+    probs = np.zeros(num_windows, dtype=np.float32)
+    state = np.zeros((2, 1, 128), dtype=np.float32)
+    for i in range(num_windows):
+        out, state = decoder.run(None, {"input": features[i:i + 1], "state": state})
+        probs[i] = out[0, 0, 0]
+    return probs
+
+
+def speech_timestamps(
+        probs: np.ndarray,
+        num_samples: int,
+        threshold: float = 0.5,
+        min_speech_duration_ms: int = 250,
+        max_speech_duration_s: float = float("inf"),
+        min_silence_duration_ms: int = 100,
+        speech_pad_ms: int = 30,
+        neg_threshold: Optional[float] = None,
+        min_silence_at_max_speech: int = 98,
+) -> np.ndarray:
+    """Speech regions from window probabilities, the same as silero-vad's `get_speech_timestamps`
+    (with `use_max_poss_sil_at_max_speech`).
+
+    Outside of speech nothing happens until the next window above `threshold`,
+    those stretches are skipped with a binary search instead of visiting every window.
+
+    Returns
+    -------
+    speeches : np.ndarray
+        (num_speeches, 2) start and end sample of each speech region.
+    """
+    sampling_rate = SILERO_SAMPLE_RATE
+    min_speech_samples = sampling_rate * min_speech_duration_ms / 1000
+    speech_pad_samples = sampling_rate * speech_pad_ms / 1000
+    max_speech_samples = sampling_rate * max_speech_duration_s - WINDOW_SIZE_SAMPLES - 2 * speech_pad_samples
+    min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
+    min_silence_samples_at_max_speech = sampling_rate * min_silence_at_max_speech / 1000
+    if neg_threshold is None:
+        neg_threshold = max(threshold - 0.15, 0.01)
+
+    prob_list = probs.tolist()
+    speech_windows = np.flatnonzero(probs >= threshold).tolist()
+    num_windows = len(prob_list)
+
+    speeches = []
+    triggered = False
+    speech_start = None
+    temp_end = 0  # to save potential segment end (and tolerate some silence)
+    prev_end = next_start = 0  # to save potential segment limits in case of maximum segment size reached
+    possible_ends = []
+
+    i = 0
+    while i < num_windows:
+        if not triggered:
+            # nothing to do until speech starts
+            k = bisect.bisect_left(speech_windows, i)
+            if k == len(speech_windows):
+                break
+            i = speech_windows[k]
+        speech_prob = prob_list[i]
+        cur_sample = WINDOW_SIZE_SAMPLES * i
+        i += 1
+
+        # if speech returns after a temp_end, record candidate silence if long enough and clear temp_end
+        if speech_prob >= threshold and temp_end:
+            sil_dur = cur_sample - temp_end
+            if sil_dur > min_silence_samples_at_max_speech:
+                possible_ends.append((temp_end, sil_dur))
+            temp_end = 0
+            if next_start < prev_end:
+                next_start = cur_sample
+
+        # start of speech
+        if speech_prob >= threshold and not triggered:
+            triggered = True
+            speech_start = cur_sample
+            continue
+
+        # max speech length reached: cut at the longest silence so far, or right here
+        if triggered and cur_sample - speech_start > max_speech_samples:
+            if possible_ends:
+                prev_end, dur = max(possible_ends, key=lambda x: x[1])
+                speeches.append((speech_start, prev_end))
+                speech_start = None
+                next_start = prev_end + dur
+                if next_start < prev_end + cur_sample:
+                    speech_start = next_start
+                else:
+                    triggered = False
+                prev_end = next_start = temp_end = 0
+                possible_ends = []
+            else:
+                speeches.append((speech_start, cur_sample))
+                speech_start = None
+                prev_end = next_start = temp_end = 0
+                triggered = False
+                possible_ends = []
+                continue
+
+        # silence detection while in speech
+        if speech_prob < neg_threshold and triggered:
+            if not temp_end:
+                temp_end = cur_sample
+            if cur_sample - temp_end < min_silence_samples:
+                continue
+            if temp_end - speech_start > min_speech_samples:
+                speeches.append((speech_start, temp_end))
+            speech_start = None
+            prev_end = next_start = temp_end = 0
+            triggered = False
+            possible_ends = []
+
+    if speech_start is not None and num_samples - speech_start > min_speech_samples:
+        speeches.append((speech_start, num_samples))
+
+    speeches = np.array(speeches, dtype=np.int64).reshape(-1, 2)
+    if len(speeches) == 0:
+        return speeches
+
+    # pad each region, sharing the silence between neighbours closer than twice the padding
+    starts, ends = speeches[:, 0].copy(), speeches[:, 1].copy()
+    silences = starts[1:] - ends[:-1]
+    close = silences < 2 * speech_pad_samples
+    ends[:-1] = np.where(close, ends[:-1] + silences // 2, np.minimum(num_samples, ends[:-1] + speech_pad_samples))
+    starts[1:] = np.where(close, np.maximum(0, starts[1:] - silences // 2), np.maximum(0, starts[1:] - speech_pad_samples))
+    starts[0] = max(0, starts[0] - speech_pad_samples)
+    ends[-1] = min(num_samples, ends[-1] + speech_pad_samples)
+    return np.stack([starts, ends], axis=1)
+
+
+class SileroScores(NamedTuple):
+    """Speech probability of every 512-sample window of an audio, see `speech_probs`."""
+    probs: np.ndarray
+    num_samples: int
+
+
+class SileroOnnx(Silero):
+    """Silero VAD on onnxruntime, with the model shipped with faster-whisper: it never needs the network.
+    Like `Pyannote`, `__call__` returns the frame scores and `merge_chunks` thresholds them,
+    so the scores can be cached (see `VadScoreCache`)."""
+
+    cache_key = "silero-onnx-v5"
+    # the LSTM state carries minutes of history, so no context makes scores of pieces exact
+    align_samples = WINDOW_SIZE_SAMPLES
+
+    def __init__(self, model_dir: Optional[str] = None, threads: int = 0, **kwargs):
+        print(">>Performing voice activity detection using Silero (ONNX)...")
+        Vad.__init__(self, kwargs['vad_onset'])
+
+        self.vad_onset = kwargs['vad_onset']
+        self.encoder, self.decoder = load_silero_onnx(model_dir, threads=threads)
+
+    def __call__(self, audio: AudioFile, **kwargs) -> SileroScores:
+        """use silero to score every window of the audio"""
+        sample_rate = audio["sample_rate"]
+        if sample_rate != SILERO_SAMPLE_RATE:
+            raise ValueError("Only 16000Hz sample rate is allowed")
+
+        waveform = np.asarray(audio["waveform"], dtype=np.float32).reshape(-1)
+        return SileroScores(speech_probs(self.encoder, self.decoder, waveform), len(waveform))
+
+    @staticmethod
+    def merge_chunks(scores: SileroScores,
+                     chunk_size,
+                     onset: float = 0.5,
+                     offset: Optional[float] = None,
+                     strategy: str = "greedy",
+                     ):
+        timestamps = speech_timestamps(scores.probs,
+                                       scores.num_samples,
+                                       threshold=onset,
+                                       max_speech_duration_s=chunk_size)
+        segments_list = [SegmentX(start / SILERO_SAMPLE_RATE, end / SILERO_SAMPLE_RATE, "UNKNOWN")
+                         for start, end in timestamps.tolist()]
+        return Silero.merge_chunks(segments_list, chunk_size, onset, offset, strategy)
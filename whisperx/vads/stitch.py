@@ -0,0 +1,105 @@
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from pyannote.core import SlidingWindow, SlidingWindowFeature
+
+from whisperx.diarize import Segment as SegmentX
+from whisperx.vads.energy import EnergyScores
+from whisperx.vads.silero_onnx import SileroScores, WINDOW_SIZE_SAMPLES
+
+
+def _place(pieces: List[Tuple[int, np.ndarray, int, int]], num_frames: int) -> np.ndarray:
+    # frame scores of each piece copied at its first global frame, between global frames lo and hi,
+    # zeros (silence) elsewhere
+    first = pieces[0][1]
+    num_frames = max([num_frames] + [k + len(scores) for k, scores, _, _ in pieces])
+    stitched = np.zeros((num_frames,) + first.shape[1:], dtype=first.dtype)
+    for k, scores, lo, hi in pieces:
+        lo, hi = max(k, lo), min(k + len(scores), hi)
+        if hi > lo:
+            stitched[lo:hi] = scores[lo - k:hi - k]
+    return stitched
+
+
+def _frame_pieces(pieces, cores, step):
+    # global first frame of each piece, with the frames of its core
+    return [(round(offset / step), scores, round(core[0] / step), round(core[1] / step))
+            for (offset, scores), core in zip(pieces, cores)]
+
+
+def _clip_segments(pieces, cores, sample_rate):
+    # segments shifted to the whole audio and cut to their core, those cut at a shared core
+    # boundary are joined again
+    segments = []
+    for (offset, output), (lo, hi) in zip(pieces, cores):
+        shift, lo, hi = offset / sample_rate, lo / sample_rate, hi / sample_rate
+        for seg in output:
+            start, end = max(seg.start + shift, lo), min(seg.end + shift, hi)
+            if end <= start:
+                continue
+            if segments and start == lo and segments[-1].end == lo:
+                segments[-1] = SegmentX(segments[-1].start, end, segments[-1].speaker)
+            else:
+                segments.append(SegmentX(start, end, seg.speaker))
+    return segments
+
+
+def stitch(pieces: List[Tuple[int, Any]],
+           num_samples: int,
+           sample_rate: int = 16000,
+           cores: Optional[List[Tuple[int, int]]] = None,
+           ) -> Optional[Any]:
+    """Combine the outputs of a VAD run separately on pieces of an audio into the output for the whole audio.
+
+    Frame scores are copied onto the closest frames of the whole audio, exactly when each piece starts
+    on a frame of the whole audio (see `Vad.align_samples`); frames outside of every piece score 0.
+    Segments are shifted by the offset of their piece. Pieces are expected in timeline order, a later
+    piece overwrites the frames it shares with an earlier one, unless `cores` are given.
+
+    Parameters
+    ----------
+    pieces : List[Tuple[int, Any]]
+        Offset of each piece in samples, with the VAD output for it.
+    num_samples : int
+        Length of the whole audio.
+    sample_rate : int
+        Sample rate of the audio.
+    cores : List[Tuple[int, int]], optional
+        Start and end sample of the part of the audio each piece is kept for, e.g. without the
+        margins overlapping its neighbours. Defaults to the whole piece.
+
+    Returns
+    -------
+    output : Any
+        Same type as the outputs of the pieces, None if there is no piece.
+    """
+    if len(pieces) == 0:
+        return None
+    first = pieces[0][1]
+    if cores is None:
+        cores = [(offset, num_samples) for offset, _ in pieces]
+
+    if isinstance(first, SlidingWindowFeature):
+        frames = first.sliding_window
+        step = frames.step * sample_rate
+        data = _place(_frame_pieces([(offset, output.data) for offset, output in pieces], cores, step),
+                      int(np.ceil(num_samples / step)))
+        return SlidingWindowFeature(
+            data, SlidingWindow(start=frames.start, duration=frames.duration, step=frames.step), labels=first.labels
+        )
+
+    if isinstance(first, SileroScores):
+        probs = _place(_frame_pieces([(offset, output.probs) for offset, output in pieces], cores, WINDOW_SIZE_SAMPLES),
+                       -(-num_samples // WINDOW_SIZE_SAMPLES))
+        return SileroScores(probs, num_samples)
+
+    if isinstance(first, EnergyScores):
+        step = first.step * sample_rate
+        scores = _place(_frame_pieces([(offset, output.scores) for offset, output in pieces], cores, step),
+                        int(np.ceil(num_samples / step)))
+        return EnergyScores(scores, first.start, first.step)
+
+    if isinstance(first, list):
+        return _clip_segments(pieces, cores, sample_rate)
+
+    raise TypeError(f"Cannot stitch VAD outputs of type {type(first).__name__}")
@@ -1,10 +1,184 @@
-from typing import Optional
+import bisect
+from typing import List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 from pyannote.core import Annotation, Segment
 
 
+def binarize_hysteresis(
+        scores: np.ndarray,
+        timestamps: np.ndarray,
+        onset: float,
+        offset: float,
+        max_duration: float = float('inf'),
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Hysteresis thresholding of one track of detection scores, with the min-cut operation of
+    `whisperx.vads.pyannote.Binarize`.
+
+    Identical to the frame by frame loop `Binarize` originally used, but it only iterates over
+    state changes (onsets, offsets and max-duration cuts): the frames in between are skipped with
+    a binary search over the precomputed onset and offset frames, and each cut is a single `np.argmin`.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        (num_frames,) detection scores.
+    timestamps : np.ndarray
+        (num_frames,) increasing time of each frame.
+    onset, offset, max_duration : float
+        See `Binarize`.
+
+    Returns
+    -------
+    starts, ends : np.ndarray
+        Start and end times of the active regions, in the order they were found, unpadded.
+    """
+    num_frames = len(scores)
+    starts, ends = [], []
+    if num_frames == 0:
+        return np.array(starts), np.array(ends)
+
+    # scalar lookups are cheaper with bisect on lists than with numpy calls
+    on_frames = np.flatnonzero(scores > onset).tolist()
+    off_frames = np.flatnonzero(scores < offset).tolist()
+    times = timestamps.tolist()
+
+    def next_frame(frames, i):
+        k = bisect.bisect_left(frames, i)
+        return frames[k] if k < len(frames) else num_frames
+
+    # The candidates of a cut are the frames buffered since the last state change: the frame of the
+    # last offset (`stale`, still buffered when the region became active again) followed by frames
+    # `lo` to i - 1. A cut at frame i skips its offset test, and frame i is buffered in any case.
+    start = 0
+    stale, lo = 0, 1
+    is_active = scores[0] > onset
+    i = 1
+    while i < num_frames:
+        if not is_active:
+            i = next_frame(on_frames, i)
+            if i == num_frames:
+                break
+            start, lo, is_active = i, i + 1, True
+            i += 1
+            continue
+
+        # first frame further than max_duration from the region start
+        t_start = times[start]
+        cut = num_frames
+        if max_duration < float('inf'):
+            cut = max(bisect.bisect_right(times, t_start + max_duration), i)
+            while cut > i and times[cut - 1] - t_start > max_duration:
+                cut -= 1
+            while cut < num_frames and not times[cut] - t_start > max_duration:
+                cut += 1
+
+        off = next_frame(off_frames, i)
+        if off < cut:
+            # switching from active to inactive
+            starts.append(times[start])
+            ends.append(times[off])
+            start, stale, lo, is_active = off, off, off + 1, False
+            i = off + 1
+        elif cut < num_frames:
+            # divide segment at the lowest score of the second half of the buffered frames
+            num_buffered = (stale is not None) + cut - lo
+            search_after = num_buffered // 2
+            if stale is not None and search_after == 0:
+                candidates = np.concatenate(([scores[stale]], scores[lo:cut]))
+                idx = int(np.argmin(candidates))
+                split = stale if idx == 0 else lo + idx - 1
+            else:
+                first = lo + search_after - (stale is not None)
+                idx = int(np.argmin(scores[first:cut]))
+                split = first + idx
+            starts.append(times[start])
+            ends.append(times[split])
+            if split == stale:
+                stale = None
+            else:
+                stale, lo = None, split + 1
+            start = split
+            i = cut + 1
+        else:
+            break
+
+    # if active at the end, add final region
+    if is_active:
+        starts.append(times[start])
+        ends.append(times[-1])
+    return np.array(starts), np.array(ends)
+
+
+def balanced_split_points(starts: np.ndarray, ends: np.ndarray, chunk_size: float) -> List[int]:
+    """Pack consecutive segments into as few chunks as the greedy merge, with lengths as close to
+    `chunk_size` as possible.
+
+    Among the packings with the fewest chunks no longer than `chunk_size` (a segment longer than
+    that is a chunk of its own), dynamic programming picks the one minimizing the sum of the
+    squared shortfalls to `chunk_size`: splits move to the silences that let every chunk be long,
+    instead of leaving a short last chunk after each run of full ones.
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        (num_segments,) sorted segment times.
+    chunk_size : float
+        Maximum length of a chunk, from the start of its first segment to the end of its last one.
+
+    Returns
+    -------
+    splits : List[int]
+        Index of the first segment of every chunk but the first one.
+    """
+    num_segments = len(starts)
+    if num_segments == 0:
+        return []
+    # counts[j], costs[j]: best packing of the first j segments, first[j]: start of its last chunk
+    counts = np.zeros(num_segments + 1, dtype=np.int64)
+    costs = np.zeros(num_segments + 1, dtype=np.float64)
+    first = np.zeros(num_segments + 1, dtype=np.int64)
+    lo = 0
+    for j in range(1, num_segments + 1):
+        # chunks ending with segment j - 1 can start at any segment from lo on
+        while lo < j - 1 and ends[j - 1] - starts[lo] > chunk_size:
+            lo += 1
+        candidates = np.arange(lo, j)
+        shortfall = np.maximum(chunk_size - (ends[j - 1] - starts[candidates]), 0)
+        candidate_counts = counts[candidates]
+        candidate_costs = np.where(candidate_counts == candidate_counts.min(), costs[candidates] + shortfall ** 2, np.inf)
+        best = int(np.argmin(candidate_costs))
+        counts[j] = candidate_counts[best] + 1
+        costs[j] = candidate_costs[best]
+        first[j] = candidates[best]
+
+    splits = []
+    j = first[num_segments]
+    while j > 0:
+        splits.append(int(j))
+        j = first[j]
+    return splits[::-1]
+
+
+def padding_waste(chunks: List[dict], window: float = 30.0) -> float:
+    """Fraction of the encoder input spent on padding when every chunk is padded to `window` seconds."""
+    if len(chunks) == 0:
+        return 0.0
+    audio = sum(min(chunk["end"] - chunk["start"], window) for chunk in chunks)
+    return 1 - audio / (len(chunks) * window)
+
+
 class Vad:
+    # Identifies the model and the parameters the output of `__call__` depends on, see `VadScoreCache`.
+    # None if the output should not be cached, e.g. when it is already thresholded.
+    cache_key: Optional[str] = None
+    # Pieces of an audio scored separately by `__call__` line up with the whole audio when they start
+    # at a multiple of `align_samples`, and their scores are the same farther than `context` seconds
+    # from their edges, see `CascadeVad`.
+    align_samples: int = 1
+    context: float = 0.0
+
     def __init__(self, vad_onset):
         if not (0 < vad_onset < 1):
             raise ValueError(
@@ -20,10 +194,28 @@ class Vad:
     def merge_chunks(segments,
                      chunk_size,
                      onset: float,
-                     offset: Optional[float]):
+                     offset: Optional[float],
+                     strategy: str = "greedy"):
         """
          Merge operation described in paper
+
+         With strategy="balanced", see `balanced_split_points`.
          """
+        if strategy == "balanced":
+            starts = np.array([seg.start for seg in segments], dtype=np.float64)
+            ends = np.array([seg.end for seg in segments], dtype=np.float64)
+            bounds = [0] + balanced_split_points(starts, ends, chunk_size) + [len(segments)]
+            return [
+                {
+                    "start": segments[i].start,
+                    "end": segments[j - 1].end,
+                    "segments": [(seg.start, seg.end) for seg in segments[i:j]],
+                }
+                for i, j in zip(bounds[:-1], bounds[1:])
+            ]
+        if strategy != "greedy":
+            raise ValueError(f"Invalid chunk strategy: {strategy}")
+
         curr_end = 0
         merged_segments = []
         seg_idxs: list[tuple]= []